@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Evaluate all the segmentation results of submissions, stored in directories
+or directly in tar / zip archives (no extraction needed).
+
+Results are expected at "[PREFIX/]METHOD/BACKGROUND/DOCUMENT.segresult.xml"
+in each submission, and their ground truth at
+"GT_ROOT/BACKGROUND/DOCUMENT.gt.xml" (or a compressed version of it), or in
+the ground truth index GT_ROOT (see build_gtindex.py).
+Evaluation results are written to
+"EVAL_DIR/METHOD/BACKGROUND/DOCUMENT.segeval.xml", like `run_eval.sh` does.
+
+Archive members are read sequentially by the main process, and parsed and
+evaluated in memory by worker processes (each one keeping its own cache of
+ground truth data).
+
+With "--shard I/N", only the tasks of shard I (out of N, see utils/shard.py)
+are evaluated, and a partial-state file "EVAL_DIR/shard-I-of-N.partial.json"
+is written; `combine_shards.py` merges the partial states of all the shards.
+
+With "--watch", submission directories are then watched: new or modified
+segmentation results are evaluated as soon as they are completely written
+(see utils/watch.py), and the summaries of the affected methods (and their
+CSV tables, with "-a") are refreshed, until the program is interrupted.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import time
+import multiprocessing
+from collections import OrderedDict
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from models.models import *
+from utils.archive import mapSegResults, isArchive, readSegResult, WorkerPool, SEGRESULT_EXT
+from utils.compact import exportCompact
+from utils.shard import partialStatePath, writePartialState
+from utils.watch import SegResultWatcher
+from utils.evaltree import EVAL_EXT
+from utils.profiling import createProfiler
+from eval_seg import evaluate, QuadPairMemo, MEMO_SIZE
+from eval_server import GroundTruthCache
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Batch Segmentation Evaluation"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+ERRCODE_EVALFAILED = 11
+
+
+# ==============================================================================
+class SubmissionEvaluator(object):
+    """Evaluation of submission items, in a worker process (see `mapSegResults`)."""
+    def __init__(self, gt_root, out_dir, cache_size, compact, pretty_print, memo_size):
+        self.cache = GroundTruthCache(gt_root, cache_size)
+        # shared by all the samples of the worker
+        self.memo = QuadPairMemo(memo_size) if memo_size > 0 else None
+        self.out_dir = out_dir
+        self.compact = compact
+        self.pretty_print = pretty_print
+
+    @staticmethod
+    def newSample(submission, item):
+        """
+        Sample description of the partial state (see utils/shard.py): method,
+        background, document, submission, member, eval_file (relative to the
+        output directory), status ("ok" or "failed"), error and global_results
+        (as written to the file).
+        """
+        return OrderedDict([
+            ("method", item.method),
+            ("background", item.background),
+            ("document", item.document),
+            ("submission", os.path.abspath(submission)),
+            ("member", item.name),
+            ("eval_file", "/".join([item.method, item.background, item.document + EVAL_EXT])),
+            ("status", "ok"),
+            ("error", None),
+            ("global_results", None)])
+
+    @staticmethod
+    def failed(submission, item, error):
+        """Sample description of a failed evaluation (see `mapSegResults`)."""
+        sample = SubmissionEvaluator.newSample(submission, item)
+        sample["status"] = "failed"
+        sample["error"] = error
+        return sample
+
+    def __call__(self, submission, item):
+        """Evaluate `item` and write its results. Returns its sample description (see `newSample`)."""
+        sample = self.newSample(submission, item)
+        label = "%s:%s" % (submission, item.name)
+        gt_id = "%s/%s" % (item.background, item.document)
+        try:
+            prepared, _hit = self.cache.get(gt_id)
+            test_mdl = SegResult.loadFromString(item.data)
+            evalRes_mdl, _selfint_count = evaluate(prepared.mdl, test_mdl, self.cache.path(gt_id), label,
+                                                   prepared=prepared, memo=self.memo)
+            out_dir = os.path.join(self.out_dir, item.method, item.background)
+            if not os.path.isdir(out_dir):
+                try:
+                    os.makedirs(out_dir)
+                except OSError: # created by another worker
+                    pass
+            eval_file = os.path.join(self.out_dir, sample["eval_file"])
+            if self.compact:
+                exportCompact(evalRes_mdl, eval_file, pretty_print=self.pretty_print)
+            else:
+                evalRes_mdl.exportToFile(eval_file, pretty_print=self.pretty_print)
+            # global results as read back from the file (rendering rounds floats)
+            global_results = GlobalEvalResults.parse(evalRes_mdl.global_results.render(fragment=True))
+        except Exception, e:
+            logger.debug("Evaluation of '%s' failed.", label, exc_info=True)
+            return self.failed(submission, item, str(e))
+        sample["global_results"] = OrderedDict((field.field_name, getattr(global_results, field.field_name))
+                                               for field in GlobalEvalResults._fields)
+        return sample
+
+
+def watchSubmissions(watcher, submissions, worker_args, jobs, analysis_dir, profiler):
+    """Evaluate new or modified segmentation results and refresh summaries, until interrupted."""
+    from rollup import refreshSummaries # (imports pandas)
+    (out_dir, pretty_print) = (worker_args[1], worker_args[4])
+    pool = WorkerPool(SubmissionEvaluator, worker_args, jobs)
+    logger.info("Watching %s for new segmentation results (%s). Press Ctrl-C to stop.",
+                ", ".join(submissions), watcher.backend)
+    try:
+        while True:
+            paths = watcher.poll()
+            if not paths:
+                continue
+            start = time.time()
+            tasks = []
+            for path in paths:
+                submission = [s for s in submissions
+                              if os.path.abspath(path).startswith(os.path.join(os.path.abspath(s), ""))][0]
+                item = readSegResult(submission, path)
+                if item is None:
+                    logger.warning("Ignoring '%s': not at METHOD/BACKGROUND/DOCUMENT%s.", path, SEGRESULT_EXT)
+                    continue
+                tasks.append((submission, item))
+            if not tasks:
+                continue
+            with profiler.stage("processing"):
+                samples = pool.map(tasks)
+            for sample in samples:
+                if sample["status"] != "ok":
+                    logger.error("%s:%s: %s", sample["submission"], sample["member"], sample["error"])
+                profiler.count("evaluated" if sample["status"] == "ok" else "failed")
+            methods = sorted(set(sample["method"] for sample in samples if sample["status"] == "ok"))
+            with profiler.stage("summaries"):
+                refreshSummaries(out_dir, methods, analysis_dir, pretty_print)
+            logger.info("%d segmentation results evaluated, summaries of %s refreshed (%.1fs).",
+                        len(samples), ", ".join(methods) or "no method", time.time() - start)
+    except KeyboardInterrupt:
+        logger.info("Watch stopped.")
+    finally:
+        pool.close()
+        watcher.close()
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Evaluate all the segmentation results of submissions (directories or tar/zip archives).',
+        version=PROG_VERSION)
+
+    parser.add_argument('gt_root',
+        action=StoreValidGroundTruthRoot,
+        help="Directory containing ground truth files (BACKGROUND/DOCUMENT.gt.xml), \
+              or ground truth index built by build_gtindex.py.")
+    parser.add_argument('submissions',
+        nargs='+', metavar='submission',
+        help="Directories or archives (.tar, .tar.gz, .tar.bz2, .zip) containing \
+              METHOD/BACKGROUND/DOCUMENT.segresult.xml files.")
+    addLoggingArguments(parser)
+    addPrettyPrintArgument(parser)
+    parser.add_argument('-o', '--output-dir',
+        action=StoreExistingOrCreatableDir, required=True,
+        help="Directory where evaluation results are written (METHOD/BACKGROUND/DOCUMENT.segeval.xml).")
+    parser.add_argument('-c', '--compact',
+        action='store_true',
+        help="Write compact evaluation results (frame results in binary sidecar files).")
+    parser.add_argument('-j', '--jobs',
+        action=StoreIntZeroPositive, default=multiprocessing.cpu_count(),
+        help="Number of worker processes (>= 1; 1: evaluate in the main process).")
+    parser.add_argument('--cache-size',
+        action=StoreIntZeroPositive, default=256,
+        help="Maximum number of ground truth files (>= 1) kept in memory by each worker.")
+    parser.add_argument('--memo-size', metavar="ENTRIES",
+        action=StoreIntZeroPositive, default=MEMO_SIZE,
+        help="Number of frame comparisons memoized by each worker for repeated quads, \
+              within and across samples (0 to disable).")
+    parser.add_argument('--shard', metavar="I/N",
+        action=StoreShard,
+        help="Only evaluate shard I out of N (1 <= I <= N) and write its partial-state file \
+              in the output directory (see combine_shards.py).")
+    parser.add_argument('-w', '--watch',
+        action='store_true',
+        help="After evaluating submission directories, watch them and evaluate new or \
+              modified segmentation results, refreshing summaries (until interrupted).")
+    parser.add_argument('-a', '--analysis-dir',
+        action=StoreExistingOrCreatableDir,
+        help="With --watch: directory where CSV summaries (METHOD.summary.csv) are refreshed.")
+    parser.add_argument('--settle',
+        type=float, default=2.0, metavar="SECONDS",
+        help="With --watch: time during which a file must not change before being evaluated.")
+    parser.add_argument('--poll-interval',
+        type=float, default=1.0, metavar="SECONDS",
+        help="With --watch: interval between checks for changes.")
+    parser.add_argument('--poll',
+        action='store_true',
+        help="With --watch: detect changes by polling modification times even if inotify is available.")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    if args.jobs < 1:
+        parser.error("--jobs must be >= 1.")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be >= 1.")
+    for submission in args.submissions:
+        if not os.path.isdir(submission) and not isArchive(submission):
+            parser.error("'%s' is neither a directory nor a tar or zip archive." % submission)
+        if args.watch and not os.path.isdir(submission):
+            parser.error("--watch only supports submission directories ('%s' is an archive)." % submission)
+    if args.watch and args.shard is not None:
+        parser.error("--watch cannot be used with --shard.")
+    if args.analysis_dir is not None and not args.watch:
+        parser.error("-a/--analysis-dir is only used with --watch.")
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "batch_eval", PROG_VERSION, args.memprofile)
+    profiler.info("submissions", len(args.submissions))
+
+    worker_args = (args.gt_root, args.output_dir, args.cache_size, args.compact, args.pretty_print,
+                   args.memo_size)
+    if args.watch: # before the first evaluation, to detect changes made during it
+        watcher = SegResultWatcher(args.submissions, args.settle, args.poll_interval, not args.poll)
+    results = mapSegResults(args.submissions, SubmissionEvaluator, worker_args, args.jobs, profiler, args.shard)
+    logger.debug("--- Process complete. ---")
+
+    if args.shard is not None:
+        writePartialState(partialStatePath(args.output_dir, args.shard), args.shard, (PROG_NAME, PROG_VERSION),
+                          args.gt_root, args.submissions, [sample for (_submission, sample) in results])
+
+    failures = [(submission, sample["member"], sample["error"])
+                for (submission, sample) in results if sample["status"] != "ok"]
+    for (submission, name, err) in sorted(failures):
+        logger.error("%s:%s: %s", submission, name, err)
+    profiler.count("evaluated", len(results) - len(failures))
+    profiler.count("failed", len(failures))
+    logger.info("%d segmentation results evaluated, %d failed.", len(results) - len(failures), len(failures))
+    if not results:
+        logger.error("No segmentation result found in submissions.")
+
+    if args.watch:
+        from rollup import refreshSummaries # (imports pandas)
+        with profiler.stage("summaries"):
+            refreshSummaries(args.output_dir, None, args.analysis_dir, args.pretty_print)
+        watchSubmissions(watcher, args.submissions, worker_args, args.jobs, args.analysis_dir, profiler)
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    if not results:
+        return ERRCODE_NOFILE
+    return ERRCODE_EVALFAILED if failures else ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
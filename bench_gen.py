@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Synthetic data generator for benchmarks.
+
+Generates pairs of ground truth ('.gt.xml') and segmentation result
+('.segresult.xml') files at arbitrary scale, with the same file hierarchy as
+the real dataset:
+    OUTPUT_DIR/ground_truth/backgroundXX/synthNNNNNN.gt.xml
+    OUTPUT_DIR/outputs/METHOD/backgroundXX/synthNNNNNN.segresult.xml
+
+Files are written as a stream (no model in memory), so that 10^7 frames and
+more can be generated.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import datetime
+
+import numpy as np
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Synthetic GT and segmentation results generator"
+PROG_NAME_SHORT = "SynthGen"
+
+ERRCODE_OK = 0
+
+FRAME_SIZE = (1920, 1080)
+OBJECT_SHAPE = (2100, 2970) # A4 page, in 1/10 mm
+CORNER_NAMES = ["tl", "bl", "br", "tr"]
+
+
+# ==============================================================================
+class StoreFrameCount(argparse.Action):
+    """Accepts integers written as '1000', '1e6', '10**7' or '10^7'."""
+    def __call__(self, parser, namespace, values, option_string=None):
+        intval = None
+        try:
+            if "**" in values or "^" in values:
+                base, exp = values.replace("**", "^").split("^")
+                intval = int(base) ** int(exp)
+            else:
+                intval = int(float(values))
+        except:
+            parser.error("'%s' cannot be coerced to a frame count." % values)
+        if intval <= 0:
+            parser.error("'%s' does not represent a frame count > 0." % values)
+        setattr(namespace, self.dest, intval)
+
+
+# ==============================================================================
+def gt_trajectory(rng, frame_count, static_rate):
+    """
+    Generate a plausible sequence of document corners (frame_count x 4 x 2),
+    in TL, BL, BR, TR order: a quadrilateral moving smoothly, with some
+    static segments (same corners as previous frame) to mimic still cameras.
+    """
+    (fw, fh) = FRAME_SIZE
+    # document seen in landscape orientation, like in the real dataset
+    half_w = rng.uniform(0.25, 0.35) * fw
+    half_h = half_w * float(OBJECT_SHAPE[0]) / OBJECT_SHAPE[1]
+    base = np.array([[-half_w, -half_h], [-half_w, half_h], [half_w, half_h], [half_w, -half_h]])
+    center = np.array([fw / 2.0, fh / 2.0])
+    angle = rng.uniform(-0.3, 0.3)
+    persp = rng.normal(0.0, 0.03 * half_w, size=(4, 2))
+
+    corners = np.empty((frame_count, 4, 2))
+    for f in range(frame_count):
+        if f > 0 and rng.random_sample() < static_rate:
+            corners[f] = corners[f-1]
+            continue
+        center += rng.normal(0.0, 4.0, size=2)
+        center = np.clip(center, [0.3 * fw, 0.3 * fh], [0.7 * fw, 0.7 * fh])
+        angle += rng.normal(0.0, 0.005)
+        persp += rng.normal(0.0, 0.5, size=(4, 2))
+        rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        corners[f] = center + (base + persp).dot(rot.T)
+    return corners
+
+
+def test_outputs(rng, gt_corners, gt_rejected, args):
+    """
+    Derive method outputs from ground truth: jittered corners, rejected
+    frames, degenerate and self-intersecting quadrilaterals.
+    Returns (corners, rejected, count_degenerate, count_selfintersecting).
+    """
+    frame_count = gt_corners.shape[0]
+    corners = gt_corners + rng.normal(0.0, args.jitter, size=gt_corners.shape)
+    rejected = rng.random_sample(frame_count) < args.reject_rate
+    # false accepts are possible too: keep some frames rejected in GT
+    rejected |= gt_rejected & (rng.random_sample(frame_count) >= args.reject_rate)
+
+    # trackers tend to output the same corners while the camera is still
+    for f in range(1, frame_count):
+        if (gt_corners[f] == gt_corners[f-1]).all() and not rejected[f] and not rejected[f-1]:
+            corners[f] = corners[f-1]
+
+    degenerate = (rng.random_sample(frame_count) < args.degenerate_rate) & ~rejected
+    # all corners on a single horizontal line (null area)
+    collapsed = corners[degenerate]
+    collapsed[:, :, 1] = collapsed[:, :1, 1]
+    corners[degenerate] = collapsed
+
+    selfinter = (rng.random_sample(frame_count) < args.self_intersecting_rate) & ~rejected & ~degenerate
+    # swapping two consecutive corners produces a "bow tie"
+    corners[selfinter] = corners[selfinter][:, [1, 0, 2, 3]]
+    return corners, rejected, int(degenerate.sum()), int(selfinter.sum())
+
+
+def write_segmentation_file(path, tagname, source_sample_file, corners, rejected, object_shape=None):
+    """Stream a segmentation file (ground truth or result) to `path`."""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, "wb") as out_f:
+        out_f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        out_f.write('<%s version="0.2" generated="%s">\n' % (tagname, datetime.datetime.now().isoformat()))
+        out_f.write('  <software_used name="%s" version="%s"/>\n' % (PROG_NAME_SHORT, PROG_VERSION))
+        out_f.write('  <source_sample_file>%s</source_sample_file>\n' % source_sample_file)
+        out_f.write('  <segmentation_results>\n')
+        chunk = []
+        for f in range(corners.shape[0]):
+            if rejected[f]:
+                chunk.append('    <frame index="%d" rejected="true"/>\n' % (f + 1))
+            else:
+                chunk.append('    <frame index="%d" rejected="false">\n' % (f + 1))
+                for (name, (x, y)) in zip(CORNER_NAMES, corners[f]):
+                    chunk.append('      <point name="%s" x="%.3f" y="%.3f"/>\n' % (name, x, y))
+                chunk.append('    </frame>\n')
+            if len(chunk) > 4096:
+                out_f.write("".join(chunk))
+                chunk = []
+        out_f.write("".join(chunk))
+        out_f.write('  </segmentation_results>\n')
+        if object_shape is not None:
+            out_f.write('  <object_shape width="%d" height="%d"/>\n' % object_shape)
+        out_f.write('</%s>\n' % tagname)
+
+
+# ==============================================================================
+def main(argv=None):
+    # Option parsing
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Generate synthetic ground truth and segmentation results for benchmarks.',
+        version=PROG_VERSION)
+
+    addLoggingArguments(parser)
+    parser.add_argument('output_dir',
+        action=StoreExistingOrCreatableDir,
+        help='Place where generated files should be stored.')
+    parser.add_argument('-n', '--frames',
+        action=StoreFrameCount, default=1000,
+        help="Total number of frames to generate (ex: 1000, 1e6, 10^7).")
+    parser.add_argument('--frames-per-sample',
+        action=StoreIntZeroPositive, default=200,
+        help="Number of frames of each sample (video).")
+    parser.add_argument('--backgrounds',
+        action=StoreIntZeroPositive, default=5,
+        help="Number of background directories samples are spread over.")
+    parser.add_argument('--methods',
+        action=StoreIntZeroPositive, default=1,
+        help="Number of methods (result variants) generated for each sample.")
+    parser.add_argument('--gt-reject-rate',
+        action=Store0to1float, default=0.02,
+        help="Probability of a frame to be rejected in the ground truth.")
+    parser.add_argument('--reject-rate',
+        action=Store0to1float, default=0.05,
+        help="Probability of a frame to be rejected by a method.")
+    parser.add_argument('--degenerate-rate',
+        action=Store0to1float, default=0.01,
+        help="Probability of an accepted frame to contain a degenerate (null area) quadrilateral.")
+    parser.add_argument('--self-intersecting-rate',
+        action=Store0to1float, default=0.01,
+        help="Probability of an accepted frame to contain a self-intersecting quadrilateral.")
+    parser.add_argument('--static-rate',
+        action=Store0to1float, default=0.3,
+        help="Probability of a frame to repeat the ground truth of the previous frame (still camera).")
+    parser.add_argument('--jitter',
+        type=float, default=10.0,
+        help="Standard deviation, in pixels, of the noise added to ground truth corners in results.")
+    parser.add_argument('--seed',
+        type=int, default=42,
+        help="Seed of the random generator (same seed => same files).")
+
+    args = parser.parse_args(argv)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    rng = np.random.RandomState(args.seed)
+    frames_per_sample = max(1, args.frames_per_sample)
+    sample_count = (args.frames + frames_per_sample - 1) / frames_per_sample
+    backgrounds = max(1, args.backgrounds)
+    methods = max(1, args.methods)
+
+    frames_left = args.frames
+    count_degenerate = count_selfinter = 0
+    for s in range(sample_count):
+        frame_count = min(frames_per_sample, frames_left)
+        frames_left -= frame_count
+        background = "background%02d" % (s % backgrounds + 1)
+        document = "synth%06d" % (s + 1)
+        source_sample_file = "%s/%s.mp4" % (background, document)
+
+        gt_corners = gt_trajectory(rng, frame_count, args.static_rate)
+        gt_rejected = rng.random_sample(frame_count) < args.gt_reject_rate
+        write_segmentation_file(
+            os.path.join(args.output_dir, "ground_truth", background, document + ".gt.xml"),
+            "ground_truth", source_sample_file, gt_corners, gt_rejected, OBJECT_SHAPE)
+
+        for m in range(methods):
+            corners, rejected, n_deg, n_si = test_outputs(rng, gt_corners, gt_rejected, args)
+            count_degenerate += n_deg
+            count_selfinter += n_si
+            write_segmentation_file(
+                os.path.join(args.output_dir, "outputs", "method%02d" % (m + 1), background, document + ".segresult.xml"),
+                "seg_result", source_sample_file, corners, rejected)
+
+        if (s + 1) % 100 == 0:
+            logger.info("%d/%d samples generated.", s + 1, sample_count)
+
+    logger.debug("--- Process complete. ---")
+    logger.info("Generated %d samples (%d frames) for %d method(s).", sample_count, args.frames, methods)
+    logger.info("\tdegenerate quadrilaterals        = %d", count_degenerate)
+    logger.info("\tself-intersecting quadrilaterals = %d", count_selfinter)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
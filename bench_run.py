@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+End-to-end benchmark runner.
+
+Evaluates a data set produced by `bench_gen.py` (or any directory with the
+same layout) with `eval_seg.evaluate()`, as `batch_eval.py` workers do
+(prepared ground truth, memo of frame comparisons shared by all the samples),
+and times each stage of the evaluation chain:
+    load, frame loop (and, within it: homography, self-intersection check,
+    intersection), aggregation, temporal measures, export, merge and CSV.
+
+Results are written as a JSON document which can be compared with a previous
+run (see "--compare").
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import glob
+import json
+import datetime
+import platform
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from utils.profiling import StageProfiler
+from models.models import *
+from utils.compression import resolvePath, stripCompressionExt, COMPRESSION_EXTS
+import eval_seg
+import merge_evalres
+import evalsum_to_csv
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Segmentation Evaluation Benchmark"
+PROG_NAME_SHORT = "SegEvalBench"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+ERRCODE_MISMATCH = 20
+ERRCODE_REGRESSION = 30
+
+STAGES = ["load", "frame_loop", "homography", "selfintersection", "intersection",
+          "aggregation", "temporal", "export", "merge", "csv"]
+# stages timed within "frame_loop" (not counted in the total)
+NESTED_STAGES = ["homography", "selfintersection", "intersection"]
+
+
+# ==============================================================================
+def stages_report(profiler, frame_count):
+    """Stage timings of `profiler`, in STAGES order, with throughputs."""
+    stages = profiler.stages()
+    res = OrderedDict()
+    for name in STAGES:
+        (wall, cpu, calls) = stages.get(name, (0.0, 0.0, 0))
+        res[name] = OrderedDict([
+            ("wall", wall),
+            ("cpu", cpu),
+            ("calls", calls),
+            ("frames_per_second", frame_count / wall if wall > 0 else None)])
+    return res
+
+
+# ==============================================================================
+def check_results(reference, results):
+    """Returns the list of GlobalEvalResults fields which differ."""
+    return [f.field_name for f in GlobalEvalResults._fields
+            if getattr(reference, f.field_name) != getattr(results, f.field_name)]
+
+
+def list_tasks(data_dir, methods):
+    """Returns the list of (method, gt_file, test_file) to evaluate, in a stable order."""
+    gt_files = sorted(path for ext in [""] + COMPRESSION_EXTS
+                      for path in glob.glob(os.path.join(data_dir, "ground_truth", "*", "*.gt.xml" + ext)))
+    if not methods:
+        methods = sorted(os.path.basename(m) for m in glob.glob(os.path.join(data_dir, "outputs", "*"))
+                         if os.path.isdir(m))
+    tasks = []
+    for method in methods:
+        for gt_file in gt_files:
+            background = os.path.basename(os.path.dirname(gt_file))
+            document = os.path.basename(stripCompressionExt(gt_file))[:-len(".gt.xml")]
+            test_file = resolvePath(os.path.join(data_dir, "outputs", method, background, document + ".segresult.xml"))
+            if os.path.isfile(test_file):
+                tasks.append((method, gt_file, test_file))
+            else:
+                logger.warning("Missing result file '%s'.", test_file)
+    return tasks
+
+
+def environment():
+    return OrderedDict([
+        ("host", platform.node()),
+        ("platform", platform.platform()),
+        ("processor", platform.processor()),
+        ("python", platform.python_version()),
+        ("numpy", np.__version__),
+        ("opencv", cv2.__version__),
+        ])
+
+
+def compare_reports(baseline, report, tolerance):
+    """Log stage timings against a baseline report. Returns the list of slower stages."""
+    regressions = []
+    logger.info("%-18s %12s %12s %8s", "stage", "baseline (s)", "current (s)", "ratio")
+    for name, stage in report["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None or not base["wall"] or not stage["calls"]:
+            continue
+        # Compare throughputs, so that runs of different sizes can be compared
+        base_time = base["wall"] / baseline["frames"]
+        cur_time = stage["wall"] / report["frames"]
+        ratio = cur_time / base_time
+        logger.info("%-18s %12.6f %12.6f %8.3f%s", name, base["wall"], stage["wall"], ratio,
+                    "  <-- REGRESSION" if ratio > tolerance else "")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+# ==============================================================================
+def main(argv=None):
+    # Option parsing
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Time each stage of the evaluation chain on a (synthetic) data set.',
+        version=PROG_VERSION,
+        epilog="""Throughputs (time per frame) are compared with "--compare",
+                  so runs at different scales can be compared.""")
+
+    addLoggingArguments(parser)
+    parser.add_argument('data_dir',
+        action=StoreValidDir,
+        help="Directory containing 'ground_truth/BACKGROUND/DOC.gt.xml' and \
+              'outputs/METHOD/BACKGROUND/DOC.segresult.xml' files (see bench_gen.py).")
+    parser.add_argument('-m', '--method', dest="methods",
+        action="append", default=[],
+        help="Method to evaluate (can be repeated). All methods by default.")
+    parser.add_argument('-w', '--work-dir',
+        action=StoreExistingOrCreatableDir, default="bench_work",
+        help="Directory where evaluation files, summaries and CSV files are written.")
+    parser.add_argument('-o', '--output-file',
+        help="Path to the JSON file where timings are written (stdout if not set).")
+    parser.add_argument('--max-samples',
+        action=StoreIntZeroPositive, default=0,
+        help="Only evaluate the first N samples (0 = all).")
+    parser.add_argument('--memo-size', metavar="ENTRIES",
+        action=StoreIntZeroPositive, default=eval_seg.MEMO_SIZE,
+        help="Number of frame comparisons memoized for repeated quads (0 to disable).")
+    parser.add_argument('--check',
+        action="store_true",
+        help="Also evaluate each sample without prepared ground truth nor memo, \
+              and check results are identical.")
+    parser.add_argument('--compare', metavar="BASELINE_JSON",
+        action=StoreValidFilePath,
+        help="Previous benchmark result to compare timings with.")
+    parser.add_argument('--tolerance',
+        type=float, default=1.10,
+        help="Time per frame ratio above which a stage is reported as a regression.")
+
+    args = parser.parse_args(argv)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    tasks = list_tasks(args.data_dir, args.methods)
+    if args.max_samples > 0:
+        tasks = tasks[:args.max_samples]
+    if not tasks:
+        logger.error("No sample found in '%s'.", args.data_dir)
+        return ERRCODE_NOFILE
+
+    profiler = StageProfiler(PROG_NAME_SHORT, PROG_VERSION)
+    memo = eval_seg.QuadPairMemo(args.memo_size) if args.memo_size > 0 else None
+    frame_count = 0
+    mismatches = 0
+    eval_files = {} # method -> list of files
+    for (i, (method, gt_file, test_file)) in enumerate(tasks):
+        background = os.path.basename(os.path.dirname(gt_file))
+        document = os.path.basename(stripCompressionExt(gt_file))[:-len(".gt.xml")]
+
+        with profiler.stage("load"):
+            gt_mdl = GroundTruth.loadFromFile(gt_file)
+            test_mdl = SegResult.loadFromFile(test_file)
+            prepared = eval_seg.PreparedGroundTruth(gt_mdl)
+
+        evalRes_mdl, _count = eval_seg.evaluate(gt_mdl, test_mdl, gt_file, test_file, profiler,
+                                                prepared=prepared, memo=memo)
+        frame_count += evalRes_mdl.global_results.count_total_frames
+
+        if args.check:
+            reference, _count = eval_seg.evaluate(gt_mdl, test_mdl, gt_file, test_file)
+            diff = check_results(reference.global_results, evalRes_mdl.global_results)
+            if diff:
+                mismatches += 1
+                logger.error("Results differ from eval_seg for '%s': %s", test_file, ", ".join(diff))
+
+        out_dir = os.path.join(args.work_dir, method, background)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        eval_file = os.path.join(out_dir, document + ".segeval.xml")
+        with profiler.stage("export"):
+            evalRes_mdl.exportToFile(eval_file)
+        eval_files.setdefault(method, []).append(eval_file)
+
+        if (i + 1) % 100 == 0:
+            logger.info("%d/%d samples evaluated.", i + 1, len(tasks))
+
+    summary_files = []
+    with profiler.stage("merge"):
+        for method, files in eval_files.items():
+            res_agg = merge_evalres.res_init
+            for eval_file in files:
+                res_cur = merge_evalres.res_model_to_tuple(merge_evalres.read_results_from_file(eval_file))
+                res_agg = merge_evalres.merge_res_tuples(res_cur, res_agg)
+            summary_file = os.path.join(args.work_dir, method + ".evalsummary.xml")
+            merge_evalres.res_tuple_to_model(res_agg).exportToFile(summary_file)
+            summary_files.append(summary_file)
+
+    with profiler.stage("csv"):
+        for method, files in eval_files.items():
+            with open(os.path.join(args.work_dir, method + ".summary.csv"), "wb") as ofile:
+                csv_writer = evalsum_to_csv.createCsvWriter(ofile)
+                csv_writer.writerow(evalsum_to_csv.CSV_HEADER)
+                for eval_file in files + [os.path.join(args.work_dir, method + ".evalsummary.xml")]:
+                    csv_writer.writerow(evalsum_to_csv.results_to_row(eval_file,
+                                            evalsum_to_csv.read_results_from_file(eval_file)))
+    logger.debug("--- Process complete. ---")
+
+    # --------------------------------------------------------------------------
+    report = OrderedDict([
+        ("tool", PROG_NAME_SHORT),
+        ("version", PROG_VERSION),
+        ("timestamp", datetime.datetime.now().isoformat()),
+        ("environment", environment()),
+        ("data_dir", os.path.abspath(args.data_dir)),
+        ("methods", sorted(eval_files.keys())),
+        ("samples", len(tasks)),
+        ("frames", frame_count),
+        ("stages", stages_report(profiler, frame_count)),
+        ("counters", profiler.record()["counters"]),
+        ])
+    top_stages = [s for (name, s) in report["stages"].items() if name not in NESTED_STAGES]
+    total_wall = sum(s["wall"] for s in top_stages)
+    report["total"] = OrderedDict([
+        ("wall", total_wall),
+        ("cpu", sum(s["cpu"] for s in top_stages)),
+        ("frames_per_second", frame_count / total_wall if total_wall > 0 else None)])
+
+    out_str = json.dumps(report, indent=2)
+    if args.output_file is not None:
+        with open(args.output_file, "wb") as out_f:
+            out_f.write(out_str + "\n")
+    else:
+        print out_str
+
+    logger.info("%d samples (%d frames) evaluated in %0.3fs (%0.1f frames/s)."
+                % (len(tasks), frame_count, total_wall, report["total"]["frames_per_second"] or 0.0))
+
+    ret = ERRCODE_OK
+    if mismatches > 0:
+        logger.error("%d sample(s) with results different from eval_seg.", mismatches)
+        ret = ERRCODE_MISMATCH
+
+    if args.compare is not None:
+        with open(args.compare) as base_f:
+            baseline = json.load(base_f)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        if regressions:
+            logger.error("Slower stages: %s", ", ".join(regressions))
+            if ret == ERRCODE_OK:
+                ret = ERRCODE_REGRESSION
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ret
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Compile all the ground truth files of a dataset
+("GT_ROOT/BACKGROUND/DOCUMENT.gt.xml", possibly compressed) into a single
+ground truth index (see utils/gtindex.py).
+
+The index can be given instead of the ground truth directory to
+`batch_eval.py`, `validate_segresults.py` and `eval_server.py`: it is opened
+read-only with a memory map, so worker processes share it instead of parsing
+and holding their own copy of the ground truth.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from utils.gtindex import buildIndex, findGroundTruthFiles
+from utils.profiling import createProfiler
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Ground Truth Index Builder"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Compile ground truth files into a memory-mappable index.',
+        version=PROG_VERSION)
+
+    parser.add_argument('gt_root',
+        action=StoreValidDir,
+        help="Directory containing ground truth files (BACKGROUND/DOCUMENT.gt.xml).")
+    parser.add_argument('-o', '--output-file',
+        required=True,
+        help="Path to the index file to create.")
+    addLoggingArguments(parser)
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "build_gtindex", PROG_VERSION, args.memprofile)
+
+    gt_files = findGroundTruthFiles(args.gt_root)
+    if not gt_files:
+        logger.error("No ground truth file found in '%s'.", args.gt_root)
+        return ERRCODE_NOFILE
+    profiler.info("samples", len(gt_files))
+    with profiler.stage("build"):
+        frame_count = buildIndex(gt_files, args.output_file)
+    profiler.count("frames", frame_count)
+    logger.info("%d ground truth files (%d frames) indexed in '%s'.",
+                len(gt_files), frame_count, args.output_file)
+    logger.debug("--- Process complete. ---")
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
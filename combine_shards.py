@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Combine the partial states of a sharded evaluation (`batch_eval.py --shard
+I/N`, see utils/shard.py) into the outputs of a single-host run:
+- "EVAL_DIR/METHOD/BACKGROUND/DOCUMENT.segeval.xml" files, copied from the
+  shard output directories (unless they already are in EVAL_DIR);
+- "EVAL_DIR/METHOD/BACKGROUND.evalsummary.xml" and
+  "EVAL_DIR/METHOD/BACKGROUND-ALL.evalsummary.xml", as produced by
+  `merge_evalres.py` in `run_eval.sh`;
+- "ANALYSIS_DIR/METHOD.summary.csv" (with "-a"), as produced by
+  `evalsum_to_csv.py`.
+Summaries are computed from the global results stored in partial states
+(values as written to evaluation files), documents being merged in sorted
+order, or with exact fixed-point sums with "--exact" (like `merge_evalres.py
+--exact`). All the shards (1 to N) of the evaluation must be given, once each.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import shutil
+from collections import OrderedDict
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from models.models import *
+from utils.compact import sidecarPath
+from utils.shard import loadPartialState
+from utils.profiling import createProfiler
+from merge_evalres import (res_init, res_model_to_tuple, res_tuple_to_model, merge_res_tuples,
+                           sums_init, res_model_to_sums, merge_sums, sums_to_model)
+from evalsum_to_csv import write_summary_csv
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Sharded Evaluation Combiner"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+ERRCODE_EVALFAILED = 11
+ERRCODE_INCOMPLETE = 13
+
+SUMMARY_EXT = ".evalsummary.xml"
+ALL_BACKGROUNDS = "BACKGROUND-ALL"
+
+
+# ==============================================================================
+def checkShards(states):
+    """dict path -> partial state ---> list of error messages (missing, duplicate or mismatching shards)."""
+    errors = []
+    counts = sorted(set(state["shard"]["count"] for state in states.values()))
+    if len(counts) > 1:
+        errors.append("Partial states come from different shardings (%s shards)." % ", ".join(map(str, counts)))
+        return errors
+    found = {} # shard index -> path
+    for (path, state) in sorted(states.items()):
+        index = state["shard"]["index"]
+        if index in found:
+            errors.append("Shard %d given twice: '%s' and '%s'." % (index, found[index], path))
+        found[index] = path
+    missing = [index for index in range(1, counts[0] + 1) if index not in found]
+    if missing:
+        errors.append("Missing shard(s) %s (out of %d)." % (", ".join(map(str, missing)), counts[0]))
+    return errors
+
+
+def collectSamples(states):
+    """
+    dict path -> partial state ---> dict (method, background, document) -> (shard dir, sample)
+    ValueError if a sample was evaluated by several shards.
+    """
+    samples = {}
+    for (path, state) in sorted(states.items()):
+        for sample in state["samples"]:
+            key = (sample["method"], sample["background"], sample["document"])
+            if key in samples:
+                raise ValueError("'%s' evaluated twice (shard directories '%s' and '%s')."
+                                 % ("/".join(key), samples[key][0], os.path.dirname(path)))
+            samples[key] = (os.path.dirname(os.path.abspath(path)), sample)
+    return samples
+
+
+def copyEvalFile(shard_dir, eval_file, out_dir):
+    """Copy `eval_file` (and its compact sidecar, if any) from `shard_dir` to `out_dir`."""
+    src = os.path.join(shard_dir, eval_file)
+    dst = os.path.join(out_dir, eval_file)
+    if os.path.realpath(src) == os.path.realpath(dst):
+        return
+    if not os.path.isdir(os.path.dirname(dst)):
+        os.makedirs(os.path.dirname(dst))
+    shutil.copy2(src, dst)
+    if os.path.isfile(sidecarPath(src)):
+        shutil.copy2(sidecarPath(src), sidecarPath(dst))
+
+
+def mergeSummaries(summaries, exact=False):
+    """
+    list of EvalSummary (or EvalResult) ---> EvalSummary, merged like
+    `merge_evalres.py [--exact]` does.
+    """
+    if exact:
+        sums_agg = sums_init
+        for mdl in summaries:
+            sums_agg = merge_sums(res_model_to_sums(mdl.global_results,
+                                                    getattr(mdl, "sufficient_statistics", None)),
+                                  sums_agg)
+        return sums_to_model(sums_agg)
+    res_agg = res_init
+    for mdl in summaries:
+        res_agg = merge_res_tuples(res_model_to_tuple(mdl.global_results), res_agg)
+    return res_tuple_to_model(res_agg)
+
+
+def asWritten(mdl):
+    """Model ---> Model, as read back from a file (rendering rounds floats)."""
+    return mdl.__class__.parse(mdl.render(fragment=True))
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Combine the partial states of a sharded evaluation into summaries and CSV files.',
+        version=PROG_VERSION)
+
+    parser.add_argument('partial_files',
+        action=StoreValidFilePaths,
+        nargs='+', metavar='partial_file',
+        help="Partial-state files of all the shards (shard-I-of-N.partial.json).")
+    addLoggingArguments(parser)
+    addPrettyPrintArgument(parser)
+    parser.add_argument('-o', '--output-dir',
+        action=StoreExistingOrCreatableDir, required=True,
+        help="Directory where evaluation results and summaries are written.")
+    parser.add_argument('-a', '--analysis-dir',
+        action=StoreExistingOrCreatableDir,
+        help="Directory where CSV summaries (METHOD.summary.csv) are written.")
+    parser.add_argument('-x', '--exact',
+        action='store_true',
+        help="Merge fixed-point sums of frame measures, like 'merge_evalres.py --exact'.")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "combine_shards", PROG_VERSION, args.memprofile)
+
+    with profiler.stage("load"):
+        try:
+            states = OrderedDict((path, loadPartialState(path)) for path in args.partial_files)
+            errors = checkShards(states)
+            if not errors:
+                samples = collectSamples(states)
+        except ValueError, e:
+            errors = [str(e)]
+    if errors:
+        for err in errors:
+            logger.error(err)
+        return ERRCODE_INCOMPLETE
+    profiler.info("shards", len(states))
+
+    # method -> background -> list of EvalSummary (global results only), in document order
+    results = OrderedDict()
+    failures = 0
+    for key in sorted(samples):
+        (shard_dir, sample) = samples[key]
+        if sample["status"] != "ok":
+            logger.error("%s:%s: %s", sample["submission"], sample["member"], sample["error"])
+            failures += 1
+            continue
+        with profiler.stage("copy"):
+            copyEvalFile(shard_dir, sample["eval_file"], args.output_dir)
+        results.setdefault(key[0], OrderedDict()).setdefault(key[1], []).append(
+            EvalSummary(global_results=GlobalEvalResults(**sample["global_results"])))
+    profiler.count("evaluated", len(samples) - failures)
+    profiler.count("failed", failures)
+    if not results:
+        logger.error("No evaluated sample in partial states.")
+        return ERRCODE_NOFILE
+
+    for (method, backgrounds) in results.items():
+        summaries = OrderedDict() # summary file -> EvalSummary
+        with profiler.stage("aggregation"):
+            for (background, results_list) in backgrounds.items():
+                summary_file = os.path.join(args.output_dir, method, background + SUMMARY_EXT)
+                summaries[summary_file] = mergeSummaries(results_list, args.exact)
+            all_mdl = mergeSummaries([asWritten(mdl) for mdl in summaries.values()], args.exact)
+            summaries[os.path.join(args.output_dir, method, ALL_BACKGROUNDS + SUMMARY_EXT)] = all_mdl
+        with profiler.stage("export"):
+            for (summary_file, summary_mdl) in summaries.items():
+                summary_mdl.exportToFile(summary_file, pretty_print=args.pretty_print)
+            if args.analysis_dir is not None:
+                write_summary_csv(os.path.join(args.analysis_dir, method + ".summary.csv"),
+                                  sorted(summaries.items()))
+        gr_mdl = all_mdl.global_results
+        logger.info("%s: %d frames, mean ji smartdoc = %f", method,
+                    gr_mdl.count_total_frames, gr_mdl.mean_jaccard_index_smartdoc)
+    logger.debug("--- Process complete. ---")
+    logger.info("%d shards combined: %d samples, %d failed.", len(states), len(samples), failures)
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_EVALFAILED if failures else ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Evaluation of multi-object segmentation results.
+
+Frames of ground truth and segmentation results can contain several
+objects ("<object>" elements, each with its 4 points). Single object files
+(points directly in "<frame>") are also accepted.
+
+For each frame, detected objects are paired with ground truth objects so
+that the sum of Jaccard indices (computed in the target referential of each
+ground truth object, like in eval_seg.py) is maximal (Hungarian assignment).
+Only pairs with overlapping bounding boxes are compared, and the assignment
+is solved separately for each group of objects which overlap each other.
+
+Frame results are produced for each object:
+- true accepted : ground truth object matched with a detected object;
+- false rejected: ground truth object not matched;
+- false accepted: detected object not matched;
+- true rejected : frame without object, neither in ground truth nor in result.
+Frames which are not rejected but have neither objects nor points count as
+frames without object.
+Pairs with a null intersection, or with a self-intersecting detected object,
+are not matched. Frames with a single object in both ground truth and result
+are evaluated like in eval_seg.py instead: the object is always true accepted
+(with a null Jaccard index in these cases), so both tools give the same
+results on single object files.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+
+import numpy as np
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from models.models import *
+from utils.polygon import boundingBox, overlappingBoxPairs
+from utils.profiling import createProfiler, NULL_PROFILER
+from utils.geometry import frameCoords, outlineCoords
+from eval_seg import (TargetRegion, evalTrueAccept, computeGlobalResults, createEvalResult, logGlobalResults)
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Multi-object Segmentation Evaluation Tool for Videos"
+
+
+# ==============================================================================
+def frameObjects(frame, coords_func=frameCoords):
+    """
+    FrameSegResult ---> list of (name, coords, SegObject or None)
+    Empty list for rejected frames, and for frames with neither objects nor
+    points (or outline): no detection. Single object frames give one unnamed
+    object.
+    """
+    if frame.rejected:
+        return []
+    if frame.objects:
+        return [(obj.name, coords_func(obj), obj) for obj in frame.objects]
+    if not frame.points and not frame.outline:
+        return []
+    return [(None, coords_func(frame), None)]
+
+
+class TargetRegions(object):
+    """Target regions of a ground truth, one for each object shape."""
+    def __init__(self, default_shape):
+        self._default_shape = default_shape
+        self._regions = {}
+
+    def get(self, gt_obj):
+        shape = self._default_shape
+        if gt_obj is not None and gt_obj.object_shape is not None:
+            shape = gt_obj.object_shape
+        key = (shape.width, shape.height)
+        region = self._regions.get(key)
+        if region is None:
+            region = self._regions[key] = TargetRegion(shape)
+        return region
+
+
+def connectedPairs(pairs):
+    """
+    Group the (i, j) pairs of a bipartite graph by connected component.
+    Returns a list of lists of pairs.
+    """
+    parent = {}
+    def find(node):
+        root = node
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while node != root: # path compression
+            parent[node], node = root, parent.get(node, node)
+        return root
+    for (i, j) in pairs:
+        (ri, rj) = (find(("gt", i)), find(("test", j)))
+        if ri != rj:
+            parent[ri] = rj
+    groups = {}
+    for (i, j) in pairs:
+        groups.setdefault(find(("gt", i)), []).append((i, j))
+    return groups.values()
+
+
+def assignPairs(scores):
+    """
+    Maximum weight matching of a component.
+    `scores`: dict (i, j) -> Jaccard index (> 0). Returns the list of (i, j).
+    """
+    if len(scores) == 1:
+        return scores.keys()
+    from scipy.optimize import linear_sum_assignment
+    rows = sorted(set(i for (i, _j) in scores))
+    cols = sorted(set(j for (_i, j) in scores))
+    row_pos = dict((i, r) for (r, i) in enumerate(rows))
+    col_pos = dict((j, c) for (c, j) in enumerate(cols))
+    cost = np.zeros((len(rows), len(cols)))
+    for ((i, j), ji) in scores.items():
+        cost[row_pos[i], col_pos[j]] = -ji
+    (r_ind, c_ind) = linear_sum_assignment(cost)
+    return [(rows[r], cols[c]) for (r, c) in zip(r_ind, c_ind) if cost[r, c] < 0.0]
+
+
+def unmatchedResult(fidx, match_type, gt_name=None, test_name=None):
+    fr = FrameEvalResult(index=fidx)
+    fr.match_type = match_type
+    fr.jaccard_index_smartdoc = 0.0
+    fr.gt_object = gt_name
+    fr.test_object = test_name
+    return fr
+
+
+def evalFrameObjects(fidx, targets, gt_frame, test_frame, profiler=NULL_PROFILER):
+    """
+    Evaluate the objects of a frame. Returns the list of FrameEvalResult
+    (one for each object) and the count of self-intersecting test polygons.
+    """
+    gt_objs = frameObjects(gt_frame)
+    test_objs = frameObjects(test_frame, outlineCoords)
+    if not gt_objs and not test_objs:
+        fr = FrameEvalResult(index=fidx)
+        fr.match_type = TRUE_REJECTED_STR
+        fr.jaccard_index_smartdoc = 1.0
+        profiler.count(fr.match_type)
+        return [fr], 0
+    if len(gt_objs) == 1 and len(test_objs) == 1:
+        # same as eval_seg: true accepted, even without overlap or if self-intersecting
+        ((gt_name, gt_coords, gt_obj), (test_name, test_coords, _test_obj)) = (gt_objs[0], test_objs[0])
+        fr, self_intersecting = evalTrueAccept(fidx, targets.get(gt_obj), gt_coords, test_coords, profiler)
+        fr.gt_object = gt_name
+        fr.test_object = test_name
+        profiler.count(fr.match_type)
+        return [fr], int(self_intersecting)
+
+    with profiler.stage("pruning"):
+        candidates = overlappingBoxPairs([boundingBox(coords) for (_n, coords, _o) in gt_objs],
+                                         [boundingBox(coords) for (_n, coords, _o) in test_objs])
+    profiler.count("candidate_pairs", len(candidates))
+
+    # Jaccard index of each candidate pair
+    pair_results = {}
+    self_intersecting_tests = set()
+    for (i, j) in candidates:
+        (gt_name, gt_coords, gt_obj) = gt_objs[i]
+        fr, self_intersecting = evalTrueAccept(fidx, targets.get(gt_obj), gt_coords, test_objs[j][1], profiler)
+        if self_intersecting:
+            self_intersecting_tests.add(j)
+        elif fr.jaccard_index_smartdoc > 0.0:
+            pair_results[(i, j)] = fr
+
+    # Optimal assignment, for each group of overlapping objects
+    with profiler.stage("assignment"):
+        matches = []
+        for group in connectedPairs(pair_results.keys()):
+            matches.extend(assignPairs(dict((p, pair_results[p].jaccard_index_smartdoc) for p in group)))
+
+    frame_results = []
+    matched_gt = set()
+    matched_test = set()
+    for (i, j) in sorted(matches):
+        fr = pair_results[(i, j)]
+        fr.gt_object = gt_objs[i][0]
+        fr.test_object = test_objs[j][0]
+        frame_results.append(fr)
+        matched_gt.add(i)
+        matched_test.add(j)
+    for (i, (gt_name, _c, _o)) in enumerate(gt_objs):
+        if i not in matched_gt:
+            frame_results.append(unmatchedResult(fidx, FALSE_REJECTED_STR, gt_name=gt_name))
+    for (j, (test_name, _c, _o)) in enumerate(test_objs):
+        if j not in matched_test:
+            frame_results.append(unmatchedResult(fidx, FALSE_ACCEPTED_STR, test_name=test_name))
+    for fr in frame_results:
+        profiler.count(fr.match_type)
+    return frame_results, len(self_intersecting_tests)
+
+
+def evaluateMulti(gt_mdl, test_mdl, groundtruth_file, testresult_file, profiler=NULL_PROFILER):
+    """
+    GroundTruth x SegResult x str x str ---> EvalResult, int
+
+    Same as eval_seg.evaluate, for multi-object results.
+    """
+    if len(gt_mdl.segmentation_results) != len(test_mdl.segmentation_results):
+        err = "ERROR: Number of frames is different in ground truth and test result XML files."
+        logger.error(err)
+        raise Exception(err)
+
+    evalRes_mdl = createEvalResult(groundtruth_file, testresult_file)
+    evalRes_mdl.software_used = Software(name="SegEvalMulti", version=PROG_VERSION)
+    targets = TargetRegions(gt_mdl.object_shape)
+    error_selfintersections_count = 0
+    with profiler.stage("frame_loop"):
+        for (idx, (gt_frame, test_frame)) in enumerate(zip(gt_mdl.segmentation_results,
+                                                          test_mdl.segmentation_results)):
+            frame_results, selfint_count = evalFrameObjects(idx+1, targets, gt_frame, test_frame, profiler)
+            evalRes_mdl.frame_results.extend(frame_results)
+            error_selfintersections_count += selfint_count
+    with profiler.stage("aggregation"):
+        evalRes_mdl.global_results = computeGlobalResults(evalRes_mdl.frame_results)
+    return evalRes_mdl, error_selfintersections_count
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Evaluate multi-object page segmentation results for a given video sequence.',
+        version=PROG_VERSION,
+        epilog="""Counts and means are computed over objects instead of frames.""")
+
+    parser.add_argument('groundtruth_file',
+        action=StoreValidFilePath,
+        help="File containing ground truth segmentation and object reference.")
+    parser.add_argument('testresult_file',
+        action=StoreValidFilePath,
+        help="File containing the segmentation result to evaluate.")
+    addLoggingArguments(parser)
+    addPrettyPrintArgument(parser)
+    parser.add_argument('-o', '--output-file',
+        help="Optionnal path to output file.")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "eval_multi", PROG_VERSION, args.memprofile)
+    profiler.info("groundtruth_file", args.groundtruth_file)
+    profiler.info("testresult_file", args.testresult_file)
+
+    with profiler.stage("gt_load"):
+        gt_mdl = GroundTruth.loadFromFile(args.groundtruth_file)
+    with profiler.stage("test_load"):
+        test_mdl = SegResult.loadFromFile(args.testresult_file)
+
+    evalRes_mdl, error_selfintersections_count = evaluateMulti(gt_mdl, test_mdl,
+                                                               args.groundtruth_file, args.testresult_file,
+                                                               profiler)
+    logger.debug("--- Process complete. ---")
+    logGlobalResults(evalRes_mdl.global_results, error_selfintersections_count, logger)
+
+    if args.output_file is not None:
+        with profiler.stage("export"):
+            evalRes_mdl.exportToFile(args.output_file, pretty_print=args.pretty_print)
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
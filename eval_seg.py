@@ -20,14 +20,14 @@ import argparse
 import os
 import os.path
 import sys
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 # from pprint import pprint as pp
 import cv2
 import numpy as np
 import Polygon
 import Polygon.Utils
-import Polygon.IO # dbg
+# import Polygon.IO # dbg (writeSVG), import locally when needed
 
 # ==============================================================================
 # SegEval Tools suite imports
@@ -35,6 +35,11 @@ from utils.args import *
 from utils.log import *
 from models.models import *
 from utils.polygon import *
+from utils.geometry import frameCoords, outlineCoords
+from utils.temporal import rollingVariance, countFlips, longestRun, vertexDisplacements
+from utils.compact import exportCompact
+from utils.gtindex import IndexedGroundTruth
+from utils.profiling import createProfiler, NULL_PROFILER
 
 # ==============================================================================
 # (re)define logger after "from ... import *" (potential overwrite otherwise)
@@ -47,96 +52,327 @@ PROG_NAME = "Mobile Segmentation Evaluation Tool for Videos"
 XML_VERSION_MIN = 0.2
 XML_VERSION_MAX = 0.3
 
+# Default number of frames of the sliding windows used by temporal metrics
+TEMPORAL_WINDOW = 10
 
-# ==============================================================================
-def main(argv=None):
-    # -----------------------------------------------------------------------------
-    # Parser definition
-    parser = argparse.ArgumentParser(
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-        description='Evaluate the page segmentation results for a given video sequence.', 
-        version=PROG_VERSION,
-        epilog="""Segmentation and detection precision and recall are computed separately."""
-    )
-
-    parser.add_argument('groundtruth_file',
-        action=StoreValidFilePath,
-        help="File containing ground truth segmentation and object reference.")
-    parser.add_argument('testresult_file', 
-        action=StoreValidFilePath,
-        help="File containing ground truth segmentation and object reference.")
-    parser.add_argument('-d', '--debug', 
-        action="store_true", 
-        help="Activate debug output.")
-    parser.add_argument('-o', '--output-file', 
-        help="Optionnal path to output file.")
-
-    args = parser.parse_args()
+# Default number of entries of the memo of frame comparisons (see `QuadPairMemo`)
+MEMO_SIZE = 4096
 
-    # -----------------------------------------------------------------------------
-    # Logger activation
-    initLogger(logger)
-    output_prettyprint = False
-    if args.debug:
-        logger.setLevel(logging.DEBUG)
-        output_prettyprint = True
-    
-    # -----------------------------------------------------------------------------
-    # Output log header
-    programHeader(logger, PROG_NAME, PROG_VERSION)
-    logger.debug(DBGSEP)
-    dumpArgs(args, logger)
-    logger.debug(DBGSEP)
-
-    # -----------------------------------------------------------------------------
-    logger.debug("Starting up")
-
-    # Create result model
-    evalRes_mdl = EvalResult(
-            version="0.3",
-            software_used=Software(
-                    name="SegEval",
-                    version=PROG_VERSION))
 
-    evalRes_mdl.source_files = EvalSourceFiles(
-                groundtruth_file=args.groundtruth_file,
-                segresult_file=args.testresult_file)
 
-    # Let's go
-    # --------------------------------------------------------------------------
-    logger.debug("--- Process started. ---")
-    # --------------------------------------------------------------------------
-
-    # Input files models
-    gt_mdl = GroundTruth.loadFromFile(args.groundtruth_file)
-    test_mdl = SegResult.loadFromFile(args.testresult_file)
-
-    # read ref object shape
-    target_width = gt_mdl.object_shape.width
-    target_height = gt_mdl.object_shape.height
-    # Referential: (0,0) at TL, x > 0 toward right and y > 0 toward bottom
-    # Corner order: TL, BL, BR, TR
+# ==============================================================================
+# Evaluation stages
+# Each stage is a separate function so that it can be reused (and timed) by
+# other tools; `evaluate()` chains them for a whole sample.
+
+def targetCoords(object_shape):
+    """
+    ObjectShape ---> np.float32 (4x2)
+
+    Coordinates of the reference object in the target referential.
+    Referential: (0,0) at TL, x > 0 toward right and y > 0 toward bottom
+    Corner order: TL, BL, BR, TR
+    """
+    target_width = object_shape.width
+    target_height = object_shape.height
     # object_coord_target = np.float32([[0, 0], [0, target_height], [target_width, target_height], [target_width, 0]])
-    object_coord_target = np.float32([[0, target_height], [0, 0], [target_width, 0], [target_width, target_height]])
-
-
+    return np.float32([[0, target_height], [0, 0], [target_width, 0], [target_width, target_height]])
+
+
+def homographyToTarget(object_coord_gt, object_coord_target):
+    """Compute Ĥ = perfect homography from gt frame coordinates to target coordinates."""
+    return cv2.getPerspectiveTransform(object_coord_gt.reshape(-1, 1, 2), object_coord_target.reshape(-1, 1, 2))
+
+
+def projectToTarget(object_coord_gt, object_coord_test, object_coord_target, H=None):
+    """
+    Compute Ĥ = perfect homography from gt frame coordinates to target 
+    coordinates (unless already given as `H`), and apply it to test result 
+    to project in target referential.
+    Returns the projected test coordinates (Nx1x2).
+    """
+    if H is None:
+        H = homographyToTarget(object_coord_gt, object_coord_target)
+    return cv2.perspectiveTransform(object_coord_test.reshape(-1, 1, 2), H)
+
+
+class TargetRegion(object):
+    """
+    Target region of a ground truth (reference object in target referential).
+    Its polygon is checked for self-intersection once, on first use.
+    """
+    def __init__(self, object_shape):
+        self.coords = targetCoords(object_shape)
+        self._poly = None
+        self._area = None
+
+    def polygon(self, fidx):
+        """Returns the target polygon, raises ValueError if it self-intersects."""
+        if self._poly is None:
+            poly_target = Polygon.Polygon(self.coords.reshape(-1,2))
+            # (sadly, we must check for self-intersecting polygons which mess the interection computation)
+            if isSelfIntersecting(poly_target):
+                msg = "frame %03d: Ground truth polygon is self intersecting. Aborting evaluation." % fidx
+                logger.error(msg)
+                raise ValueError(msg)
+            self._poly = poly_target
+            self._area = poly_target.area()
+        return self._poly
+
+    def area(self, fidx):
+        self.polygon(fidx)
+        return self._area
+
+
+class PreparedGroundTruth(object):
+    """
+    Ground truth data which can be reused across several evaluations 
+    (evaluation server, sweeps): target region, and GT frame coordinates and 
+    homographies to the target, computed on first use.
+    `gt_mdl` can be a GroundTruth or an IndexedGroundTruth (utils/gtindex.py).
+    """
+    def __init__(self, gt_mdl):
+        self.mdl = gt_mdl
+        self.target = TargetRegion(gt_mdl.object_shape)
+        self._coords = {}
+        self._homographies = {}
+
+    def frameCoords(self, idx):
+        coords = self._coords.get(idx)
+        if coords is None:
+            if isinstance(self.mdl, IndexedGroundTruth):
+                coords = self._coords[idx] = self.mdl.frameCoords(idx)
+            else:
+                coords = self._coords[idx] = frameCoords(self.mdl.segmentation_results[idx])
+        return coords
+
+    def homography(self, idx):
+        H = self._homographies.get(idx)
+        if H is None:
+            H = self._homographies[idx] = homographyToTarget(self.frameCoords(idx), self.target.coords)
+        return H
+
+
+class QuadPairMemo(object):
+    """
+    Bounded memo (LRU) of the geometric comparison of frames accepted in both
+    ground truth and test result: projection in target referential, 
+    self-intersection check and intersection surfaces. Entries are keyed by
+    the target coordinates (object shape), and the ground truth corners and
+    test outline of the frame, so static segments (still camera, tracker 
+    repeating the same corners) are compared once, within and across samples.
+    With `quantum` 0, keys are the exact coordinates and results are 
+    unchanged; otherwise coordinates are rounded to multiples of `quantum` 
+    (pixels) and close quads share the results of the first one compared.
+    """
+    def __init__(self, size=MEMO_SIZE, quantum=0.0):
+        self._size = max(1, size)
+        self._quantum = quantum
+        self._entries = OrderedDict() # key -> (test_coords, self_intersecting, area_test, area_inter)
+        self.hits = 0
+        self.misses = 0
+
+    def _quantize(self, coords):
+        if not self._quantum:
+            return coords.tostring()
+        return np.round(coords / self._quantum).astype(np.int64).tostring()
+
+    def key(self, target, object_coord_gt, object_coord_test):
+        return (target.coords.tostring(), self._quantize(object_coord_gt), self._quantize(object_coord_test))
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries[key] = entry
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+
+def intersectionSurfaces(poly_target, poly_test, area_target):
+    """
+    Compute intersection between target region and test result region.
+    Returns (area_test, area_inter). `poly_test` must not self-intersect.
+    """
+    poly_inter = poly_target & poly_test
+    # Polygon.IO.writeSVG('_tmp/polys-%03d.svg'%fidx, [poly_target, poly_test, poly_inter]) # dbg
+    # poly_inter should not self-intersect, but may have more than 1 contour
+    area_test = poly_test.area()
+    area_inter = poly_inter.area()
+
+    # Little hack to cope with float precision issues when dealing with polygons:
+    #   If intersection area is close enough to target area or GT area, but slighlty >,
+    #   then fix it, assuming it is due to rounding issues.
+    area_min = min(area_target, area_test)
+    if area_min < area_inter and area_min * 1.0000000001 > area_inter :
+        area_inter = area_min
+        logger.debug("Capping area_inter.")
+    return area_test, area_inter
+
+
+def segmentationScores(fidx, area_target, area_test, area_inter):
+    """
+    Compute segmentation precision, recall and Jaccard index of a frame 
+    from surfaces. Returns (precision, recall, jaccard_index).
+    """
+    area_union = area_test + area_target - area_inter
+    precision_frame = 0.0
+    recall_frame    = 0.0
+    if area_test == 0:
+        # Actually, it's only the precision which is undefined, but we can extend the domain
+        # considering the limit:
+        # lim_(x->0) 0/x = 0 ## http://www.wolframalpha.com/input/?i=lim+0%2Fx+as+x-%3E0
+        logger.warning("frame %03d: Test area surface is null. Setting segmentation precision and recall to 0.", fidx)
+    else:
+        precision_frame = area_inter / area_test
+        recall_frame = area_inter / area_target
+        if area_target < area_inter or area_test < area_inter:
+            msg = "frame %03d: area_inter is bigger than area_target or area_test." % (fidx, )
+            logger.error(msg)
+            logger.debug("area_target = %f (%s) ; area_test = %f (%s) ; area_inter = %f (%s)", 
+                    area_target, float.hex(area_target), area_test, float.hex(area_test), area_inter, float.hex(area_inter))
+            raise ValueError(msg)
+        if precision_frame < 0.0 or precision_frame > 1.0:
+            msg = "frame %03d: precision_frame = %f not in [0.0, 1.0]." % (fidx, precision_frame)
+            logger.error(msg)
+            logger.debug("area_target = %f (%s) ; area_test = %f (%s) ; area_inter = %f (%s)", 
+                    area_target, float.hex(area_target), area_test, float.hex(area_test), area_inter, float.hex(area_inter))
+            raise ValueError(msg)
+        if recall_frame < 0.0 or recall_frame > 1.0:
+            msg = "frame %03d: recall_frame = %f not in [0.0, 1.0]." % (fidx, recall_frame)
+            logger.error(msg)
+            logger.debug("area_target = %f (%s) ; area_test = %f (%s) ; area_inter = %f (%s)", 
+                    area_target, float.hex(area_target), area_test, float.hex(area_test), area_inter, float.hex(area_inter))
+            raise ValueError(msg)
+
+        # assert (0.0 <= precision_frame and precision_frame <= 1.0), "Segmentation precision must be in [0.0, 1.0]."
+        # assert (0.0 <= recall_frame and recall_frame <= 1.0), "Segmentation recall must be in [0.0, 1.0]."
+    jaccard_index = area_inter / area_union
+    return precision_frame, recall_frame, jaccard_index
+
+
+def evalTrueAccept(fidx, target, object_coord_gt, object_coord_test, profiler=NULL_PROFILER, H=None):
+    """
+    Geometric comparison of a frame accepted in both gt and test.
+    `H` is the homography from gt to target, computed if not given.
+    Returns a FrameEvalResult, and a flag telling if the test polygon was 
+    self-intersecting (then assuming null surfaces).
+    """
+    # 1-2/ Project test result in target referential
+    with profiler.stage("homography"):
+        test_coords = projectToTarget(object_coord_gt, object_coord_test, target.coords, H)
+    return evalProjected(fidx, target, test_coords, profiler)
+
+
+def projectedSurfaces(fidx, target, test_coords, profiler=NULL_PROFILER):
+    """
+    Self-intersection check of a test result projected in target referential
+    (`test_coords`, Nx1x2, N >= 3), and its intersection with the target 
+    region. Returns (self_intersecting, area_test, area_inter), surfaces being
+    null if the test polygon is self-intersecting.
+    """
+    # 3/ Compute intersection between target region and test result region
+    # poly = Polygon.Polygon([(0,0),(1,0),(0,1)])
+    with profiler.stage("selfintersection"):
+        poly_target = target.polygon(fidx)
+        area_target = target.area(fidx)
+        poly_test = Polygon.Polygon(test_coords.reshape(-1,2))
+        self_intersecting = isSelfIntersecting(poly_test)
+
+    with profiler.stage("intersection"):
+        area_test = area_inter = 0.0
+        if not self_intersecting:
+            area_test, area_inter = intersectionSurfaces(poly_target, poly_test, area_target)
+
+        # Polygon.IO.writeSVG('polys.svg', [poly_target, poly_test, poly_inter]) # dbg
+    return self_intersecting, area_test, area_inter
+
+
+def surfacesFrameResult(fidx, target, self_intersecting, area_test, area_inter):
+    """FrameEvalResult of a frame accepted in both gt and test, from its surfaces (see `projectedSurfaces`)."""
+    fr = FrameEvalResult(index=fidx)
+    fr.match_type = TRUE_ACCEPTED_STR
+    if self_intersecting:
+        logger.warning("frame %03d: Test result polygon is self intersecting. Assuming null surfaces instead.", fidx)
+        # TODO log errors and suspicious frames in result file!
+
+    # 4-5/ Compute segmentation precision and recall
+    precision_frame, recall_frame, jaccard_index = segmentationScores(fidx, target.area(fidx), area_test, area_inter)
+    fr.segmentation_precision = precision_frame
+    fr.segmentation_recall = recall_frame
+    fr.jaccard_index_segonly = jaccard_index
+    fr.jaccard_index_smartdoc = jaccard_index
+    fr.surfaces = SegSurfaces(
+                    test=area_test,
+                    intersection=area_inter)
+    logger.debug("\tsegmentation quality: prec=%f ; rec=%f ; ji=%f", 
+        precision_frame, recall_frame, jaccard_index)
+    return fr
+
+
+def evalProjected(fidx, target, test_coords, profiler=NULL_PROFILER):
+    """
+    Geometric comparison of a frame accepted in both gt and test, once the
+    test result is projected in target referential (`test_coords`, Nx1x2, 
+    N >= 3).
+    Same results as `evalTrueAccept`.
+    """
+    self_intersecting, area_test, area_inter = projectedSurfaces(fidx, target, test_coords, profiler)
+    return surfacesFrameResult(fidx, target, self_intersecting, area_test, area_inter), self_intersecting
+
+
+def evalRejections(fidx, rej_gt, rej_test):
+    """
+    Returns the FrameEvalResult of a frame rejected in gt or test, or None
+    if the frame is accepted in both (geometric comparison needed).
+    """
+    if rej_gt and rej_test:
+        logger.debug("frame %03d: correct reject \t# in gt and test", fidx)
+        fr = FrameEvalResult(index=fidx)
+        fr.match_type = TRUE_REJECTED_STR
+        fr.jaccard_index_smartdoc = 1.0
+    elif not rej_gt and rej_test:
+        logger.debug("frame %03d: false reject \t# in test but not in gt", fidx)
+        fr = FrameEvalResult(index=fidx)
+        fr.match_type = FALSE_REJECTED_STR
+        fr.jaccard_index_smartdoc = 0.0
+    elif rej_gt and not rej_test:
+        logger.debug("frame %03d: false accept \t# in gt but not in test", fidx)
+        fr = FrameEvalResult(index=fidx)
+        fr.match_type = FALSE_ACCEPTED_STR
+        fr.jaccard_index_smartdoc = 0.0
+    else:
+        logger.debug("frame %03d: true accept \t# in gt and in test", fidx)
+        fr = None
+    return fr
+
+
+def evalFrames(gt_mdl, test_mdl, profiler=NULL_PROFILER, prepared=None, projected=None, memo=None):
+    """
+    Check reject case and compute geometric match for each frame.
+    `prepared` (PreparedGroundTruth of `gt_mdl`) avoids recomputing GT data,
+    and `memo` (QuadPairMemo) repeated comparisons of the same quads.
+    If `projected` is a list, the test outline of each frame, projected in 
+    target referential (Nx2), is appended to it (None if not true accepted).
+    Returns the list of FrameEvalResult and the count of self-intersecting 
+    test polygons.
+    """
     if len(gt_mdl.segmentation_results) != len(test_mdl.segmentation_results):
         err = "ERROR: Number of frames is different in ground truth and test result XML files."
         logger.error(err)
         raise Exception(err)
 
-    # Check reject case and compute geometric match
-    frame_prec_acc = 0.0
-    frame_rec_acc = 0.0
-    frame_ji_smartdoc_acc = 0.0
-    frame_ji_seg_acc = 0.0
-    jaccard_index_smartdoc = 0.0
-    jaccard_index_segonly = 0.0
-    count_true_accept = 0
-    count_false_accept = 0
-    count_true_reject = 0
-    count_false_reject = 0
-
+    if prepared is None:
+        target = TargetRegion(gt_mdl.object_shape)
+    else:
+        target = prepared.target
+    frame_results = []
     error_selfintersections_count = 0 # polygons self-intersection count (errors)
 
     for idx in range(0, len(gt_mdl.segmentation_results)):
@@ -145,243 +381,336 @@ def main(argv=None):
         fidx = idx+1
         # logger.error("frame %03d" % fidx) # dbg
 
-        fr = FrameEvalResult(index=fidx)
-
         # TODO change vocabulary? use containsObject(ref)? build another joining generator?
-        rej_gt = frame_gt.rejected
-        rej_test = frame_test.rejected
+        fr = evalRejections(fidx, frame_gt.rejected, frame_test.rejected)
+        test_coords = None
+        if fr is None:
+        # not rej_gt and not rej_test => we have to compare unwarped shapes
+            if frame_gt.objects or frame_test.objects:
+                err = "frame %03d: multi-object results are not supported, use eval_multi.py." % fidx
+                logger.error(err)
+                raise ValueError(err)
+            # (same as evalTrueAccept, keeping projected coordinates)
+            object_coord_gt = frameCoords(frame_gt) if prepared is None else prepared.frameCoords(idx)
+            object_coord_test = outlineCoords(frame_test)
+            entry = None
+            if memo is not None:
+                key = memo.key(target, object_coord_gt, object_coord_test)
+                entry = memo.get(key)
+                profiler.count("memo_miss" if entry is None else "memo_hit")
+            if entry is None:
+                with profiler.stage("homography"):
+                    test_coords = projectToTarget(object_coord_gt, object_coord_test, target.coords,
+                                                  prepared.homography(idx) if prepared is not None else None)
+                entry = (test_coords,) + projectedSurfaces(fidx, target, test_coords, profiler)
+                if memo is not None:
+                    memo.put(key, entry)
+            test_coords, self_intersecting, area_test, area_inter = entry
+            fr = surfacesFrameResult(fidx, target, self_intersecting, area_test, area_inter)
+            if self_intersecting:
+                error_selfintersections_count += 1
+                profiler.count("self_intersecting_test_polygons")
+        if projected is not None:
+            projected.append(None if test_coords is None else test_coords.reshape(-1, 2))
+        profiler.count(fr.match_type)
+        # Keep current result
+        frame_results.append(fr)
+
+    return frame_results, error_selfintersections_count
+
+
+def computeGlobalResults(frame_results):
+    """
+    list(FrameEvalResult) ---> GlobalEvalResults
+
+    Aggregate frame results into the global results of a sample.
+    """
+    frame_prec_acc = 0.0
+    frame_rec_acc = 0.0
+    frame_ji_smartdoc_acc = 0.0
+    frame_ji_seg_acc = 0.0
+    count_true_accept = 0
+    count_false_accept = 0
+    count_true_reject = 0
+    count_false_reject = 0
 
-        if rej_gt and rej_test:
-            logger.debug("frame %03d: correct reject \t# in gt and test" % fidx)
+    for fr in frame_results:
+        if fr.match_type == TRUE_ACCEPTED_STR:
+            count_true_accept += 1
+            frame_prec_acc += fr.segmentation_precision
+            frame_rec_acc  += fr.segmentation_recall
+            frame_ji_smartdoc_acc  += fr.jaccard_index_smartdoc
+            frame_ji_seg_acc += fr.jaccard_index_segonly
+        elif fr.match_type == TRUE_REJECTED_STR:
             count_true_reject += 1
-            fr.match_type = TRUE_REJECTED_STR
-            jaccard_index = 1.0
-            fr.jaccard_index_smartdoc = 1.0
-            frame_ji_smartdoc_acc  += jaccard_index
-        elif not rej_gt and rej_test:
-            logger.debug("frame %03d: false reject \t# in test but not in gt" % fidx)
-            count_false_reject += 1
-            fr.match_type = FALSE_REJECTED_STR
-            # jaccard_index = 0.0
-            fr.jaccard_index_smartdoc = 0.0
-            # frame_ji_smartdoc_acc  += jaccard_index
-        elif rej_gt and not rej_test:
-            logger.debug("frame %03d: false accept \t# in gt but not in test" % fidx)
+            frame_ji_smartdoc_acc  += fr.jaccard_index_smartdoc
+        elif fr.match_type == FALSE_ACCEPTED_STR:
             count_false_accept += 1
-            fr.match_type = FALSE_ACCEPTED_STR
-            # jaccard_index = 0.0
-            fr.jaccard_index_smartdoc = 0.0
-            # frame_ji_smartdoc_acc  += jaccard_index
         else:
-        # not rej_gt and not rej_test => we have to compare unwarped shapes
-            logger.debug("frame %03d: true accept \t# in gt and in test" % fidx)
-            count_true_accept +=1
-            fr.match_type = TRUE_ACCEPTED_STR
-
-            object_coord_gt = np.float32([[frame_gt.points['tl'].x,
-                                           frame_gt.points['tl'].y,
-                                           frame_gt.points['bl'].x,
-                                           frame_gt.points['bl'].y,
-                                           frame_gt.points['br'].x,
-                                           frame_gt.points['br'].y,
-                                           frame_gt.points['tr'].x,
-                                           frame_gt.points['tr'].y]])
-            object_coord_test = np.float32([[frame_test.points['tl'].x,
-                                             frame_test.points['tl'].y,
-                                             frame_test.points['bl'].x,
-                                             frame_test.points['bl'].y,
-                                             frame_test.points['br'].x,
-                                             frame_test.points['br'].y,
-                                             frame_test.points['tr'].x,
-                                             frame_test.points['tr'].y]])
-
-            # 1/ Compute Ĥ = perfect homography from gt frame coordinates to target coordinates
-            H = cv2.getPerspectiveTransform(object_coord_gt.reshape(-1, 1, 2), object_coord_target.reshape(-1, 1, 2))
-            
-            # 2/ Apply to test result to project in target referential
-            test_coords = cv2.perspectiveTransform(object_coord_test.reshape(-1, 1, 2), H)
-
-            # 3/ Compute intersection between target region and test result region
-            # poly = Polygon.Polygon([(0,0),(1,0),(0,1)])
-            poly_target = Polygon.Polygon(object_coord_target.reshape(-1,2))
-            poly_test = Polygon.Polygon(test_coords.reshape(-1,2))
-            poly_inter = None
-
-            area_target = area_test = area_inter = area_union = 0.0
-            # (sadly, we must check for self-intersecting polygons which mess the interection computation)
-            # logger.error("~~~ poly_target %s" % poly_target) # dbg
-            if isSelfIntersecting(poly_target):
-                msg = "frame %03d: Ground truth polygon is self intersecting. Aborting evaluation." % fidx
-                logger.error(msg)
-                raise ValueError(msg)
-            area_target = poly_target.area()
-
-            # logger.error("~~~ poly_test %s" % poly_test) # dbg
-            if isSelfIntersecting(poly_test) :
-                reject_shape = True
-                error_selfintersections_count += 1
-                logger.warning("frame %03d: Test result polygon is self intersecting. Assuming null surfaces instead." % fidx)
-                # TODO log errors and suspicious frames in result file!
-            else :
-                # logger.error("~~~ poly_inter %s" % poly_inter) # dbg
-                poly_inter = poly_target & poly_test
-                # Polygon.IO.writeSVG('_tmp/polys-%03d.svg'%fidx, [poly_target, poly_test, poly_inter]) # dbg
-                # poly_inter should not self-intersect, but may have more than 1 contour
-                area_test = poly_test.area()
-                area_inter = poly_inter.area()
-
-                # Little hack to cope with float precision issues when dealing with polygons:
-                #   If intersection area is close enough to target area or GT area, but slighlty >,
-                #   then fix it, assuming it is due to rounding issues.
-                area_min = min(area_target, area_test)
-                if area_min < area_inter and area_min * 1.0000000001 > area_inter :
-                    area_inter = area_min
-                    logger.debug("Capping area_inter.")
-                
-            area_union = area_test + area_target - area_inter
-
-            # Polygon.IO.writeSVG('polys.svg', [poly_target, poly_test, poly_inter]) # dbg
-
-            # 4-5/ Compute segmentation precision and recall
-            precision_frame = 0.0
-            recall_frame    = 0.0
-            if area_test == 0:
-                # Actually, it's only the precision which is undefined, but we can extend the domain
-                # considering the limit:
-                # lim_(x->0) 0/x = 0 ## http://www.wolframalpha.com/input/?i=lim+0%2Fx+as+x-%3E0
-                logger.warning("frame %03d: Test area surface is null. Setting segmentation precision and recall to 0." % fidx)
-            else:
-                precision_frame = area_inter / area_test
-                recall_frame = area_inter / area_target
-                if area_target < area_inter or area_test < area_inter:
-                    msg = "frame %03d: area_inter is bigger than area_target or area_test." % (fidx, )
-                    logger.error(msg)
-                    logger.debug("area_target = %f (%s) ; area_test = %f (%s) ; area_inter = %f (%s)" 
-                            % (area_target, float.hex(area_target), area_test, float.hex(area_test), area_inter, float.hex(area_inter)))
-                    raise ValueError(msg)
-                if precision_frame < 0.0 or precision_frame > 1.0:
-                    msg = "frame %03d: precision_frame = %f not in [0.0, 1.0]." % (fidx, precision_frame)
-                    logger.error(msg)
-                    logger.debug("area_target = %f (%s) ; area_test = %f (%s) ; area_inter = %f (%s)" 
-                            % (area_target, float.hex(area_target), area_test, float.hex(area_test), area_inter, float.hex(area_inter)))
-                    raise ValueError(msg)
-                if recall_frame < 0.0 or recall_frame > 1.0:
-                    msg = "frame %03d: recall_frame = %f not in [0.0, 1.0]." % (fidx, recall_frame)
-                    logger.error(msg)
-                    logger.debug("area_target = %f (%s) ; area_test = %f (%s) ; area_inter = %f (%s)" 
-                            % (area_target, float.hex(area_target), area_test, float.hex(area_test), area_inter, float.hex(area_inter)))
-                    raise ValueError(msg)
-
-                # assert (0.0 <= precision_frame and precision_frame <= 1.0), "Segmentation precision must be in [0.0, 1.0]."
-                # assert (0.0 <= recall_frame and recall_frame <= 1.0), "Segmentation recall must be in [0.0, 1.0]."
-            jaccard_index = area_inter / area_union
-            fr.segmentation_precision = precision_frame
-            fr.segmentation_recall = recall_frame
-            fr.jaccard_index_segonly = jaccard_index
-            fr.jaccard_index_smartdoc = jaccard_index
-            fr.surfaces = SegSurfaces(
-                            test=area_test,
-                            intersection=area_inter)
-
-            frame_prec_acc += precision_frame
-            frame_rec_acc  += recall_frame
-            frame_ji_smartdoc_acc  += jaccard_index
-            frame_ji_seg_acc += jaccard_index
-            logger.debug("\tsegmentation quality: prec=%f ; rec=%f ; ji=%f" 
-                % (precision_frame, recall_frame, jaccard_index))
-        # /if true accept
-        # Keep current result
-        evalRes_mdl.frame_results.append(fr)
-    # --------------------------------------------------------------------------
+            count_false_reject += 1
 
     # Prepare final score
-    # evalRes_mdl.results.global_score MUST be configured after
-    count_total = len(evalRes_mdl.frame_results)
-    evalRes_mdl.global_results = GlobalEvalResults()
-    evalRes_mdl.global_results.count_total_frames = count_total
-    evalRes_mdl.global_results.count_true_accepted_frames = count_true_accept
-    evalRes_mdl.global_results.count_true_rejected_frames = count_true_reject
-    evalRes_mdl.global_results.count_false_accepted_frames = count_false_accept
-    evalRes_mdl.global_results.count_false_rejected_frames = count_false_reject
+    count_total = len(frame_results)
+    global_results = GlobalEvalResults()
+    global_results.count_total_frames = count_total
+    global_results.count_true_accepted_frames = count_true_accept
+    global_results.count_true_rejected_frames = count_true_reject
+    global_results.count_false_accepted_frames = count_false_accept
+    global_results.count_false_rejected_frames = count_false_reject
 
     # Detection precision/recall for full sample (sequence of frames)
     count_expected = count_true_accept + count_false_reject
     count_retrieved = count_true_accept + count_false_accept
 
-    evalRes_mdl.global_results.detection_precision = 0.0
+    global_results.detection_precision = 0.0
     if count_retrieved > 0:
-        evalRes_mdl.global_results.detection_precision = float(count_true_accept) / count_retrieved
+        global_results.detection_precision = float(count_true_accept) / count_retrieved
     else:
-        logger.warn("No frame accepted. Full sample precision set to %f" % evalRes_mdl.global_results.detection_precision)
+        logger.warn("No frame accepted. Full sample precision set to %f", global_results.detection_precision)
 
-    evalRes_mdl.global_results.detection_recall = 0.0
+    global_results.detection_recall = 0.0
     if count_expected > 0:
-        evalRes_mdl.global_results.detection_recall = float(count_true_accept) / count_expected
+        global_results.detection_recall = float(count_true_accept) / count_expected
     else:
-        logger.error("Cannot compute full sample recall if ground truth contains no accepted frame! Recall set to %f"
-            % evalRes_mdl.global_results.detection_recall)
+        logger.error("Cannot compute full sample recall if ground truth contains no accepted frame! Recall set to %f",
+            global_results.detection_recall)
 
     # Precision/recall averaged for frames
-    evalRes_mdl.global_results.mean_segmentation_precision = 0.0
-    evalRes_mdl.global_results.mean_segmentation_recall    = 0.0
+    global_results.mean_segmentation_precision = 0.0
+    global_results.mean_segmentation_recall    = 0.0
     if count_true_accept > 0:
-        evalRes_mdl.global_results.mean_segmentation_precision = frame_prec_acc / count_true_accept
-        evalRes_mdl.global_results.mean_segmentation_recall    = frame_rec_acc / count_true_accept
+        global_results.mean_segmentation_precision = frame_prec_acc / count_true_accept
+        global_results.mean_segmentation_recall    = frame_rec_acc / count_true_accept
     else:
-        logger.warn("Cannot compute mean segmentation precision and recall if nothing was accepted! Precision set to %f ; recall set to %f" 
-            % (evalRes_mdl.global_results.mean_segmentation_precision, evalRes_mdl.global_results.mean_segmentation_recall))
+        logger.warn("Cannot compute mean segmentation precision and recall if nothing was accepted! Precision set to %f ; recall set to %f", 
+            global_results.mean_segmentation_precision, global_results.mean_segmentation_recall)
 
     # Jaccard index averaged
-    evalRes_mdl.global_results.mean_jaccard_index_smartdoc = frame_ji_smartdoc_acc / count_total
+    global_results.mean_jaccard_index_smartdoc = frame_ji_smartdoc_acc / count_total
 
     if count_retrieved > 0:
-        evalRes_mdl.global_results.mean_jaccard_index_segonly  = frame_ji_seg_acc / count_retrieved
+        global_results.mean_jaccard_index_segonly  = frame_ji_seg_acc / count_retrieved
     else:
-        evalRes_mdl.global_results.mean_jaccard_index_segonly  = 0.0
-        logger.error("Cannot compute JI for segmentation if nothing was accepted! ji_segonly set to %f" 
-                % evalRes_mdl.global_results.mean_jaccard_index_segonly)
-
+        global_results.mean_jaccard_index_segonly  = 0.0
+        logger.error("Cannot compute JI for segmentation if nothing was accepted! ji_segonly set to %f", 
+                global_results.mean_jaccard_index_segonly)
+
+    return global_results
+
+
+def computeTemporalResults(frame_results, test_mdl, projected, window=TEMPORAL_WINDOW):
+    """
+    list(FrameEvalResult) x SegResult x list(np.float32 (Nx2) or None) x int ---> TemporalEvalResults
+
+    Temporal stability of a sample, from its frame results and the test 
+    outlines projected in target referential (see `evalFrames`).
+    """
+    ji = np.array([fr.jaccard_index_smartdoc for fr in frame_results])
+    failures = np.array([fr.match_type in (FALSE_ACCEPTED_STR, FALSE_REJECTED_STR) for fr in frame_results])
+    accepted = np.array([not frame.rejected for frame in test_mdl.segmentation_results])
+    displacements = vertexDisplacements(projected)
+    displacements = displacements[~np.isnan(displacements)]
+    variances = rollingVariance(ji, window)
+
+    temporal_results = TemporalEvalResults(window=window)
+    temporal_results.count_displacement_pairs = len(displacements)
+    temporal_results.mean_corner_displacement = float(displacements.mean()) if len(displacements) else 0.0
+    temporal_results.max_corner_displacement = float(displacements.max()) if len(displacements) else 0.0
+    temporal_results.mean_rolling_ji_variance = float(variances.mean()) if len(variances) else 0.0
+    temporal_results.max_rolling_ji_variance = float(variances.max()) if len(variances) else 0.0
+    temporal_results.count_accept_reject_flips = countFlips(accepted)
+    temporal_results.longest_failure_streak = longestRun(failures)
+    return temporal_results
+
+
+def createEvalResult(groundtruth_file, testresult_file):
+    """Create an empty result model for the evaluation of `testresult_file`."""
+    evalRes_mdl = EvalResult(
+            version="0.3",
+            software_used=Software(
+                    name="SegEval",
+                    version=PROG_VERSION))
 
-    # --------------------------------------------------------------------------
-    logger.debug("--- Process complete. ---")
+    evalRes_mdl.source_files = EvalSourceFiles(
+                groundtruth_file=groundtruth_file,
+                segresult_file=testresult_file)
+    return evalRes_mdl
+
+
+def evaluate(gt_mdl, test_mdl, groundtruth_file, testresult_file, profiler=NULL_PROFILER, prepared=None,
+             temporal_window=TEMPORAL_WINDOW, memo=None):
+    """
+    GroundTruth x SegResult x str x str ---> EvalResult, int
+
+    Evaluate a whole sample. Returns the result model and the count of 
+    self-intersecting test polygons.
+    `prepared` (PreparedGroundTruth of `gt_mdl`) avoids recomputing GT data,
+    and `memo` (QuadPairMemo) repeated frame comparisons.
+    Temporal results are not computed if `temporal_window` is None.
+    """
+    evalRes_mdl = createEvalResult(groundtruth_file, testresult_file)
+    projected = [] if temporal_window is not None else None
+    with profiler.stage("frame_loop"):
+        frame_results, error_selfintersections_count = evalFrames(gt_mdl, test_mdl, profiler, prepared, projected, memo)
+        evalRes_mdl.frame_results.extend(frame_results)
+    with profiler.stage("aggregation"):
+        evalRes_mdl.global_results = computeGlobalResults(evalRes_mdl.frame_results)
+    if temporal_window is not None:
+        with profiler.stage("temporal"):
+            evalRes_mdl.temporal_results = computeTemporalResults(evalRes_mdl.frame_results, test_mdl,
+                                                                  projected, temporal_window)
+    return evalRes_mdl, error_selfintersections_count
+
+
+def logGlobalResults(global_results, error_selfintersections_count, logger=logger):
+    """Log the final results of an evaluation."""
+    count_true_accept = global_results.count_true_accepted_frames
+    count_false_accept = global_results.count_false_accepted_frames
+    count_false_reject = global_results.count_false_rejected_frames
 
-    # Final output
     logger.debug("------------------------------")
     logger.debug("Final results")
     logger.debug("------------------------------")
     logger.debug("Segmentation quality:")
-    logger.info("\tmean frame precision  = %f" % evalRes_mdl.global_results.mean_segmentation_precision)
-    logger.info("\tmean frame recall     = %f" % evalRes_mdl.global_results.mean_segmentation_recall)
+    logger.info("\tmean frame precision  = %f", global_results.mean_segmentation_precision)
+    logger.info("\tmean frame recall     = %f", global_results.mean_segmentation_recall)
     logger.debug("------------------------------")
     logger.debug("Detection quality:")
-    logger.info("\tfull sample precision = %f" % evalRes_mdl.global_results.detection_precision)
-    logger.info("\tfull sample recall    = %f" % evalRes_mdl.global_results.detection_recall)
+    logger.info("\tfull sample precision = %f", global_results.detection_precision)
+    logger.info("\tfull sample recall    = %f", global_results.detection_recall)
     logger.debug("------------------------------")
     logger.debug("Jaccard index:")
-    logger.info("\tmean ji smartdoc = %f" % evalRes_mdl.global_results.mean_jaccard_index_smartdoc)
-    logger.info("\tmean ji seg only = %f" % evalRes_mdl.global_results.mean_jaccard_index_segonly)
+    logger.info("\tmean ji smartdoc = %f", global_results.mean_jaccard_index_smartdoc)
+    logger.info("\tmean ji seg only = %f", global_results.mean_jaccard_index_segonly)
     logger.debug("------------------------------")
     logger.debug("Frame counts:")
-    logger.info("\ttotal_frames   = %d" % evalRes_mdl.global_results.count_total_frames)
-    logger.info("\ttrue_accepted  = %d" % evalRes_mdl.global_results.count_true_accepted_frames)
-    logger.info("\ttrue_rejected  = %d" % evalRes_mdl.global_results.count_true_rejected_frames)
-    logger.info("\tfalse_accepted = %d" % evalRes_mdl.global_results.count_false_accepted_frames)
-    logger.info("\tfalse_rejected = %d" % evalRes_mdl.global_results.count_false_rejected_frames)
+    logger.info("\ttotal_frames   = %d", global_results.count_total_frames)
+    logger.info("\ttrue_accepted  = %d", global_results.count_true_accepted_frames)
+    logger.info("\ttrue_rejected  = %d", global_results.count_true_rejected_frames)
+    logger.info("\tfalse_accepted = %d", global_results.count_false_accepted_frames)
+    logger.info("\tfalse_rejected = %d", global_results.count_false_rejected_frames)
     logger.debug("- - - - - - - - - - - - - - - ")
     logger.debug("Note:")
-    logger.debug("\texpected  = true_accept + false_reject = %d" % (count_true_accept + count_false_reject))
-    logger.debug("\tretrieved = true_accept + false_accept = %d" % (count_true_accept + count_false_accept))
+    logger.debug("\texpected  = true_accept + false_reject = %d", (count_true_accept + count_false_reject))
+    logger.debug("\tretrieved = true_accept + false_accept = %d", (count_true_accept + count_false_accept))
     logger.debug("")
     if error_selfintersections_count > 0:
-        logger.warning("Seg. results contain self-intersecting polygons in %d frame(s)."
-                        % error_selfintersections_count)
+        logger.warning("Seg. results contain self-intersecting polygons in %d frame(s).",
+                        error_selfintersections_count)
         logger.warning("\tResults assume seg. prec. and rec. = 0 for those cases.")
         logger.debug("")
 
 
+def logTemporalResults(temporal_results, logger=logger):
+    """Log the temporal results of an evaluation."""
+    logger.debug("------------------------------")
+    logger.debug("Temporal stability (window = %d frames):", temporal_results.window)
+    logger.info("\tmean corner displacement = %f", temporal_results.mean_corner_displacement)
+    logger.info("\tmax corner displacement  = %f", temporal_results.max_corner_displacement)
+    logger.info("\tmean rolling ji variance = %f", temporal_results.mean_rolling_ji_variance)
+    logger.info("\tmax rolling ji variance  = %f", temporal_results.max_rolling_ji_variance)
+    logger.info("\taccept/reject flips      = %d", temporal_results.count_accept_reject_flips)
+    logger.info("\tlongest failure streak   = %d", temporal_results.longest_failure_streak)
+    logger.debug("")
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Evaluate the page segmentation results for a given video sequence.', 
+        version=PROG_VERSION,
+        epilog="""Segmentation and detection precision and recall are computed separately."""
+    )
+
+    parser.add_argument('groundtruth_file',
+        action=StoreValidFilePath,
+        help="File containing ground truth segmentation and object reference.")
+    parser.add_argument('testresult_file', 
+        action=StoreValidFilePath,
+        help="File containing ground truth segmentation and object reference.")
+    addLoggingArguments(parser)
+    addPrettyPrintArgument(parser)
+    parser.add_argument('-o', '--output-file', 
+        help="Optionnal path to output file.")
+    parser.add_argument('-c', '--compact',
+        action='store_true',
+        help="Write frame results to a binary sidecar file (OUTPUT_FILE with '.npz' extension) \
+              instead of the XML output file. Requires '-o'.")
+    parser.add_argument('--temporal-window', metavar="FRAMES",
+        action=StoreIntZeroPositive, default=TEMPORAL_WINDOW,
+        help="Number of frames (>= 2) of the sliding windows used for temporal stability measures.")
+    parser.add_argument('--memo-size', metavar="ENTRIES",
+        action=StoreIntZeroPositive, default=MEMO_SIZE,
+        help="Number of frame comparisons (ground truth quad, test quad, object shape) memoized \
+              for repeated quads (0 to disable).")
+    parser.add_argument('--memo-quantum', metavar="PIXELS",
+        type=float, default=0.0,
+        help="Coordinates are rounded to multiples of this value in memo keys: close quads \
+              share results (0: exact coordinates, results are unchanged).")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    if args.compact and args.output_file is None:
+        parser.error("--compact requires an output file (-o).")
+    if args.memo_quantum < 0:
+        parser.error("--memo-quantum must be >= 0.")
+    if args.temporal_window < 2:
+        parser.error("--temporal-window must be >= 2 (variance over a single frame is always 0).")
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+    
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # -----------------------------------------------------------------------------
+    logger.debug("Starting up")
+
+    # Let's go
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    # --------------------------------------------------------------------------
+
+    profiler = createProfiler(args.profile, "eval_seg", PROG_VERSION, args.memprofile)
+    profiler.info("groundtruth_file", args.groundtruth_file)
+    profiler.info("testresult_file", args.testresult_file)
+
+    # Input files models
+    with profiler.stage("gt_load"):
+        gt_mdl = GroundTruth.loadFromFile(args.groundtruth_file)
+    with profiler.stage("test_load"):
+        test_mdl = SegResult.loadFromFile(args.testresult_file)
+
+    memo = QuadPairMemo(args.memo_size, args.memo_quantum) if args.memo_size > 0 else None
+    evalRes_mdl, error_selfintersections_count = evaluate(gt_mdl, test_mdl, 
+                                                          args.groundtruth_file, args.testresult_file,
+                                                          profiler, temporal_window=args.temporal_window,
+                                                          memo=memo)
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process complete. ---")
+
+    logGlobalResults(evalRes_mdl.global_results, error_selfintersections_count)
+    logTemporalResults(evalRes_mdl.temporal_results)
+
     # Export the XML structure to file if needed
     if args.output_file is not None:
-        evalRes_mdl.exportToFile(args.output_file, pretty_print=output_prettyprint)
+        with profiler.stage("export"):
+            if args.compact:
+                exportCompact(evalRes_mdl, args.output_file, pretty_print=args.pretty_print)
+            else:
+                evalRes_mdl.exportToFile(args.output_file, pretty_print=args.pretty_print)
+
+    if args.profile is not None:
+        profiler.write(args.profile)
 
     logger.debug("Clean exit.")
     logger.debug(DBGSEP)
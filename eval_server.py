@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Persistent evaluation server.
+
+Keeps parsed ground truth files (and the data derived from them: target
+region, homographies) in memory, and evaluates segmentation results sent as
+JSON lines, either on stdin (answers on stdout) or through a Unix socket.
+
+Job (one JSON object per line):
+    {"id": "anything",                        # optional, echoed in the answer
+     "gt": "background01/paper004",            # ground truth id (see --gt-root)
+     "segresult": "PATH/TO/SAMPLE.segresult.xml",
+     "segresult_xml": "<seg_result ...>...",   # inline data, instead of "segresult"
+     "frames": false}                          # also return frame results
+Answer (one JSON object per line):
+    {"id": ..., "status": "ok", "global_results": {...},
+     "temporal_results": {...}, "frame_results": [...], "self_intersecting_frames": 0,
+     "gt_cache_hit": true, "time": 0.012}
+or  {"id": ..., "status": "error", "error": "message"}
+
+Jobs are dispatched to worker processes according to their ground truth id,
+so that each ground truth is only cached by one worker.
+Jobs read on stdin are evaluated "--jobs" at a time too (answers keep the
+order of the jobs); on the socket, each connection is served by its own
+thread. A worker process which dies is restarted, and the jobs it had not
+answered get an error answer.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import json
+import time
+import zlib
+import signal
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import Queue
+import SocketServer
+from collections import OrderedDict
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from models.models import *
+from utils.compression import resolvePath
+from utils.gtindex import GroundTruthIndex
+from utils.profiling import createProfiler, NULL_PROFILER
+from eval_seg import evaluate, PreparedGroundTruth, QuadPairMemo
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Segmentation Evaluation Server"
+
+ERRCODE_OK = 0
+
+GT_EXT = ".gt.xml"
+INLINE_SEGRESULT = "<inline>"
+
+GLOBAL_RESULTS_FIELDS = [
+    "detection_precision", "detection_recall",
+    "mean_segmentation_precision", "mean_segmentation_recall",
+    "mean_jaccard_index_smartdoc", "mean_jaccard_index_segonly",
+    "count_total_frames", "count_true_accepted_frames", "count_true_rejected_frames",
+    "count_false_accepted_frames", "count_false_rejected_frames"]
+
+TEMPORAL_RESULTS_FIELDS = [
+    "window",
+    "mean_corner_displacement", "max_corner_displacement", "count_displacement_pairs",
+    "mean_rolling_ji_variance", "max_rolling_ji_variance",
+    "count_accept_reject_flips", "longest_failure_streak"]
+
+FRAME_RESULTS_FIELDS = [
+    "index", "match_type",
+    "segmentation_precision", "segmentation_recall",
+    "jaccard_index_smartdoc", "jaccard_index_segonly"]
+
+
+# ==============================================================================
+class JobError(Exception):
+    """Invalid job: reported to the client, the server keeps running."""
+    pass
+
+
+class GroundTruthCache(object):
+    """
+    LRU cache of PreparedGroundTruth, indexed by ground truth id.
+    An entry is reloaded when its file was modified.
+    `gt_root` can also be a ground truth index file (see utils/gtindex.py):
+    ground truth data is then read from the index, which is shared by all 
+    the processes using it, and never reloaded.
+    """
+    def __init__(self, gt_root=None, size=64):
+        self._gt_root = os.path.abspath(gt_root) if gt_root is not None else None
+        self._index = None
+        if self._gt_root is not None and not os.path.isdir(self._gt_root):
+            self._index = GroundTruthIndex(self._gt_root)
+        self._size = max(1, size)
+        self._entries = OrderedDict() # gt_id -> (mtime, PreparedGroundTruth)
+
+    def path(self, gt_id):
+        """Path of the ground truth file of `gt_id` ("INDEX_FILE:BACKGROUND/DOCUMENT" with an index)."""
+        if self._gt_root is None:
+            return gt_id
+        path = gt_id if gt_id.endswith(GT_EXT) else gt_id + GT_EXT
+        path = os.path.normpath(os.path.join(self._gt_root, path))
+        if not path.startswith(self._gt_root + os.sep):
+            raise JobError("Ground truth id '%s' is outside of the ground truth root." % gt_id)
+        if self._index is not None:
+            return "%s:%s" % (self._gt_root, path[len(self._gt_root + os.sep):-len(GT_EXT)])
+        return resolvePath(path)
+
+    def _indexKey(self, gt_id):
+        key = tuple(self.path(gt_id).rsplit(":", 1)[1].split(os.sep))
+        if key not in self._index:
+            raise JobError("No ground truth for id '%s' in index." % gt_id)
+        return key
+
+    def get(self, gt_id):
+        """Returns (PreparedGroundTruth, cache_hit)."""
+        if self._index is not None:
+            key = self._indexKey(gt_id)
+            mtime = None # the index is never reloaded
+        else:
+            path = self.path(gt_id)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                raise JobError("No ground truth file for id '%s'." % gt_id)
+        entry = self._entries.pop(gt_id, None)
+        hit = entry is not None and entry[0] == mtime
+        if not hit:
+            if self._index is not None:
+                entry = (mtime, PreparedGroundTruth(self._index.get(*key)))
+            else:
+                logger.debug("Loading ground truth '%s'.", path)
+                entry = (mtime, PreparedGroundTruth(GroundTruth.loadFromFile(path)))
+        self._entries[gt_id] = entry
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+        return entry[1], hit
+
+
+def modelFields(mdl, fields):
+    return OrderedDict((f, getattr(mdl, f)) for f in fields)
+
+
+def frameResultToDict(fr):
+    res = modelFields(fr, FRAME_RESULTS_FIELDS)
+    if fr.surfaces is not None:
+        res["surfaces"] = OrderedDict([
+            ("test", fr.surfaces.test),
+            ("intersection", fr.surfaces.intersection)])
+    return res
+
+
+def processJob(cache, job, memo=None, profiler=NULL_PROFILER):
+    """
+    Evaluate a job (dict) using the ground truth `cache` (and the frame
+    comparison `memo`, if any), returns the answer (dict).
+    """
+    time0 = time.time()
+    answer = OrderedDict([("id", job.get("id"))])
+    try:
+        gt_id = job.get("gt")
+        if not gt_id:
+            raise JobError("Missing 'gt' in job.")
+        with profiler.stage("gt_load"):
+            prepared, hit = cache.get(gt_id)
+        profiler.count("gt_cache_hit" if hit else "gt_cache_miss")
+
+        with profiler.stage("test_load"):
+            if job.get("segresult_xml") is not None:
+                segresult_file = INLINE_SEGRESULT
+                test_mdl = SegResult.loadFromString(job["segresult_xml"])
+            elif job.get("segresult") is not None:
+                segresult_file = resolvePath(job["segresult"])
+                if not os.path.isfile(segresult_file):
+                    raise JobError("'%s' does not exist or is not a file." % segresult_file)
+                test_mdl = SegResult.loadFromFile(segresult_file)
+            else:
+                raise JobError("Missing 'segresult' or 'segresult_xml' in job.")
+
+        evalRes_mdl, selfint_count = evaluate(prepared.mdl, test_mdl,
+                                              cache.path(gt_id), segresult_file,
+                                              profiler=profiler, prepared=prepared, memo=memo)
+        answer["status"] = "ok"
+        answer["global_results"] = modelFields(evalRes_mdl.global_results, GLOBAL_RESULTS_FIELDS)
+        answer["temporal_results"] = modelFields(evalRes_mdl.temporal_results, TEMPORAL_RESULTS_FIELDS)
+        if job.get("frames"):
+            answer["frame_results"] = [frameResultToDict(fr) for fr in evalRes_mdl.frame_results]
+        answer["self_intersecting_frames"] = selfint_count
+        answer["gt_cache_hit"] = hit
+    except Exception, e:
+        if not isinstance(e, JobError):
+            logger.exception("Job %r failed.", job.get("id"))
+        answer["status"] = "error"
+        answer["error"] = str(e)
+        profiler.count("failed_jobs")
+    answer["time"] = time.time() - time0
+    return answer
+
+
+def parseJob(line):
+    """JSON line ---> dict, raises JobError."""
+    try:
+        job = json.loads(line)
+    except ValueError, e:
+        raise JobError("Invalid JSON: %s" % e)
+    if not isinstance(job, dict):
+        raise JobError("A job must be a JSON object.")
+    return job
+
+
+# ==============================================================================
+# Executors
+
+class InlineExecutor(object):
+    """
+    Evaluates jobs in the server process (one at a time).
+    With `profile` ((path, memory) tuple), stages of all the jobs are
+    profiled, and the record is written when the executor is closed.
+    """
+    def __init__(self, gt_root, cache_size, profile=None):
+        self._cache = GroundTruthCache(gt_root, cache_size)
+        self._memo = QuadPairMemo()
+        self._lock = threading.Lock()
+        self._profile = profile
+        self._profiler = createProfiler(profile[0], "eval_server", PROG_VERSION, profile[1]) \
+                         if profile is not None else NULL_PROFILER
+
+    def submit(self, job):
+        with self._lock:
+            return processJob(self._cache, job, self._memo, self._profiler)
+
+    def close(self):
+        if self._profile is not None:
+            self._profiler.write(self._profile[0])
+
+
+def _workerLoop(gt_root, cache_size, jobs, answers, profile=None):
+    # Ctrl-C is handled by the server, which then stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cache = GroundTruthCache(gt_root, cache_size)
+    memo = QuadPairMemo()
+    profiler = NULL_PROFILER
+    if profile is not None: # one record per worker process
+        profiler = createProfiler(profile[0], "eval_server", PROG_VERSION, profile[1])
+        profiler.info("worker", multiprocessing.current_process().name)
+    while True:
+        item = jobs.get()
+        if item is None:
+            break
+        (ticket, job) = item
+        answers.put((ticket, processJob(cache, job, memo, profiler)))
+    if profile is not None:
+        profiler.write(profile[0])
+
+
+class WorkerPool(object):
+    """
+    Evaluates jobs in worker processes. A job always goes to the same worker
+    for a given ground truth id (each worker has its own cache). A worker
+    which dies (ex: killed when out of memory) is restarted, and the jobs it
+    had not answered fail.
+    With `profile` ((path, memory) tuple), each worker writes its own
+    profiling record when it stops.
+    """
+    def __init__(self, workers, gt_root, cache_size, profile=None):
+        self._gt_root = gt_root
+        self._cache_size = cache_size
+        self._profile = profile
+        self._answers = multiprocessing.Queue()
+        self._queues = [None] * workers
+        self._processes = [None] * workers
+        self._lock = threading.Lock()
+        for w in range(workers):
+            self._startWorker(w)
+        self._next_ticket = 0
+        self._pending = {} # ticket -> [Event, answer, worker, job id]
+        self._collector = threading.Thread(target=self._collect, name="answer-collector")
+        self._collector.daemon = True
+        self._collector.start()
+
+    def _startWorker(self, w):
+        jobs = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_workerLoop, name="eval-worker-%d" % w,
+                                       args=(self._gt_root, self._cache_size, jobs, self._answers,
+                                             self._profile))
+        proc.daemon = True
+        proc.start()
+        self._queues[w] = jobs
+        self._processes[w] = proc
+
+    def _collect(self):
+        while True:
+            item = self._answers.get()
+            if item is None:
+                break
+            (ticket, answer) = item
+            with self._lock:
+                waiter = self._pending.pop(ticket, None)
+            if waiter is None: # already failed, its worker died
+                continue
+            waiter[1] = answer
+            waiter[0].set()
+
+    def _checkWorker(self, w):
+        """Restart the worker `w` if it died, failing its pending jobs."""
+        with self._lock:
+            proc = self._processes[w]
+            if proc.is_alive():
+                return
+            logger.error("Worker %s died (exit code %s), restarting it.", proc.name, proc.exitcode)
+            for (ticket, waiter) in self._pending.items():
+                if waiter[2] == w:
+                    del self._pending[ticket]
+                    waiter[1] = OrderedDict([("id", waiter[3]), ("status", "error"),
+                                             ("error", "Worker died (exit code %s)." % proc.exitcode)])
+                    waiter[0].set()
+            # (the queue of a dead worker may be left locked)
+            self._startWorker(w)
+
+    def submit(self, job):
+        gt_id = job.get("gt")
+        if isinstance(gt_id, unicode):
+            gt_id = gt_id.encode("utf-8")
+        worker = (zlib.crc32(str(gt_id)) & 0xffffffff) % len(self._queues)
+        self._checkWorker(worker)
+        waiter = [threading.Event(), None, worker, job.get("id")]
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._pending[ticket] = waiter
+            self._queues[worker].put((ticket, job))
+        while not waiter[0].wait(1.0): # (a timeout keeps the thread interruptible)
+            self._checkWorker(worker)
+        return waiter[1]
+
+    def close(self):
+        for jobs in self._queues:
+            jobs.put(None)
+        for proc in self._processes:
+            proc.join()
+        self._answers.put(None)
+        self._collector.join()
+
+
+def handleLine(executor, line):
+    """JSON line ---> JSON line (answer)."""
+    try:
+        answer = executor.submit(parseJob(line))
+    except JobError, e:
+        answer = OrderedDict([("id", None), ("status", "error"), ("error", str(e))])
+    return json.dumps(answer) + "\n"
+
+
+# ==============================================================================
+# Transports
+
+def serveStdin(executor, in_f=sys.stdin, out_f=sys.stdout, threads=1):
+    """
+    Answer the jobs read on `in_f`, `threads` jobs at a time. Answers are
+    written in the order of the jobs.
+    """
+    answers = Queue.Queue(maxsize=2 * threads) # AsyncResult of each job, in order
+
+    def writer():
+        while True:
+            result = answers.get()
+            if result is None:
+                break
+            while not result.ready():
+                result.wait(1.0)
+            out_f.write(result.get())
+            out_f.flush()
+
+    pool = ThreadPool(threads)
+    writer_thread = threading.Thread(target=writer, name="answer-writer")
+    writer_thread.daemon = True
+    writer_thread.start()
+    try:
+        for line in iter(in_f.readline, ""):
+            if not line.strip():
+                continue
+            answers.put(pool.apply_async(handleLine, (executor, line)))
+    finally:
+        answers.put(None)
+        while writer_thread.is_alive(): # (a timeout keeps the thread interruptible)
+            writer_thread.join(1.0)
+        pool.close()
+        pool.join()
+
+
+class JobRequestHandler(SocketServer.StreamRequestHandler):
+    """Answers each JSON line received on a connection."""
+    def handle(self):
+        for line in iter(self.rfile.readline, ""):
+            if not line.strip():
+                continue
+            self.wfile.write(handleLine(self.server.executor, line))
+            self.wfile.flush()
+
+
+class EvalUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, executor):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, JobRequestHandler)
+        self.executor = executor
+
+
+def serveSocket(executor, socket_path):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path) # left by a previous run
+    server = EvalUnixServer(socket_path, executor)
+    logger.info("Listening on '%s'.", socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+# ==============================================================================
+def main(argv=None):
+    # Option parsing
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Evaluate segmentation results sent as JSON lines, keeping ground truth in memory.',
+        version=PROG_VERSION,
+        epilog="""Without '--socket', jobs are read from stdin and answers written to stdout.""")
+
+    addLoggingArguments(parser)
+    parser.add_argument('-s', '--socket', metavar="SOCKET_PATH",
+        help="Listen on a Unix socket instead of reading stdin.")
+    parser.add_argument('-g', '--gt-root',
+        action=StoreValidGroundTruthRoot,
+        help="Directory of ground truth files (or ground truth index built by build_gtindex.py): \
+              the 'gt' id of a job is then the path of the file relative to this directory, \
+              with or without '%s'. Without it, 'gt' is a path." % GT_EXT)
+    parser.add_argument('-j', '--jobs',
+        action=StoreIntZeroPositive, default=multiprocessing.cpu_count(),
+        help="Number of worker processes (0 to evaluate in the server process).")
+    parser.add_argument('--cache-size',
+        action=StoreIntZeroPositive, default=64,
+        help="Number of ground truth files kept in memory by each worker.")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profile = (args.profile, args.memprofile) if args.profile is not None else None
+    if args.jobs > 0:
+        executor = WorkerPool(args.jobs, args.gt_root, args.cache_size, profile)
+    else:
+        executor = InlineExecutor(args.gt_root, args.cache_size, profile)
+
+    try:
+        if args.socket is not None:
+            serveSocket(executor, args.socket)
+        else:
+            serveStdin(executor, threads=max(1, args.jobs))
+    except KeyboardInterrupt:
+        logger.info("Interrupted.")
+    finally:
+        executor.close()
+
+    logger.debug("--- Process complete. ---")
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Evaluate many segmentation results (variants of a method, ex: threshold
+sweeps) against a single ground truth, in a single pass.
+
+Ground truth is parsed once, and GT homographies and target region are
+computed once for all variants. For each frame, the results of all variants
+are projected with a single call, and identical projected outlines (variants
+agreeing on a frame) are only compared to the target once.
+Scores are the same as the ones computed by `eval_seg.py`.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import fileinput
+import itertools # chain
+import csv
+
+import cv2
+import numpy as np
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from models.models import *
+from utils.profiling import createProfiler, NULL_PROFILER
+from utils.geometry import outlineCoords
+from eval_seg import PreparedGroundTruth, evalRejections, evalProjected, computeGlobalResults
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Segmentation Evaluation Sweep"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+
+TABLE_HEADER = [
+    "segresult_file",
+    "detection_precision",
+    "detection_recall",
+    "mean_segmentation_precision",
+    "mean_segmentation_recall",
+    "mean_jaccard_index_smartdoc",
+    "mean_jaccard_index_segonly",
+    "count_total_frames",
+    "count_true_accepted_frames",
+    "count_true_rejected_frames",
+    "count_false_accepted_frames",
+    "count_false_rejected_frames",
+    "self_intersecting_frames"]
+
+FRAME_METRICS = [
+    "jaccard_index_smartdoc",
+    "jaccard_index_segonly",
+    "segmentation_precision",
+    "segmentation_recall"]
+
+
+# ==============================================================================
+def sweepFrames(prepared, test_mdls, profiler=NULL_PROFILER):
+    """
+    PreparedGroundTruth x list(SegResult) ---> list(list(FrameEvalResult)), list(int)
+
+    Evaluate all variants, frame by frame. Returns, for each variant, the
+    list of FrameEvalResult and the count of self-intersecting test polygons.
+    FrameEvalResult objects are shared between variants with identical
+    results for a frame: do not modify them.
+    Like `eval_seg.evaluate`, multi-object frames which have to be compared
+    (neither frame rejected) are not supported: raises ValueError (use 
+    eval_multi.py on each variant instead).
+    """
+    gt_frames = prepared.mdl.segmentation_results
+    for (k, test_mdl) in enumerate(test_mdls):
+        if len(test_mdl.segmentation_results) != len(gt_frames):
+            err = "ERROR: Number of frames is different in ground truth and test result %d." % (k+1)
+            logger.error(err)
+            raise Exception(err)
+
+    frame_results = [[] for _ in test_mdls]
+    selfint_counts = [0] * len(test_mdls)
+    for idx in range(len(gt_frames)):
+        fidx = idx+1
+        rej_gt = gt_frames[idx].rejected
+        accepted = [] # variants requiring a geometric comparison
+        for (k, test_mdl) in enumerate(test_mdls):
+            frame_test = test_mdl.segmentation_results[idx]
+            fr = evalRejections(fidx, rej_gt, frame_test.rejected)
+            if fr is None:
+                if gt_frames[idx].objects or frame_test.objects:
+                    err = "frame %03d: multi-object results are not supported (test result %d), use eval_multi.py." % (fidx, k+1)
+                    logger.error(err)
+                    raise ValueError(err)
+                accepted.append(k)
+            else:
+                profiler.count(fr.match_type)
+            frame_results[k].append(fr)
+        if not accepted:
+            continue
+
+        # Project all accepted variants at once
+        with profiler.stage("homography"):
+            # (outlines can have different numbers of vertices)
+            coords = [outlineCoords(test_mdls[k].segmentation_results[idx]).reshape(-1, 1, 2) for k in accepted]
+            projected = cv2.perspectiveTransform(np.concatenate(coords), prepared.homography(idx))
+            bounds = np.cumsum([0] + [len(c) for c in coords])
+            projected = [projected[bounds[j]:bounds[j+1]] for j in range(len(accepted))]
+
+        evaluated = {} # projected outline ---> (FrameEvalResult, self-intersecting)
+        for (j, k) in enumerate(accepted):
+            key = projected[j].tostring()
+            res = evaluated.get(key)
+            if res is None:
+                res = evaluated[key] = evalProjected(fidx, prepared.target, projected[j], profiler)
+            else:
+                profiler.count("shared_frame_results")
+            (fr, self_intersecting) = res
+            if self_intersecting:
+                selfint_counts[k] += 1
+                profiler.count("self_intersecting_test_polygons")
+            profiler.count(fr.match_type)
+            frame_results[k][idx] = fr
+    return frame_results, selfint_counts
+
+
+def tableRow(segresult_file, global_results, selfint_count):
+    row = [segresult_file]
+    row.extend(getattr(global_results, field) for field in TABLE_HEADER[1:-1])
+    row.append(selfint_count)
+    return row
+
+
+def writeFrameMatrix(out_f, labels, frame_results, metric):
+    """Frames x variants matrix of `metric`, as CSV."""
+    writer = csv.writer(out_f, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(["frame"] + labels)
+    for idx in range(len(frame_results[0]) if frame_results else 0):
+        writer.writerow([idx+1] + [getattr(results[idx], metric) for results in frame_results])
+
+
+# ==============================================================================
+def main(argv=None):
+    # Option parsing
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Evaluate several segmentation results of a same video sequence in a single pass.',
+        version=PROG_VERSION)
+
+    addLoggingArguments(parser)
+    parser.add_argument('groundtruth_file',
+        action=StoreValidFilePath,
+        help="File containing ground truth segmentation and object reference.")
+    parser.add_argument('files',
+        action=StoreValidFilePaths,
+        metavar='segresult_file',
+        nargs='*',
+        help="Segmentation results to evaluate.")
+    parser.add_argument('-f', '--files-from', metavar="FILE_LIST",
+        action=StoreValidFilePathOrStdin,
+        help="File containing the list of segmentation results, or '-' to use standard input. \
+              Will be read BEFORE files specified on command line.")
+    parser.add_argument('-o', '--output-file',
+        help="Path to the CSV table of global results (one row per segmentation result). \
+              Standard output if not set.")
+    parser.add_argument('-m', '--frame-matrix', metavar="MATRIX_FILE",
+        help="Optional path to a CSV matrix of frame results (one row per frame, \
+              one column per segmentation result).")
+    parser.add_argument('--frame-metric',
+        choices=FRAME_METRICS, default=FRAME_METRICS[0],
+        help="Frame result stored in the frame matrix.")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    files_in_list = []
+    if args.files_from:
+        files_in_list = (line.rstrip("\n") for line in fileinput.input([args.files_from]))
+    segresult_files = [f for f in itertools.chain(files_in_list, args.files) if f]
+    if not segresult_files:
+        logger.error("No segmentation result to evaluate.")
+        logger.error("\t Use '-h' option to review program synopsis.")
+        return ERRCODE_NOFILE
+
+    profiler = createProfiler(args.profile, "eval_sweep", PROG_VERSION, args.memprofile)
+    profiler.info("groundtruth_file", args.groundtruth_file)
+    profiler.info("variants", len(segresult_files))
+
+    with profiler.stage("gt_load"):
+        prepared = PreparedGroundTruth(GroundTruth.loadFromFile(args.groundtruth_file))
+    test_mdls = []
+    with profiler.stage("test_load"):
+        for segresult_file in segresult_files:
+            logger.debug("Loading '%s'", segresult_file)
+            test_mdls.append(SegResult.loadFromFile(segresult_file))
+
+    with profiler.stage("frame_loop"):
+        frame_results, selfint_counts = sweepFrames(prepared, test_mdls, profiler)
+    with profiler.stage("aggregation"):
+        global_results = [computeGlobalResults(results) for results in frame_results]
+    logger.debug("--- Process complete. ---")
+
+    with profiler.stage("export"):
+        out_f = sys.stdout
+        if args.output_file is not None:
+            out_f = open(args.output_file, "wb")
+        try:
+            writer = csv.writer(out_f, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(TABLE_HEADER)
+            for (segresult_file, gr, selfint_count) in zip(segresult_files, global_results, selfint_counts):
+                writer.writerow(tableRow(segresult_file, gr, selfint_count))
+        finally:
+            if out_f is not sys.stdout:
+                out_f.close()
+
+        if args.frame_matrix is not None:
+            with open(args.frame_matrix, "wb") as matrix_f:
+                writeFrameMatrix(matrix_f, segresult_files, frame_results, args.frame_metric)
+
+    logger.info("%d segmentation results evaluated on %d frames.",
+                len(segresult_files), len(prepared.mdl.segmentation_results))
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
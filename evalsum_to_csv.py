@@ -19,6 +19,7 @@ from dexml import ParseError
 from utils.args import *
 from utils.log import *
 from models.models import *
+from utils.profiling import createProfiler
 
 # ==============================================================================
 logger = logging.getLogger(__name__)
@@ -46,12 +47,60 @@ def read_results_from_file(eval_file):
             current_mdl = EvalSummary.loadFromFile(eval_file)
             logger.debug("Got EvalSummary file.")
     except Exception, e:
-        logger.error("File '%s' is not a valid segmentation evaluation file." % eval_file)
+        logger.error("File '%s' is not a valid segmentation evaluation file.", eval_file)
         logger.error("\t Is it a '*.segeval.xml' or a '*.evalsummary.xml' file?")
         raise e
     return current_mdl.global_results
 
 
+# ==============================================================================
+CSV_HEADER = [
+    "filename",                      # string
+    "mean_segmentation_precision",   # float
+    "mean_segmentation_recall",      # float
+    "detection_precision",           # float
+    "detection_recall",              # float
+    "mean_jaccard_index_smartdoc",   # float
+    "mean_jaccard_index_segonly",    # float
+    "count_total_frames",            # int
+    "count_true_accepted_frames",    # int
+    "count_true_rejected_frames",    # int
+    "count_false_accepted_frames",   # int
+    "count_false_rejected_frames"]   # int
+
+def createCsvWriter(ofile):
+    return csv.writer(ofile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+
+def results_to_row(eval_file, res_cur):
+    """str x GlobalEvalResults ---> list (CSV row matching CSV_HEADER)"""
+    return [
+        eval_file,
+        res_cur.mean_segmentation_precision,
+        res_cur.mean_segmentation_recall,
+        res_cur.detection_precision,
+        res_cur.detection_recall,
+        res_cur.mean_jaccard_index_smartdoc,
+        res_cur.mean_jaccard_index_segonly,
+        res_cur.count_total_frames,
+        res_cur.count_true_accepted_frames,
+        res_cur.count_true_rejected_frames,
+        res_cur.count_false_accepted_frames,
+        res_cur.count_false_rejected_frames]
+
+def write_summary_csv(csv_file, summaries):
+    """
+    Write the CSV file of `summaries` (list of (filename, EvalSummary)), with
+    the rows this program would produce from these files.
+    """
+    with open(csv_file, "wb") as ofile:
+        csv_writer = createCsvWriter(ofile)
+        csv_writer.writerow(CSV_HEADER)
+        for (eval_file, summary_mdl) in summaries:
+            # values as read back from the file (rendering rounds floats)
+            res_cur = GlobalEvalResults.parse(summary_mdl.global_results.render(fragment=True))
+            csv_writer.writerow(results_to_row(eval_file, res_cur))
+
+
 # ==============================================================================
 def main(argv=None):
     # Option parsing
@@ -61,9 +110,7 @@ def main(argv=None):
         version=PROG_VERSION)
 
 
-    parser.add_argument('-d', '--debug', 
-        action="store_true", 
-        help="Activate debug output.")
+    addLoggingArguments(parser)
 
     parser.add_argument('-f', '--files-from', metavar="FILE_LIST", 
         action=StoreValidFilePathOrStdin,
@@ -78,17 +125,15 @@ def main(argv=None):
 
     parser.add_argument('-o', '--output-file', required=True,
         help="MANDATORY path to output file.")
+    addProfileArgument(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
 
 
     # -----------------------------------------------------------------------------
     # Logger activation
-    initLogger(logger)
-    output_prettyprint = False
-    if args.debug:
-        logger.setLevel(logging.DEBUG)
-        output_prettyprint = True
+    initLoggingFromArgs(logger, args)
     
     # -----------------------------------------------------------------------------
     # Output log header
@@ -106,53 +151,33 @@ def main(argv=None):
         files_in_list = (line.rstrip("\n") for line in fileinput.input([args.files_from]))
     file_iter = itertools.chain(files_in_list, args.files)
 
+    profiler = createProfiler(args.profile, "evalsum_to_csv", PROG_VERSION, args.memprofile)
+
     # Prepare output file
     with open(args.output_file, "wb") as ofile:
-        csv_writer = csv.writer(ofile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_NONNUMERIC)
+        csv_writer = createCsvWriter(ofile)
         # Output header
-        header = [
-            "filename",                      # string
-            "mean_segmentation_precision",   # float
-            "mean_segmentation_recall",      # float
-            "detection_precision",           # float
-            "detection_recall",              # float
-            "mean_jaccard_index_smartdoc",   # float
-            "mean_jaccard_index_segonly",    # float
-            "count_total_frames",            # int
-            "count_true_accepted_frames",    # int
-            "count_true_rejected_frames",    # int
-            "count_false_accepted_frames",   # int
-            "count_false_rejected_frames"]   # int
-        logger.info("\t".join(header))
-        csv_writer.writerow(header)
+        logger.info("\t".join(CSV_HEADER))
+        csv_writer.writerow(CSV_HEADER)
 
     # --------------------------------------------------------------------------
         logger.debug("--- Process started. ---")
         # Loop over files
         file_count = 0
         for eval_file in file_iter:
-            logger.debug("Processing file '%s'" % eval_file)
+            logger.debug("Processing file '%s'", eval_file)
             # Try to read either EvalResult or EvalSummary
-            res_cur = read_results_from_file(eval_file)
+            with profiler.stage("load"):
+                res_cur = read_results_from_file(eval_file)
             # Payload
-            res_lst = [
-                eval_file,
-                res_cur.mean_segmentation_precision,
-                res_cur.mean_segmentation_recall,
-                res_cur.detection_precision,
-                res_cur.detection_recall,
-                res_cur.mean_jaccard_index_smartdoc,
-                res_cur.mean_jaccard_index_segonly,
-                res_cur.count_total_frames,
-                res_cur.count_true_accepted_frames,
-                res_cur.count_true_rejected_frames,
-                res_cur.count_false_accepted_frames,
-                res_cur.count_false_rejected_frames]
-            # Output (log and file)
-            logger.info("\t".join(map(str, res_lst)))
-            csv_writer.writerow(res_lst)
+            with profiler.stage("export"):
+                res_lst = results_to_row(eval_file, res_cur)
+                # Output (log and file)
+                logger.info("\t".join(map(str, res_lst)))
+                csv_writer.writerow(res_lst)
             # Stats
             file_count += 1
+            profiler.count("files")
 
         logger.debug("--- Process complete. ---")
     # --------------------------------------------------------------------------
@@ -164,7 +189,10 @@ def main(argv=None):
         return E_NOFILE
 
     # else
-    logger.debug("%d files processed." % file_count)
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("%d files processed.", file_count)
     logger.debug("Clean exit.")
     logger.debug(DBGSEP)
     return E_OK
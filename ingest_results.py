@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Load evaluation results ("EVAL_DIR/METHOD/BACKGROUND/DOCUMENT.segeval.xml",
+compact or not) into a results warehouse (SQLite database, see
+utils/warehouse.py): global results of each sample and results of each frame.
+
+Ingestion is incremental: samples whose evaluation file did not change
+(same path, modification time and size) since they were loaded are skipped,
+other ones are inserted or replaced ("--force" reloads all of them). Samples
+are inserted in bulk, "--batch-size" samples per transaction.
+
+The warehouse can then be queried with `query_results.py` (or any SQLite
+client), and read by `smartdoc_ji_overview.py`.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from utils.warehouse import openWarehouse, readEvalFile, sampleSignatures, upsertSample
+from utils.watch import fileSignature
+from utils.profiling import createProfiler
+from utils.evaltree import findEvalFiles
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Evaluation Results Ingester"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+ERRCODE_EVALFAILED = 11
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Load evaluation results into a SQLite results warehouse.',
+        version=PROG_VERSION)
+
+    parser.add_argument('eval_dirs',
+        nargs='+', metavar='eval_dir',
+        help="Evaluation directories (METHOD/BACKGROUND/DOCUMENT.segeval.xml).")
+    parser.add_argument('-o', '--database',
+        required=True,
+        help="Path to the warehouse (SQLite database), created if needed.")
+    parser.add_argument('-f', '--force',
+        action='store_true',
+        help="Reload all the samples, even unchanged ones.")
+    parser.add_argument('--batch-size',
+        action=StoreIntZeroPositive, default=200,
+        help="Number of samples inserted per transaction.")
+    addLoggingArguments(parser)
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    for eval_dir in args.eval_dirs:
+        if not os.path.isdir(eval_dir):
+            parser.error("'%s' is not a directory." % eval_dir)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "ingest_results", PROG_VERSION, args.memprofile)
+
+    with profiler.stage("scan"):
+        eval_files = [item for eval_dir in args.eval_dirs for item in findEvalFiles(eval_dir)]
+    if not eval_files:
+        logger.error("No evaluation result found.")
+        return ERRCODE_NOFILE
+    profiler.info("samples", len(eval_files))
+
+    conn = openWarehouse(args.database)
+    known = sampleSignatures(conn) if not args.force else {}
+    (loaded, skipped, failures, pending) = (0, 0, 0, 0)
+    try:
+        for (key, eval_file) in eval_files:
+            eval_file = os.path.abspath(eval_file)
+            signature = fileSignature(eval_file)
+            if known.get(key) == (eval_file,) + signature:
+                skipped += 1
+                continue
+            try:
+                with profiler.stage("read"):
+                    (results, frames) = readEvalFile(eval_file)
+            except Exception, e:
+                logger.error("%s: %s", eval_file, e)
+                failures += 1
+                continue
+            with profiler.stage("insert"):
+                upsertSample(conn, key, eval_file, signature, results, frames)
+            profiler.count("frames", len(frames))
+            loaded += 1
+            pending += 1
+            if pending >= args.batch_size:
+                with profiler.stage("commit"):
+                    conn.commit()
+                pending = 0
+        with profiler.stage("commit"):
+            conn.commit()
+    finally:
+        conn.close()
+    profiler.count("loaded", loaded)
+    profiler.count("skipped", skipped)
+    profiler.count("failed", failures)
+    logger.debug("--- Process complete. ---")
+    logger.info("%d samples loaded into '%s', %d unchanged, %d failed.",
+                loaded, args.database, skipped, failures)
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_EVALFAILED if failures else ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
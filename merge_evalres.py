@@ -9,6 +9,7 @@ import os
 import os.path
 import sys
 import fileinput
+import math
 import itertools # chain
 from collections import namedtuple
 
@@ -19,6 +20,7 @@ from dexml import ParseError
 from utils.args import *
 from utils.log import *
 from models.models import *
+from utils.profiling import createProfiler
 
 # ==============================================================================
 logger = logging.getLogger(__name__)
@@ -50,9 +52,29 @@ evalres = namedtuple("evalres", ["mean_segmentation_precision", # None means und
 
 res_init = evalres(None, None, None, None, None, None, 0.0, 0.0, 0.0, 0.0, 0.0)
 
+# Sufficient statistics (exact merge, see "--exact"): sums of frame measures in
+# fixed point (integers, in units of 2^-SUM_FRACTION_BITS) and frame counts.
+# Merging is element-wise integer addition: associative and commutative, so
+# summaries can be reduced in any order or tree shape with identical results.
+SUM_FRACTION_BITS = 40
+evalsums = namedtuple("evalsums", ["sum_segmentation_precision",  # weight: true accepted frames
+                                   "sum_segmentation_recall",     # weight: true accepted frames
+                                   "sum_jaccard_index_smartdoc",  # weight: total frames
+                                   "sum_jaccard_index_segonly",   # weight: retrieved frames
+                                   "count_total_frames",
+                                   "count_true_accepted_frames",
+                                   "count_true_rejected_frames",
+                                   "count_false_accepted_frames",
+                                   "count_false_rejected_frames"])
+
+sums_init = evalsums(0, 0, 0, 0, 0, 0, 0, 0, 0)
+
 
 # ==============================================================================
 def read_results_from_file(eval_file):
+    return read_model_from_file(eval_file).global_results
+
+def read_model_from_file(eval_file):
     current_mdl = None
     try:
         try:
@@ -62,10 +84,10 @@ def read_results_from_file(eval_file):
             current_mdl = EvalSummary.loadFromFile(eval_file)
             logger.debug("Got EvalSummary file.")
     except Exception, e:
-        logger.error("File '%s' is not a valid segmentation evaluation file." % eval_file)
+        logger.error("File '%s' is not a valid segmentation evaluation file.", eval_file)
         logger.error("\t Is it a '*.segeval.xml' or a '*.evalsummary.xml' file?")
         raise e
-    return current_mdl.global_results
+    return current_mdl
 
 # ==============================================================================
 def res_model_to_tuple(result_model):
@@ -109,6 +131,73 @@ def res_tuple_to_model(result_tuple):
     mdl.global_results.count_false_rejected_frames = int(result_tuple.count_false_rejected_frames)
     return mdl
 
+# ==============================================================================
+def to_fixed_point(value):
+    return int(round(math.ldexp(value, SUM_FRACTION_BITS)))
+
+def from_fixed_point(value, weight):
+    return math.ldexp(float(value), -SUM_FRACTION_BITS) / weight if weight > 0 else None
+
+def res_model_to_sums(result_model, stats_model=None):
+    '''GlobalEvalResults x SufficientStatistics ---> evalsums
+
+    Without sufficient statistics (evaluation results, older summaries), sums
+    are derived from means and counts.'''
+    counts = [result_model.count_total_frames,
+              result_model.count_true_accepted_frames,
+              result_model.count_true_rejected_frames,
+              result_model.count_false_accepted_frames,
+              result_model.count_false_rejected_frames]
+    if stats_model is not None:
+        shift = SUM_FRACTION_BITS - stats_model.fraction_bits
+        rescale = lambda value: value << shift if shift >= 0 else value >> -shift
+        return evalsums(
+            rescale(stats_model.sum_segmentation_precision),
+            rescale(stats_model.sum_segmentation_recall),
+            rescale(stats_model.sum_jaccard_index_smartdoc),
+            rescale(stats_model.sum_jaccard_index_segonly),
+            *counts)
+    cta = result_model.count_true_accepted_frames
+    cr = result_model.count_true_accepted_frames + result_model.count_false_accepted_frames
+    return evalsums(
+        to_fixed_point(result_model.mean_segmentation_precision * cta),
+        to_fixed_point(result_model.mean_segmentation_recall * cta),
+        to_fixed_point(result_model.mean_jaccard_index_smartdoc * result_model.count_total_frames),
+        to_fixed_point(result_model.mean_jaccard_index_segonly * cr),
+        *counts)
+
+def merge_sums(sums1, sums2):
+    '''evalsums x evalsums ---> evalsums'''
+    return evalsums(*[v1 + v2 for (v1, v2) in zip(sums1, sums2)])
+
+def sums_to_res_tuple(sums):
+    '''evalsums ---> evalres (None for undefined means, like merge_res_tuples)'''
+    count_expected  = sums.count_true_accepted_frames + sums.count_false_rejected_frames
+    count_retrieved = sums.count_true_accepted_frames + sums.count_false_accepted_frames
+    return evalres(
+        from_fixed_point(sums.sum_segmentation_precision, sums.count_true_accepted_frames),
+        from_fixed_point(sums.sum_segmentation_recall, sums.count_true_accepted_frames),
+        float(sums.count_true_accepted_frames) / count_retrieved if count_retrieved > 0 else None,
+        float(sums.count_true_accepted_frames) / count_expected if count_expected > 0 else None,
+        from_fixed_point(sums.sum_jaccard_index_smartdoc, sums.count_total_frames),
+        from_fixed_point(sums.sum_jaccard_index_segonly, count_retrieved),
+        float(sums.count_total_frames),
+        float(sums.count_true_accepted_frames),
+        float(sums.count_true_rejected_frames),
+        float(sums.count_false_accepted_frames),
+        float(sums.count_false_rejected_frames))
+
+def sums_to_model(sums):
+    '''evalsums ---> EvalSummary, with its sufficient statistics'''
+    mdl = res_tuple_to_model(sums_to_res_tuple(sums))
+    mdl.sufficient_statistics = SufficientStatistics(
+        fraction_bits=SUM_FRACTION_BITS,
+        sum_segmentation_precision=sums.sum_segmentation_precision,
+        sum_segmentation_recall=sums.sum_segmentation_recall,
+        sum_jaccard_index_smartdoc=sums.sum_jaccard_index_smartdoc,
+        sum_jaccard_index_segonly=sums.sum_jaccard_index_segonly)
+    return mdl
+
 # ==============================================================================
 def merge_res_tuples(res1, res2):
     '''evalres x evalres ---> evalres'''
@@ -206,11 +295,14 @@ def main(argv=None):
         version=PROG_VERSION)
 
 
-    parser.add_argument('-d', '--debug', 
-        action="store_true", 
-        help="Activate debug output.")
+    addLoggingArguments(parser)
+    addPrettyPrintArgument(parser)
     parser.add_argument('-o', '--output-file', 
         help="Optional path to output file.")
+    parser.add_argument('-x', '--exact',
+        action='store_true',
+        help="Merge fixed-point sums of frame measures (exact, independent of the merge order) \
+              and store them in the summary, for later exact merges.")
 
 
     parser.add_argument('-f', '--files-from', metavar="FILE_LIST", 
@@ -223,17 +315,15 @@ def main(argv=None):
         metavar='result_file', 
         nargs='*',
         help='EvalSummary or SegEval files containing global results to merge.')
+    addProfileArgument(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
 
 
     # -----------------------------------------------------------------------------
     # Logger activation
-    initLogger(logger)
-    output_prettyprint = False
-    if args.debug:
-        logger.setLevel(logging.DEBUG)
-        output_prettyprint = True
+    initLoggingFromArgs(logger, args)
     
     # -----------------------------------------------------------------------------
     # Output log header
@@ -253,18 +343,30 @@ def main(argv=None):
 
     file_iter = itertools.chain(files_in_list, args.files)
 
+    profiler = createProfiler(args.profile, "merge_evalres", PROG_VERSION, args.memprofile)
+
     # --------------------------------------------------------------------------
     logger.debug("--- Process started. ---")
     # Init variables
     res_agg = res_init
+    sums_agg = sums_init
     # Loop over files
     file_count = 0
     for eval_file in file_iter:
-        logger.debug("Processing file '%s'" % eval_file)
+        logger.debug("Processing file '%s'", eval_file)
         # Try to read either EvalResult or EvalSummary
-        res_cur = res_model_to_tuple(read_results_from_file(eval_file))
+        with profiler.stage("load"):
+            cur_mdl = read_model_from_file(eval_file)
+            res_cur = res_model_to_tuple(cur_mdl.global_results)
         # Merge evaluation results
-        res_agg = merge_res_tuples(res_cur, res_agg)
+        with profiler.stage("aggregation"):
+            if args.exact:
+                sums_agg = merge_sums(res_model_to_sums(cur_mdl.global_results,
+                                                        getattr(cur_mdl, "sufficient_statistics", None)),
+                                      sums_agg)
+                res_agg = sums_to_res_tuple(sums_agg)
+            else:
+                res_agg = merge_res_tuples(res_cur, res_agg)
         # Logging
         logger.debug(
             "\t %d new frames (total is %d)",
@@ -284,6 +386,8 @@ def main(argv=None):
             getOrDefault(res_agg.mean_jaccard_index_segonly, 0.0))
         # Stats
         file_count += 1
+        profiler.count("files")
+        profiler.count("frames", int(res_cur.count_total_frames))
 
     logger.debug("--- Process complete. ---")
 
@@ -296,7 +400,7 @@ def main(argv=None):
 
     # else
     # Final output
-    aggreg_mdl = res_tuple_to_model(res_agg)
+    aggreg_mdl = sums_to_model(sums_agg) if args.exact else res_tuple_to_model(res_agg)
     gr_mdl = aggreg_mdl.global_results
     logger.debug("------------------------------")
     logger.debug("Final results")
@@ -328,7 +432,11 @@ def main(argv=None):
 
     # Export the XML structure to file if needed
     if args.output_file is not None:
-        aggreg_mdl.exportToFile(args.output_file, pretty_print=output_prettyprint)
+        with profiler.stage("export"):
+            aggreg_mdl.exportToFile(args.output_file, pretty_print=args.pretty_print)
+
+    if args.profile is not None:
+        profiler.write(args.profile)
 
     logger.debug("Clean exit.")
     logger.debug(DBGSEP)
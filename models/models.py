@@ -12,13 +12,17 @@ import os.path
 import sys
 import datetime
 
-import lxml.etree as etree  # import xml.etree as etree
-import lxml.sax   as sax  # import xml.sax   as sax
-from xml.dom.pulldom import SAX2DOM
+# lxml is imported when files are actually read or pretty-printed, to keep
+# the startup time of command line tools low.
+# import lxml.etree as etree  # import xml.etree as etree
+# import lxml.sax   as sax  # import xml.sax   as sax
+# from xml.dom.pulldom import SAX2DOM
 
 import dexml
 from dexml import fields
 
+from utils.compression import openFile, resolvePath
+
 # ==============================================================================
 logger = logging.getLogger(__name__)
 
@@ -114,34 +118,54 @@ class MainModel(dexml.Model):
         self.generated = datetime.datetime.now().isoformat() # warning: no TZ info here
 
     def exportToFile(self, filename, pretty_print=False):
+        """Write the model to `filename`, compressed if it ends with .gz, .bz2 or .xz."""
         out_str = self.render(encoding="utf-8") # no pretty=pretty_print here, done by lxml
         if pretty_print:
+            import lxml.etree as etree
             # lxml pretty print should be way faster than the minidom one used in dexml
             root = etree.fromstring(out_str)
             out_str = etree.tostring(root, xml_declaration=True, encoding='utf-8', pretty_print=True)
-        logger.debug("Output file's content:\n%s" % out_str)
-        # print "Output file's content:\n%s" % out_str
-        with open(os.path.abspath(filename), "wb") as out_f:
+        with openFile(os.path.abspath(filename), "wb") as out_f:
             out_f.write(out_str)
+        # do not log the content itself: it can be megabytes of XML
+        logger.debug("%d bytes written to '%s'.", len(out_str), filename)
 
     @classmethod 
     def loadFromFile(cls, filename):
-        path_file = os.path.abspath(filename)
+        """Load a model from `filename`, or from a compressed version of it 
+        (.gz, .bz2 or .xz, see utils/compression.py)."""
+        path_file = resolvePath(os.path.abspath(filename))
         if not os.path.isfile(path_file):
             err = "Error: '%s' does not exist or is not a file." % filename
             logger.error(err)
             raise Exception(err)
 
+        import lxml.etree as etree
+
         # Note: parsing a file directly with dexml/minidom is supposedly slower, si I used lxml one, 
         #       but I did not benchmark it.
-        tree = etree.parse(path_file)
+        # (decompression is streamed to the parser)
+        with openFile(path_file, "rb") as in_f:
+            tree = etree.parse(in_f)
+        # In case, you can pass the filename to parse() here to skip lxml
+        return cls._parseTree(tree)
+
+    @classmethod 
+    def loadFromString(cls, data):
+        """Same as `loadFromFile`, for a document already in memory."""
+        import lxml.etree as etree
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        return cls._parseTree(etree.ElementTree(etree.fromstring(data)))
+
+    @classmethod 
+    def _parseTree(cls, tree):
+        import lxml.sax   as sax
+        from xml.dom.pulldom import SAX2DOM
         handler = SAX2DOM()
         sax.saxify(tree, handler)
         dom = handler.document
-
-        # In case, you can pass the filename to parse() here to skip lxml
-        mdl = cls.parse(dom)
-        return mdl
+        return cls.parse(dom)
 
     # def __repr__(self):
     #     return "%s(%r)" % (self.__class__, self.__dict__)
@@ -178,13 +202,37 @@ class Pt(dexml.Model):
     x = fields.Float()
     y = fields.Float()
 
+class OutlinePt(dexml.Model):
+    """Vertex of an outline (polygon with any number of vertices)."""
+    class meta:
+        tagname = "point"
+    x = fields.Float()
+    y = fields.Float()
+
+class SegObject(dexml.Model):
+    """One of the objects detected in a frame (multi-object results).
+    In ground truth files, an object can have its own shape (defaults to 
+    the `object_shape` of the ground truth)."""
+    class meta:
+        tagname = "object"
+    name      = fields.String(required=False)
+    points    = fields.Dict(Pt, key='name', unique=True)
+    outline   = fields.List(OutlinePt, tagname="outline", required=False)
+    object_shape = fields.Model("ObjectShape", required=False)
+
 class FrameSegResult(dexml.Model):
-    """Tracker output for a given frame. Only 1 object can be detected for now."""
+    """Tracker output for a given frame. 
+    Single object results use `points`, multi-object results use `objects`
+    (see eval_multi.py, eval_seg.py only handles single object results).
+    In segmentation results, the 4 corners can be replaced by an `outline`
+    with any number of vertices. Ground truth always uses the 4 corners."""
     class meta:
         tagname = "frame"
     index     = fields.Integer(required=False)
     rejected  = fields.Boolean()
     points    = fields.Dict(Pt, key='name', unique=True)
+    outline   = fields.List(OutlinePt, tagname="outline", required=False)
+    objects   = fields.List(SegObject, required=False)
 
     # def get_tl(self): return self.points['tl']
     # def set_tl(self, value): self.points['tl'] = value
@@ -257,6 +305,9 @@ class FrameEvalResult(dexml.Model):
     jaccard_index_smartdoc  = fields.Float(default=0.0, required=False, tagname="jaccard_index_smartdoc")
     jaccard_index_segonly   = fields.Float(default=0.0, required=False, tagname="jaccard_index_segonly")
     surfaces   = fields.Model(SegSurfaces, required=False)
+    # multi-object evaluation only: names of the matched objects
+    gt_object   = fields.String(required=False)
+    test_object = fields.String(required=False)
 
 class GlobalEvalResults(dexml.Model):
     class meta:
@@ -274,22 +325,57 @@ class GlobalEvalResults(dexml.Model):
     count_false_rejected_frames = fields.Integer(tagname="count_false_rejected_frames")
 
 
+class TemporalEvalResults(dexml.Model):
+    """Temporal stability of a segmentation result over a sample.
+    Corner displacements are measured in the target referential, between 
+    consecutive true accepted frames (a perfect result does not move); 
+    JI variance is computed over sliding windows of `window` frames."""
+    class meta:
+        tagname = "temporal_results"
+    window                      = fields.Integer()
+    mean_corner_displacement    = fields.Float(tagname="mean_corner_displacement")
+    max_corner_displacement     = fields.Float(tagname="max_corner_displacement")
+    count_displacement_pairs    = fields.Integer(tagname="count_displacement_pairs")
+    mean_rolling_ji_variance    = fields.Float(tagname="mean_rolling_ji_variance")
+    max_rolling_ji_variance     = fields.Float(tagname="max_rolling_ji_variance")
+    count_accept_reject_flips   = fields.Integer(tagname="count_accept_reject_flips")
+    longest_failure_streak      = fields.Integer(tagname="longest_failure_streak")
+
+
 class EvalResult(MainModel):
     """Main model for evaluation result for a given sample."""
     class meta:
         tagname = "eval_results"
     source_files   = fields.Model(EvalSourceFiles)
     frame_results  = fields.List(FrameEvalResult, tagname="frame_results")
+    # compact results: frame results are stored in this file instead (see utils/compact.py)
+    frame_results_file = fields.String(tagname="frame_results_file", required=False)
     global_results = fields.Model(GlobalEvalResults)
+    temporal_results = fields.Model(TemporalEvalResults, required=False)
 
 
 # EvalSummary
 # ------------------------------------------------------------------------------
+class SufficientStatistics(dexml.Model):
+    """Sums of frame measures, as integers in units of 2^-fraction_bits (fixed
+    point): summaries carrying them are merged by integer addition, which is 
+    exact whatever the merge order (see merge_evalres.py). Weights are the 
+    frame counts of the global results."""
+    class meta:
+        tagname = "sufficient_statistics"
+    fraction_bits               = fields.Integer()
+    sum_segmentation_precision  = fields.Integer(tagname="sum_segmentation_precision")  # true accepted
+    sum_segmentation_recall     = fields.Integer(tagname="sum_segmentation_recall")     # true accepted
+    sum_jaccard_index_smartdoc  = fields.Integer(tagname="sum_jaccard_index_smartdoc")  # all frames
+    sum_jaccard_index_segonly   = fields.Integer(tagname="sum_jaccard_index_segonly")   # accepted
+
+
 class EvalSummary(MainModel):
     """Main model for evaluation summary for a whole experiment."""
     class meta:
         tagname = "eval_summary"
     global_results = fields.Model(GlobalEvalResults)
+    sufficient_statistics = fields.Model(SufficientStatistics, required=False)
 
 
 # Experiment
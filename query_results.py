@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Query a results warehouse (see `ingest_results.py` and utils/warehouse.py)
+and write the matching samples (global results) or frames ("--frames") as a
+tab-separated table. Names are filtered with GLOB patterns, ex: the frames of
+"tax00*" documents of background04 which method X failed:
+
+    $ python query_results.py results.sqlite --frames --method X \\
+        --background background04 --document 'tax00*' \\
+        --match-type false_accepted false_rejected
+
+Any other SQL query (on the "samples" and "frames" tables and on the
+"frame_results" view) can be run with "--sql". Queries are read-only:
+statements which would modify the warehouse are rejected.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import sys
+import re
+import time
+import sqlite3
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from utils.warehouse import isWarehouse, openWarehouse, buildQuery
+from utils.compact import MATCH_TYPES
+from utils.profiling import createProfiler
+from evalsum_to_csv import createCsvWriter
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Results Warehouse Query"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+ERRCODE_INVALID = 12
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Query a results warehouse.',
+        version=PROG_VERSION)
+
+    parser.add_argument('database',
+        action=StoreValidFilePath,
+        help="Results warehouse (SQLite database written by ingest_results.py).")
+    parser.add_argument('--frames',
+        action='store_true',
+        help="List frames instead of samples.")
+    parser.add_argument('--method',
+        nargs='+', metavar='PATTERN',
+        help="Methods to select (GLOB patterns).")
+    parser.add_argument('--background',
+        nargs='+', metavar='PATTERN',
+        help="Backgrounds to select (GLOB patterns).")
+    parser.add_argument('--document',
+        nargs='+', metavar='PATTERN',
+        help="Documents to select (GLOB patterns).")
+    parser.add_argument('--match-type',
+        nargs='+', choices=MATCH_TYPES,
+        help="Match types of the frames to select (with '--frames').")
+    parser.add_argument('--max-ji',
+        action=Store0to1float,
+        help="Select frames (or samples, on their mean) with a Jaccard index up to this value.")
+    parser.add_argument('--limit',
+        action=StoreIntZeroPositive,
+        help="Maximum number of rows.")
+    parser.add_argument('--sql',
+        help="SQL query (SELECT) to run instead of the query built from the options above.")
+    parser.add_argument('-o', '--output-file',
+        help="Path to the output file (default: standard output).")
+    addLoggingArguments(parser)
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    if args.match_type and not args.frames:
+        parser.error("'--match-type' requires '--frames'.")
+    if args.sql is not None and not re.match(r"\s*(SELECT|WITH)\b", args.sql, re.IGNORECASE):
+        parser.error("'--sql' only runs SELECT queries.")
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "query_results", PROG_VERSION, args.memprofile)
+    if not isWarehouse(args.database):
+        logger.error("'%s' is not a results warehouse.", args.database)
+        return ERRCODE_NOFILE
+
+    if args.sql is not None:
+        (query, params) = (args.sql, [])
+    else:
+        (query, params) = buildQuery(args.frames, args.method, args.background, args.document,
+                                     args.match_type, args.max_ji, args.limit)
+    logger.debug("Query: %s %s", query, params)
+
+    conn = openWarehouse(args.database)
+    conn.execute("PRAGMA query_only = ON") # any write fails
+    ofile = open(args.output_file, "wb") if args.output_file is not None else sys.stdout
+    try:
+        start = time.time()
+        try:
+            with profiler.stage("query"):
+                cursor = conn.execute(query, params)
+        except (sqlite3.Error, sqlite3.Warning), e: # (Warning: several statements)
+            logger.error("Invalid query: %s", e)
+            return ERRCODE_INVALID
+        csv_writer = createCsvWriter(ofile)
+        rows = 0
+        if cursor.description is not None:
+            with profiler.stage("output"): # (rows are fetched while written)
+                csv_writer.writerow([col[0] for col in cursor.description])
+                for row in cursor:
+                    csv_writer.writerow(row)
+                    rows += 1
+    finally:
+        conn.close()
+        if ofile is not sys.stdout:
+            ofile.close()
+    logger.debug("--- Process complete. ---")
+    logger.info("%d rows in %.3f s.", rows, time.time() - start)
+    profiler.count("rows", rows)
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Single-pass rollup of evaluation results.
+
+The global results of all the samples are read once, either from an
+evaluation tree ("EVAL_DIR/METHOD/BACKGROUND/DOCUMENT.segeval.xml", only the
+"<global_results>" element is parsed) or from the partial-state files of a
+sharded evaluation (see utils/shard.py). All the aggregation levels are then
+computed by grouped sums over a single table of per-sample sums and counts:
+    document        METHOD, BACKGROUND, DOCUMENT
+    document_class  METHOD, DOCUMENT_CLASS   and   DOCUMENT_CLASS (all methods)
+    background      METHOD, BACKGROUND       and   BACKGROUND (all methods)
+    method          METHOD
+    global          (all methods)
+The document class is the document name before its number ("paper004" ->
+"paper"), like in `smartdoc_ji_overview.py`.
+
+Results follow the GlobalEvalResults semantics of `merge_evalres.py --exact`
+(fixed-point sums, exact whatever the grouping), so the summaries written
+with "-s" ("SUMMARY_DIR/METHOD/BACKGROUND.evalsummary.xml" and
+"SUMMARY_DIR/METHOD/BACKGROUND-ALL.evalsummary.xml") are the ones produced
+by the merge steps of `run_eval.sh` with "--exact". The cube table ("-o")
+has one row per group of each level, "*" standing for aggregated dimensions.
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from models.models import *
+from utils.compression import openFile
+from utils.evaltree import findEvalFiles
+from utils.shard import loadPartialState
+from utils.profiling import createProfiler
+from merge_evalres import evalsums, to_fixed_point, sums_to_model
+from evalsum_to_csv import CSV_HEADER, createCsvWriter, write_summary_csv
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Evaluation Result Rollup"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+
+SUMMARY_EXT = ".evalsummary.xml"
+ALL_BACKGROUNDS = "BACKGROUND-ALL"
+ANY = "*"
+
+DIMENSIONS = ["method", "background", "document_class", "document"]
+# (level, grouping keys), in cube order
+GROUPINGS = [
+    ("document",       ["method", "background", "document"]),
+    ("document_class", ["method", "document_class"]),
+    ("document_class", ["document_class"]),
+    ("background",     ["method", "background"]),
+    ("background",     ["background"]),
+    ("method",         ["method"]),
+    ("global",         []),
+    ]
+
+MEASURES = ["segmentation_precision", "segmentation_recall", "jaccard_index_smartdoc", "jaccard_index_segonly"]
+COUNTS = ["count_total_frames", "count_true_accepted_frames", "count_true_rejected_frames",
+          "count_false_accepted_frames", "count_false_rejected_frames"]
+# Fixed-point sums do not fit in int64 over large groups: they are summed as
+# two int64 columns, high and low bits, recombined as Python ints afterwards.
+SPLIT_BITS = 24
+
+CUBE_HEADER = ["level"] + DIMENSIONS + CSV_HEADER[1:]
+
+
+# ==============================================================================
+def documentClass(document):
+    return re.match(r"\D*", document).group(0)
+
+
+def readGlobalResults(eval_file):
+    """Global results (dict) of an evaluation result file, without parsing frame results into models."""
+    import lxml.etree as etree
+    with openFile(eval_file, "rb") as in_f:
+        for (_event, elem) in etree.iterparse(in_f, tag="global_results"):
+            return dict((child.tag, child.text) for child in elem)
+    raise ValueError("'%s' has no global results." % eval_file)
+
+
+def iterEvalTree(eval_dir, methods=None):
+    """
+    Generates (method, background, document, global results dict) for the
+    evaluation results of `eval_dir` (of `methods` only, if set).
+    """
+    for (key, path) in findEvalFiles(eval_dir, methods):
+        yield key + (readGlobalResults(path),)
+
+
+def iterPartialState(partial_file):
+    """Generates (method, background, document, global results dict) for the evaluated samples of a partial state."""
+    for sample in loadPartialState(partial_file)["samples"]:
+        if sample["status"] == "ok":
+            yield (sample["method"], sample["background"], sample["document"], sample["global_results"])
+
+
+def sampleRecord(method, background, document, results):
+    """Table row of a sample: dimensions, counts and fixed-point sums (split in high and low bits)."""
+    counts = [int(results[name]) for name in COUNTS]
+    (total, accepted, retrieved) = (counts[0], counts[1], counts[1] + counts[3])
+    weights = [accepted, accepted, total, retrieved] # see merge_evalres.evalsums
+    record = [method, background, documentClass(document), document] + counts
+    for (measure, weight) in zip(MEASURES, weights):
+        value = to_fixed_point(float(results["mean_" + measure]) * weight)
+        record.extend([value >> SPLIT_BITS, value & ((1 << SPLIT_BITS) - 1)])
+    return record
+
+
+def sumColumns():
+    columns = []
+    for measure in MEASURES:
+        columns.extend(["sum_%s_hi" % measure, "sum_%s_lo" % measure])
+    return columns
+
+
+def buildTable(records):
+    """list of sample records (see `sampleRecord`) ---> DataFrame"""
+    table = pd.DataFrame.from_records(records, columns=DIMENSIONS + COUNTS + sumColumns())
+    for column in COUNTS + sumColumns():
+        table[column] = table[column].astype(np.int64)
+    return table
+
+
+def rollup(table):
+    """
+    DataFrame of sample records ---> list of (level, dimensions dict, EvalSummary)
+
+    All the groupings of GROUPINGS, in cube order.
+    """
+    values = COUNTS + sumColumns()
+    groups = []
+    for (level, keys) in GROUPINGS:
+        if keys:
+            summed = table.groupby(keys, sort=True)[values].sum().reset_index()
+        else:
+            summed = pd.DataFrame([table[values].sum()])
+        for row in summed.itertuples(index=False):
+            row = dict(zip(keys + values, row))
+            dims = OrderedDict((dim, row.get(dim, ANY)) for dim in DIMENSIONS)
+            if level == "document":
+                dims["document_class"] = documentClass(dims["document"])
+            sums = [(int(row["sum_%s_hi" % m]) << SPLIT_BITS) + int(row["sum_%s_lo" % m]) for m in MEASURES]
+            groups.append((level, dims, sums_to_model(evalsums(*(sums + [int(row[c]) for c in COUNTS])))))
+    return groups
+
+
+def writeSummaries(groups, summary_dir, pretty_print=False):
+    """
+    Write the BACKGROUND and BACKGROUND-ALL summaries of each method of `groups`
+    (see `rollup`) to "summary_dir/METHOD/".
+    Returns the dict method -> list of (summary file, EvalSummary), sorted by file.
+    """
+    written = OrderedDict()
+    for (level, dims, summary_mdl) in groups:
+        if level == "background" and dims["method"] != ANY:
+            name = dims["background"]
+        elif level == "method":
+            name = ALL_BACKGROUNDS
+        else:
+            continue
+        out_dir = os.path.join(summary_dir, dims["method"])
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        summary_file = os.path.join(out_dir, name + SUMMARY_EXT)
+        summary_mdl.exportToFile(summary_file, pretty_print=pretty_print)
+        written.setdefault(dims["method"], []).append((summary_file, summary_mdl))
+    for summaries in written.values():
+        summaries.sort(key=lambda entry: entry[0])
+    return written
+
+
+def refreshSummaries(eval_dir, methods=None, analysis_dir=None, pretty_print=False):
+    """
+    Recompute the summaries of `methods` (all if None) from the evaluation
+    results of `eval_dir`, and their CSV table "analysis_dir/METHOD.summary.csv"
+    (like `run_eval.sh`) if `analysis_dir` is set. Returns the `rollup` groups.
+    """
+    records = [sampleRecord(*sample) for sample in iterEvalTree(eval_dir, methods)]
+    if not records:
+        return []
+    groups = rollup(buildTable(records))
+    written = writeSummaries(groups, eval_dir, pretty_print)
+    if analysis_dir is not None:
+        for (method, summaries) in written.items():
+            write_summary_csv(os.path.join(analysis_dir, method + ".summary.csv"), summaries)
+    return groups
+
+
+def cubeRow(level, dims, gr_mdl):
+    return ([level] + dims.values()
+            + [gr_mdl.mean_segmentation_precision,
+               gr_mdl.mean_segmentation_recall,
+               gr_mdl.detection_precision,
+               gr_mdl.detection_recall,
+               gr_mdl.mean_jaccard_index_smartdoc,
+               gr_mdl.mean_jaccard_index_segonly]
+            + [getattr(gr_mdl, name) for name in COUNTS])
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Compute all the summary levels of evaluation results in a single pass.',
+        version=PROG_VERSION)
+
+    parser.add_argument('sources',
+        nargs='+', metavar='source',
+        help="Evaluation directories (METHOD/BACKGROUND/DOCUMENT.segeval.xml) \
+              or partial-state files of a sharded evaluation.")
+    addLoggingArguments(parser)
+    addPrettyPrintArgument(parser)
+    parser.add_argument('-o', '--output-file',
+        help="Path to the cube table (CSV, one row per group of each level).")
+    parser.add_argument('-s', '--summary-dir',
+        action=StoreExistingOrCreatableDir,
+        help="Directory where METHOD/BACKGROUND.evalsummary.xml and \
+              METHOD/%s.evalsummary.xml summaries are written." % ALL_BACKGROUNDS)
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    for source in args.sources:
+        if not os.path.exists(source):
+            parser.error("'%s' does not exist." % source)
+    if args.output_file is None and args.summary_dir is None:
+        parser.error("Nothing to do: use '-o' and / or '-s'.")
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "rollup", PROG_VERSION, args.memprofile)
+
+    records = []
+    with profiler.stage("load"):
+        for source in args.sources:
+            samples = iterEvalTree(source) if os.path.isdir(source) else iterPartialState(source)
+            for (method, background, document, results) in samples:
+                records.append(sampleRecord(method, background, document, results))
+    profiler.count("samples", len(records))
+    if not records:
+        logger.error("No evaluation result found.")
+        return ERRCODE_NOFILE
+
+    with profiler.stage("aggregation"):
+        groups = rollup(buildTable(records))
+    logger.debug("--- Process complete. ---")
+
+    with profiler.stage("export"):
+        if args.summary_dir is not None:
+            writeSummaries(groups, args.summary_dir, args.pretty_print)
+        if args.output_file is not None:
+            with open(args.output_file, "wb") as ofile:
+                csv_writer = createCsvWriter(ofile)
+                csv_writer.writerow(CUBE_HEADER)
+                for (level, dims, summary_mdl) in groups:
+                    csv_writer.writerow(cubeRow(level, dims, summary_mdl.global_results))
+
+    for (level, dims, summary_mdl) in groups:
+        if level in ("method", "global"):
+            logger.info("%-10s %d frames, mean ji smartdoc = %f", dims["method"],
+                        summary_mdl.global_results.count_total_frames,
+                        summary_mdl.global_results.mean_jaccard_index_smartdoc)
+    logger.info("%d samples, %d groups.", len(records), len(groups))
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
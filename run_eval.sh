@@ -27,44 +27,42 @@ parallel -0 -a - \
     ::: $SDC_BACKGROUNDS
 
 
-# Check outputs completeness
-find ${SDC_PART} -mindepth 1 -maxdepth 1 -type d -print0 | \
-parallel -0 -a - \
-    'test -e "${SDC_PART}/{1/}/{2}/{3}.segresult.xml" || echo MISSING "${SDC_PART}/{1/}/{2}/{3}.segresult.xml"' \
-       ::: $SDC_BACKGROUNDS \
-       ::: $SDC_DOCUMENTS \
+# Compile the ground truth into an index shared by all the workers below
+python $SDC_TOOLS/build_gtindex.py \
+    ${SDC_GT} \
+    -o ${SDC_ROOT}/04-ground_truth.gtindex
+
+
+# Check outputs completeness and validity (JSON lines report, one per output)
+python $SDC_TOOLS/validate_segresults.py \
+    ${SDC_ROOT}/04-ground_truth.gtindex \
+    ${SDC_PART} \
+    -o ${SDC_ROOT}/00-validation_${timestamp}.jsonl \
    2>&1 | tee ${SDC_ROOT}/00-missing_outputs_${timestamp}.log
 
 
 # Evaluate segmentation outputs
-find ${SDC_PART} -mindepth 1 -maxdepth 1 -type d -print0 | \
-parallel -0 -a - \
-    python $SDC_TOOLS/eval_seg.py -d \
-        ${SDC_GT}/{2}/{3}.gt.xml \
-        ${SDC_PART}/{1/}/{2}/{3}.segresult.xml \
-        -o ${SDC_EVAL}/{1/}/{2}/{3}.segeval.xml \
-       ::: $SDC_BACKGROUNDS \
-       ::: $SDC_DOCUMENTS \
+# Note: add "-d" (or "--log-level debug") to get per-frame debug logs.
+#       Submission archives (ex: meth1.tar.gz containing meth1/background1/...)
+#       can be given instead of ${SDC_PART}, without extracting them.
+#       To split this step (and the merge and CSV steps below) across hosts,
+#       run it with "--shard I/N" on each host, then combine_shards.py
+#       (see README).
+python $SDC_TOOLS/batch_eval.py \
+    ${SDC_ROOT}/04-ground_truth.gtindex \
+    ${SDC_PART} \
+    -o ${SDC_EVAL} \
    2>&1 | tee ${SDC_ROOT}/01-eval_seg_${timestamp}.log
 
 
-# To merge segmentation results
-find ${SDC_EVAL} -mindepth 1 -maxdepth 1 -type d -print0 | \
-parallel -0 -a - \
-    'find ${SDC_EVAL}/{1/}/{2} -type f -iname "*.segeval.xml" | \
-        python $SDC_TOOLS/merge_evalres.py -d \
-        -f - \
-        -o ${SDC_EVAL}/{1/}/{2}.evalsummary.xml' \
-       ::: $SDC_BACKGROUNDS \
-   2>&1 | tee ${SDC_ROOT}/02-merge_evalres_${timestamp}.log
-
-find ${SDC_EVAL} -mindepth 1 -maxdepth 1 -type d -print0 | \
-parallel -0 -a - \
-    'find ${SDC_EVAL}/{1/} -maxdepth 1 -type f -iname "*.evalsummary.xml" | \
-        python $SDC_TOOLS/merge_evalres.py -d \
-        -f - \
-        -o ${SDC_EVAL}/{1/}/BACKGROUND-ALL.evalsummary.xml' \
-   2>&1 | tee ${SDC_ROOT}/03-merge_evalres_${timestamp}.log
+# To merge segmentation results: all the summary levels in a single pass
+# (METHOD/BACKGROUND and METHOD/BACKGROUND-ALL summaries, and a table of all
+# the levels, including document classes and all methods)
+python $SDC_TOOLS/rollup.py \
+    ${SDC_EVAL} \
+    -s ${SDC_EVAL} \
+    -o ${SDC_ANALYSIS}/GLOBAL.rollup.csv \
+   2>&1 | tee ${SDC_ROOT}/02-rollup_${timestamp}.log
 
 
 # Generate CSV summary from results
@@ -76,40 +74,12 @@ parallel -0 -a - \
    2>&1 | tee ${SDC_ROOT}/04-evalsum_to_csv_${timestamp}.log
 
 
-# Extract Jaccard Index for each frame, for each method
-
-find ${SDC_PART} -mindepth 1 -maxdepth 1 -type d -printf '%P\n' | \
-parallel "grep -r '<jaccard_index_smartdoc>' ${SDC_EVAL}/{} | \
-          sed 's:^${SDC_EVAL}/::g; 
-               s/.segeval.xml://g;
-               s:<jaccard_index_smartdoc>::g;
-               s:</jaccard_index_smartdoc>::g;
-               s/      /\t/g;
-               s:/:\t:g;' \
-          > ${SDC_ANALYSIS}/{}.ji-all-frames.csv"
-
-find ${SDC_PART} -mindepth 1 -maxdepth 1 -type d -printf '%P\n' | \
-sort | \
-parallel -j1 -X cat "${SDC_ANALYSIS}/{}.ji-all-frames.csv" | \
-sort  | \
-awk 'BEGIN { 
-      frame=0;
-      prev_doc="";
-      OFS="\t"
-    }
-    { 
-      if (prev_doc == $3) {
-        frame+=1;
-      } else {
-        frame=1; 
-        prev_doc=$3
-      }; 
-      print $1, $2, $3, frame, $4;  
-    }' > ${SDC_ANALYSIS}/GLOBAL.ji-all-frames.csv
-
-find ${SDC_PART} -mindepth 1 -maxdepth 1 -type d -printf '%P\n' | \
-parallel -X rm "${SDC_ANALYSIS}/{}.ji-all-frames.csv"
-
-python $SDC_TOOLS/smartdoc_ji_overview.py "${SDC_ANALYSIS}/GLOBAL.ji-all-frames.csv" "${SDC_ANALYSIS}"
+# Load all the evaluation results (global and frame results) into the results
+# warehouse, for the overview below and ad-hoc queries (query_results.py)
+python $SDC_TOOLS/ingest_results.py \
+    ${SDC_EVAL} \
+    -o ${SDC_ANALYSIS}/results.sqlite \
+   2>&1 | tee ${SDC_ROOT}/05-ingest_results_${timestamp}.log
 
+python $SDC_TOOLS/smartdoc_ji_overview.py "${SDC_ANALYSIS}/results.sqlite" "${SDC_ANALYSIS}"
 
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Single entry point for the SmartDoc evaluation tools.
+
+    smartdoc.py COMMAND [ARGS...]
+
+Each command is a regular tool of this suite (`smartdoc.py eval ...` is
+equivalent to `eval_seg.py ...`), but only the module of the selected tool is
+imported: OpenCV GUI, matplotlib or scipy are not loaded unless the command
+needs them. This keeps the startup time low when tools are called thousands
+of times by batch scripts.
+'''
+
+# ==============================================================================
+# Imports
+import os.path
+import sys
+import importlib
+from collections import OrderedDict
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "SmartDoc evaluation tools"
+
+ERRCODE_OK = 0
+ERRCODE_USAGE = 2
+
+# command -> (module, short description)
+COMMANDS = OrderedDict([
+    ("eval",      ("eval_seg",             "Evaluate a segmentation result against a ground truth.")),
+    ("multi",     ("eval_multi",           "Evaluate multi-object segmentation results.")),
+    ("sweep",     ("eval_sweep",           "Evaluate many segmentation results against one ground truth.")),
+    ("server",    ("eval_server",          "Evaluate jobs sent as JSON lines, keeping ground truth in memory.")),
+    ("gt-index",  ("build_gtindex",        "Compile ground truth files into a memory-mapped index.")),
+    ("validate",  ("validate_segresults",  "Check submissions (structure, corners, frame counts) before evaluation.")),
+    ("batch",     ("batch_eval",           "Evaluate whole submissions (directories or tar/zip archives).")),
+    ("combine",   ("combine_shards",       "Combine the shards of a sharded evaluation into summaries and CSV files.")),
+    ("rollup",    ("rollup",               "Compute all the summary levels of evaluation results in one pass.")),
+    ("merge",     ("merge_evalres",        "Merge evaluation results into a global summary.")),
+    ("csv",       ("evalsum_to_csv",       "Convert evaluation results or summaries to CSV.")),
+    ("ingest",    ("ingest_results",       "Load evaluation results into a SQLite results warehouse.")),
+    ("query",     ("query_results",        "Query a results warehouse.")),
+    ("viz",       ("viz",                  "Display or export a video with segmentations overlaid.")),
+    ("overview",  ("smartdoc_ji_overview", "Analyze per-frame Jaccard index measures.")),
+    ("worst",     ("worst_frames",         "Report the frames with the lowest Jaccard index, with thumbnails.")),
+    ("bench-gen", ("bench_gen",            "Generate synthetic data for benchmarks.")),
+    ("bench-run", ("bench_run",            "Run the per-stage benchmark.")),
+    ])
+
+
+# ==============================================================================
+def usage(prog, out=sys.stdout):
+    out.write("usage: %s [-h] [--version] COMMAND [ARGS...]\n\n" % prog)
+    out.write("%s\n\n" % PROG_NAME)
+    out.write("commands:\n")
+    for (cmd, (module, descr)) in COMMANDS.items():
+        out.write("  %-12s%s\n" % (cmd, descr))
+    out.write("\nRun '%s COMMAND -h' to get help about a command.\n" % prog)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    prog = os.path.basename(sys.argv[0])
+
+    if not argv or argv[0] in ("-h", "--help"):
+        usage(prog, sys.stdout if argv else sys.stderr)
+        return ERRCODE_OK if argv else ERRCODE_USAGE
+    if argv[0] == "--version":
+        sys.stdout.write("%s\n" % PROG_VERSION)
+        return ERRCODE_OK
+
+    cmd = argv[0]
+    if cmd not in COMMANDS:
+        usage(prog, sys.stderr)
+        sys.stderr.write("%s: error: unknown command '%s'\n" % (prog, cmd))
+        return ERRCODE_USAGE
+
+    (module_name, _descr) = COMMANDS[cmd]
+    module = importlib.import_module(module_name)
+    # argparse builds its usage messages from sys.argv[0]
+    sys.argv[0] = "%s %s" % (prog, cmd)
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
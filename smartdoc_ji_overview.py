@@ -10,17 +10,18 @@ import sys
 import io
 import re
 
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 import math
-from scipy import stats
+
+# pandas, numpy, matplotlib and scipy are slow to import: they are imported
+# once arguments are parsed (see `importPlottingModules()`).
 
 
 # ==============================================================================
 # SegEval Tools suite imports
 from utils.args import *
 from utils.log import *
+from utils.warehouse import isWarehouse, openWarehouse, JI_FRAMES_QUERY
+from utils.profiling import createProfiler
 
 # ==============================================================================
 logger = logging.getLogger(__name__)
@@ -35,6 +36,160 @@ ERRCODE_OK = 0
 ERRCODE_NOFILE = 10
 
 
+def importPlottingModules():
+    global pd, np, plt, stats
+    import pandas as pd
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from scipy import stats
+
+
+# ==============================================================================
+# Out-of-core analysis: frames are read by chunks (with categorical names),
+# and only per-group moments (method x background x document class) and
+# per-method histograms of Jaccard indices are kept in memory.
+
+FRAME_COLUMNS = ["method", "background", "document", "frame", "ji"]
+NAME_COLUMNS = ["method", "background", "document"]
+GROUP_KEYS = ["method", "background", "docclass"]
+MOMENTS = ["count", "sum", "m2", "min", "max"]
+
+# resolution of the Jaccard index quartiles (and box plots)
+HIST_BINS = 10000
+
+
+def iterFrameChunks(input_file, chunk_size):
+    """
+    Generates DataFrames of at most `chunk_size` frames (FRAME_COLUMNS, names
+    being categorical) read from a CSV file (or stdin) or a results warehouse.
+    """
+    if input_file != "-" and isWarehouse(input_file):
+        conn = openWarehouse(input_file)
+        try:
+            for chunk in pd.read_sql_query(JI_FRAMES_QUERY, conn, chunksize=chunk_size):
+                for col in NAME_COLUMNS:
+                    chunk[col] = chunk[col].astype("category")
+                yield chunk
+        finally:
+            conn.close()
+    else:
+        dtypes = dict((col, "category") for col in NAME_COLUMNS)
+        dtypes.update(frame=np.int64, ji=np.float64)
+        for chunk in pd.read_csv(sys.stdin if input_file == "-" else input_file,
+                                 delim_whitespace=True, names=FRAME_COLUMNS,
+                                 dtype=dtypes, chunksize=chunk_size):
+            yield chunk
+
+
+def documentClasses(documents):
+    """Categorical Series of documents ---> document classes ("paper004" -> "paper")."""
+    # computed once per category, not once per frame
+    classes = documents.cat.categories.str.split("0", n=1).str[0]
+    return pd.Series(pd.Categorical(np.asarray(classes)[documents.cat.codes]), index=documents.index)
+
+
+def combineMoments(moments, by):
+    """
+    DataFrame of group moments (group columns and MOMENTS: "m2" is the sum of
+    squared deviations from the mean) ---> same, for groups of `by`.
+    """
+    moments = moments.reset_index(drop=True)
+    grouped = moments.groupby(by, sort=True)
+    mean = grouped["sum"].transform("sum") / grouped["count"].transform("sum")
+    # deviation of each group mean from the mean of the combined group
+    moments["m2"] += moments["count"] * (moments["sum"] / moments["count"] - mean) ** 2
+    moments = moments.groupby(by, sort=True).agg(
+        {"count": "sum", "sum": "sum", "m2": "sum", "min": "min", "max": "max"}).reset_index()
+    return moments[by + MOMENTS]
+
+
+class JiAccumulator(object):
+    """
+    Incremental statistics of frame Jaccard indices: moments by GROUP_KEYS,
+    and histograms (HIST_BINS bins over [0, 1]) by method.
+    """
+    def __init__(self):
+        self.moments = None
+        self.histograms = {}
+        self.frames = 0
+
+    def add(self, chunk):
+        chunk["docclass"] = documentClasses(chunk["document"])
+        grouped = chunk.groupby(GROUP_KEYS, observed=True)["ji"]
+        moments = grouped.agg(["count", "sum", "min", "max"])
+        moments["m2"] = grouped.var(ddof=0) * moments["count"]
+        moments = moments.reset_index()[GROUP_KEYS + MOMENTS]
+        for col in GROUP_KEYS: # categories differ from chunk to chunk
+            moments[col] = moments[col].astype(str)
+        if self.moments is not None:
+            moments = combineMoments(pd.concat([self.moments, moments]), GROUP_KEYS)
+        self.moments = moments
+        bins = np.clip((chunk["ji"].values * HIST_BINS).astype(np.int64), 0, HIST_BINS - 1)
+        for (method, rows) in chunk.groupby("method", observed=True).indices.items():
+            hist = np.bincount(bins[rows], minlength=HIST_BINS)
+            if method in self.histograms:
+                self.histograms[method] += hist
+            else:
+                self.histograms[method] = hist
+        self.frames += len(chunk)
+
+
+def meanTable(moments, index, columns):
+    """
+    Mean Jaccard index by `index` (and `columns`), with "All" margins, like
+    `pivot_table(frames, values=['ji'], ..., aggfunc=np.average, margins=True)`.
+    """
+    (sums, counts) = [pd.pivot_table(moments.rename(columns={col: "ji"}), values=["ji"], index=index,
+                                     columns=columns, aggfunc=np.sum, margins=True)
+                      for col in ["sum", "count"]]
+    return sums / counts
+
+
+def histQuantile(hist, q, vmin, vmax):
+    """Quantile `q` of the values of a histogram over [0, 1] (linear interpolation within bins)."""
+    cumulated = np.cumsum(hist)
+    target = q * cumulated[-1]
+    b = min(np.searchsorted(cumulated, target), len(hist) - 1)
+    before = cumulated[b] - hist[b]
+    value = (b + (target - before) / float(hist[b])) / len(hist) if hist[b] else b / float(len(hist))
+    return min(max(value, vmin), vmax)
+
+
+def describeMethods(acc):
+    """
+    DataFrame like `frames[['method', 'ji']].groupby('method').describe()`
+    (quartiles are estimated from histograms, within 1 / HIST_BINS).
+    """
+    moments = combineMoments(acc.moments, ["method"]).set_index("method")
+    rows = []
+    for (method, mom) in moments.iterrows():
+        hist = acc.histograms[method]
+        rows.append([mom["count"], mom["sum"] / mom["count"],
+                     math.sqrt(mom["m2"] / (mom["count"] - 1)) if mom["count"] > 1 else np.nan,
+                     mom["min"]]
+                    + [histQuantile(hist, q, mom["min"], mom["max"]) for q in (0.25, 0.5, 0.75)]
+                    + [mom["max"]])
+    return pd.DataFrame(rows, index=moments.index,
+                        columns=pd.MultiIndex.from_product([["ji"], ["count", "mean", "std", "min",
+                                                                     "25%", "50%", "75%", "max"]]))
+
+
+def boxPlot(description):
+    """Box plot of the Jaccard index by method, from `describeMethods()` (whiskers at 1.5 IQR, no fliers)."""
+    boxes = []
+    for (method, desc) in description["ji"].iterrows():
+        iqr = desc["75%"] - desc["25%"]
+        boxes.append({"label": method, "med": desc["50%"], "q1": desc["25%"], "q3": desc["75%"],
+                      "whislo": max(desc["min"], desc["25%"] - 1.5 * iqr),
+                      "whishi": min(desc["max"], desc["75%"] + 1.5 * iqr),
+                      "fliers": []})
+    plt.figure()
+    ax = plt.subplot(111)
+    ax.bxp(boxes, vert=False, showfliers=False)
+    ax.tick_params(labelsize=9)
+    ax.set_title("ji by method")
+
+
 def barPlt(arr, sems, title, xlab, ylab):
     ind = np.arange(len(arr)) # create the x-axis
     fig = plt.figure()
@@ -63,27 +218,29 @@ def main(argv=None):
         description=PROG_NAME, 
         version=PROG_VERSION)
 
-    parser.add_argument('-d', '--debug', 
-        action="store_true", 
-        help="Activate debug output.")
+    addLoggingArguments(parser)
 
     parser.add_argument('input_file', 
         action=StoreValidFilePathOrStdin,
-        help='CSV file containing Jaccard Index measures for each frame (or - for stdin).')
+        help='CSV file containing Jaccard Index measures for each frame (or - for stdin), \
+              or results warehouse (see ingest_results.py).')
 
     parser.add_argument('output_dir', 
         action=StoreExistingOrCreatableDir,
         help='Place where results should be stored.')
 
-    args = parser.parse_args()
+    parser.add_argument('--chunk-size',
+        action=StoreIntPositive, default=1000000,
+        help='Number of frames (>= 1) read (and held in memory) at once.')
+
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
 
     # -----------------------------------------------------------------------------
     # Logger activation
-    initLogger(logger)
-    output_prettyprint = False
-    if args.debug:
-        logger.setLevel(logging.DEBUG)
-        output_prettyprint = True
+    initLoggingFromArgs(logger, args)
     
     # -----------------------------------------------------------------------------
     # Output log header
@@ -97,81 +254,88 @@ def main(argv=None):
     
     # --------------------------------------------------------------------------
     logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "smartdoc_ji_overview", PROG_VERSION, args.memprofile)
+    with profiler.stage("import"):
+        importPlottingModules()
 
-    data = pd.read_csv(args.input_file, 
-                       delim_whitespace=True,
-                       names=["method","background","document", "frame", "ji"])
-
+    acc = JiAccumulator()
+    with profiler.stage("read"):
+        for chunk in iterFrameChunks(args.input_file, args.chunk_size):
+            acc.add(chunk)
+            logger.debug("%d frames read.", acc.frames)
+    profiler.count("frames", acc.frames)
+    if acc.moments is None:
+        logger.error("No frame to analyze in '%s'.", args.input_file)
+        return ERRCODE_NOFILE
 
-    table = pd.pivot_table(data, values=['ji'], index=['background'], columns=['method'], aggfunc=np.average, margins=True)
-    table.plot(kind='bar')
-    print table;
+    with profiler.stage("tables"):
+        table = meanTable(acc.moments, ['background'], ['method'])
+        table.plot(kind='bar')
+        print table;
 
-    table2 = pd.pivot_table(data, values=['ji'], index=['background'], columns=[], aggfunc=np.average, margins=True)
-    table2.plot(kind='bar')
-    print table2;
+        table2 = meanTable(acc.moments, ['background'], [])
+        table2.plot(kind='bar')
+        print table2;
 
-    data[['docclass']] = data[['document']].applymap(lambda d: d.split("0")[0])
-    table3 = pd.pivot_table(data, values=['ji'], index=['docclass'], columns=['method'], aggfunc=np.average, margins=True)
-    table3.plot(kind='bar')
-    print table3;
+        table3 = meanTable(acc.moments, ['docclass'], ['method'])
+        table3.plot(kind='bar')
+        print table3;
 
-    table4 = pd.pivot_table(data, values=['ji'], index=['docclass'], columns=[], aggfunc=np.average, margins=True)
-    table4.plot(kind='bar')
-    print table4;
+        table4 = meanTable(acc.moments, ['docclass'], [])
+        table4.plot(kind='bar')
+        print table4;
 
-    data.boxplot(column='ji', by=u'method', fontsize=9, vert=False)
-    print "Data:"
-    print data[['method', 'ji']].groupby('method').describe()
+    with profiler.stage("description"):
+        description = describeMethods(acc)
+        boxPlot(description)
+        print "Data:"
+        print description
 
-    plt.figure()
+    with profiler.stage("plots"):
+        plt.figure()
 
-    methods = data['method'].unique()
-    
-    results = {}
+        results = {}
 
-    for m in map(str, methods):
-        values = data[data['method'] == m]['ji']
-        n, min_max, mean, var, skew, kurt = stats.describe(values)
-        std = math.sqrt(var)
-        R = stats.norm.interval(0.95,loc=mean,scale=std/math.sqrt(len(values))) 
-        results[m] = (mean, R)
+        for (m, desc) in description["ji"].iterrows():
+            n, mean, std = desc["count"], desc["mean"], desc["std"]
+            R = stats.norm.interval(0.95,loc=mean,scale=std/math.sqrt(n)) 
+            results[m] = (mean, R)
 
-    print "CI:"
-    to_plot = []
-    for (m, (mean, (cil,cih))) in results.items():
-        print  m, '\t', mean, '\t', cil, '\t', cih
-        to_plot.append([m, mean, cil, cih])
+        print "CI:"
+        to_plot = []
+        for (m, (mean, (cil,cih))) in results.items():
+            print  m, '\t', mean, '\t', cil, '\t', cih
+            to_plot.append([m, mean, cil, cih])
 
-    fig = plt.gca()
-    mean_values, ci = zip(*[r for r in results.itervalues()])
-    bar_labels = [str(m) for m in results.iterkeys()]
+        fig = plt.gca()
+        mean_values, ci = zip(*[r for r in results.itervalues()])
+        bar_labels = [str(m) for m in results.iterkeys()]
 
-    ci2 = [(cih - m) for (m, (cil, cih)) in results.itervalues()]
+        ci2 = [(cih - m) for (m, (cil, cih)) in results.itervalues()]
 
-    # plot bars
-    x_pos = list(range(len(to_plot)))
-    # plt.bar(x_pos, mean_values, yerr=ci, align='center', alpha=0.5)
-    # plt.bar(x_pos, mean_values, yerr=ci2, align='center', alpha=0.5)
-    plt.barh(x_pos, mean_values, xerr=ci2, align='center', alpha=0.5)
+        # plot bars
+        x_pos = list(range(len(to_plot)))
+        # plt.bar(x_pos, mean_values, yerr=ci, align='center', alpha=0.5)
+        # plt.bar(x_pos, mean_values, yerr=ci2, align='center', alpha=0.5)
+        plt.barh(x_pos, mean_values, xerr=ci2, align='center', alpha=0.5)
 
-    # set height of the y-axis
-    plt.xlim([0,1])
+        # set height of the y-axis
+        plt.xlim([0,1])
 
-    # set axes labels and title
-    plt.xlabel('Jaccard Index')
-    plt.yticks(x_pos, bar_labels)
-    plt.title('Overvall Evaluation')
+        # set axes labels and title
+        plt.xlabel('Jaccard Index')
+        plt.yticks(x_pos, bar_labels)
+        plt.title('Overvall Evaluation')
 
-    # axis formatting
-    fig.axes.get_yaxis().set_visible(True)
-    fig.spines["top"].set_visible(False)  
-    fig.spines["right"].set_visible(False)  
-    plt.tick_params(axis="both", which="both", bottom="off", top="off",  
-                    labelbottom="on", left="on", right="off", labelleft="on")  
+        # axis formatting
+        fig.axes.get_yaxis().set_visible(True)
+        fig.spines["top"].set_visible(False)  
+        fig.spines["right"].set_visible(False)  
+        plt.tick_params(axis="both", which="both", bottom="off", top="off",  
+                        labelbottom="on", left="on", right="off", labelleft="on")  
 
-    plt.show()
-    plt.savefig(os.path.join(args.output_dir, "meth_vs_perf.pdf"))
+        plt.show()
+        plt.savefig(os.path.join(args.output_dir, "meth_vs_perf.pdf"))
 
 
 
@@ -180,6 +344,9 @@ def main(argv=None):
     logger.debug("--- Process complete. ---")
     # --------------------------------------------------------------------------
 
+    if args.profile is not None:
+        profiler.write(args.profile)
+
     logger.debug("Clean exit.")
     logger.debug(DBGSEP)
     return ERRCODE_OK
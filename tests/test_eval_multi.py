@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks for eval_multi frame evaluation.
+Run from the repository root: python -m unittest discover -s tests
+"""
+
+# ==============================================================================
+# Imports
+import unittest
+
+from models.models import FrameSegResult, ObjectShape, Pt, TRUE_REJECTED_STR, FALSE_REJECTED_STR, FALSE_ACCEPTED_STR
+from eval_multi import TargetRegions, evalFrameObjects
+
+# ==============================================================================
+
+
+def detectionFrame(index, corners=None):
+    """Not rejected FrameSegResult, with 4 points if `corners` (TL, BL, BR, TR) is set."""
+    frame = FrameSegResult(index=index, rejected=False)
+    if corners is not None:
+        for (name, (x, y)) in zip(["tl", "bl", "br", "tr"], corners):
+            frame.points[name] = Pt(name=name, x=x, y=y)
+    return frame
+
+
+SQUARE = [(10, 10), (10, 110), (110, 110), (110, 10)]
+
+
+class TestFramesWithoutPoints(unittest.TestCase):
+    def setUp(self):
+        self.targets = TargetRegions(ObjectShape(width=100, height=100))
+
+    def test_no_detection_anywhere(self):
+        (results, selfint) = evalFrameObjects(1, self.targets, detectionFrame(1), detectionFrame(1))
+        self.assertEqual([fr.match_type for fr in results], [TRUE_REJECTED_STR])
+        self.assertEqual(selfint, 0)
+
+    def test_no_detection_in_result(self):
+        (results, _selfint) = evalFrameObjects(1, self.targets, detectionFrame(1, SQUARE), detectionFrame(1))
+        self.assertEqual([fr.match_type for fr in results], [FALSE_REJECTED_STR])
+
+    def test_no_object_in_ground_truth(self):
+        (results, _selfint) = evalFrameObjects(1, self.targets, detectionFrame(1), detectionFrame(1, SQUARE))
+        self.assertEqual([fr.match_type for fr in results], [FALSE_ACCEPTED_STR])
+
+
+# ==============================================================================
+if __name__ == "__main__":
+    unittest.main()
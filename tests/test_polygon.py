@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks for utils.polygon self-intersection tests.
+Run from the repository root: python -m unittest discover -s tests
+"""
+
+# ==============================================================================
+# Imports
+import math
+import random
+import time
+import unittest
+
+import Polygon
+
+from utils.polygon import isSelfIntersecting
+
+# ==============================================================================
+
+
+def starPolygon(n, seed=0):
+    """Simple (star-shaped) n-gon: random radii around the origin, by angle."""
+    rand = random.Random(seed)
+    pts = []
+    for k in range(n):
+        (angle, radius) = (2 * math.pi * k / n, rand.uniform(50, 100))
+        pts.append((radius * math.cos(angle), radius * math.sin(angle)))
+    return pts
+
+
+def timeCheck(pts, repeat=3):
+    """Best time of isSelfIntersecting on pts, with its result."""
+    poly = Polygon.Polygon(pts)
+    best = None
+    for _ in range(repeat):
+        t0 = time.time()
+        res = isSelfIntersecting(poly)
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return (best, res)
+
+
+class TestSelfIntersection(unittest.TestCase):
+    def test_small(self):
+        self.assertFalse(isSelfIntersecting(Polygon.Polygon([(0, 0), (0, 10), (10, 10), (10, 0)])))
+        self.assertTrue(isSelfIntersecting(Polygon.Polygon([(0, 0), (0, 10), (10, 0), (10, 10)])))
+
+    def test_large_ngon(self):
+        pts = starPolygon(20000)
+        self.assertFalse(isSelfIntersecting(Polygon.Polygon(pts)))
+        # swapping two vertices far apart creates crossings
+        (pts[100], pts[10000]) = (pts[10000], pts[100])
+        self.assertTrue(isSelfIntersecting(Polygon.Polygon(pts)))
+
+    def test_scaling(self):
+        # O(n log n): 16 times more edges must not cost much more than 
+        # 16 * log ratio (~1.4); O(n^2) would cost ~256 times more.
+        (small_n, big_n) = (4000, 64000)
+        (t_small, res_small) = timeCheck(starPolygon(small_n))
+        (t_big, res_big) = timeCheck(starPolygon(big_n), repeat=1)
+        self.assertFalse(res_small)
+        self.assertFalse(res_big)
+        ratio = t_big / max(t_small, 1e-6)
+        self.assertLess(ratio, 3 * float(big_n) / small_n,
+                        "%d-gon took %.1fx the time of a %d-gon" % (big_n, ratio, small_n))
+
+
+# ==============================================================================
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Access to the segmentation results of a submission, either stored in a
+directory or in a tar (possibly compressed) or zip archive, without extracting
+it. Results are expected at "[PREFIX/]METHOD/BACKGROUND/DOCUMENT.segresult.xml"
+(only the last 3 components of member names are used).
+
+`mapSegResults` processes all the results of submissions with worker
+processes, the main process only reading files or archive members; an item
+which makes its worker raise or die gets a failed result, the other ones are
+still processed.
+Both can be restricted to a shard of the tasks (see utils/shard.py).
+`WorkerPool` keeps worker processes alive between calls, for items read by
+the caller (see `readSegResult`).
+'''
+
+# ==============================================================================
+# Imports
+import os
+import os.path
+import time
+import signal
+import threading
+import multiprocessing
+import multiprocessing.queues
+import tarfile
+import zipfile
+from collections import namedtuple
+
+# ==============================================================================
+from utils.profiling import NULL_PROFILER
+from utils.shard import inShard
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+# Constants
+SEGRESULT_EXT = ".segresult.xml"
+
+""" Segmentation result of a submission, and its content (str). """
+SubmissionItem = namedtuple("SubmissionItem", ["method", "background", "document", "name", "data"])
+
+# ==============================================================================
+
+def isArchive(path):
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def parseMemberName(name):
+    """
+    'PREFIX/METHOD/BACKGROUND/DOCUMENT.segresult.xml' ---> (method, background, document)
+    None if `name` is not a segmentation result.
+    """
+    parts = name.replace("\\", "/").split("/")
+    if len(parts) < 3 or not parts[-1].endswith(SEGRESULT_EXT):
+        return None
+    return (parts[-3], parts[-2], parts[-1][:-len(SEGRESULT_EXT)])
+
+
+def _iterZip(path):
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            yield info.filename, lambda info=info: zf.read(info)
+
+
+def _iterTar(path):
+    # stream mode: members are read in order, compressed tars are decompressed once
+    tf = tarfile.open(path, "r|*")
+    try:
+        for member in tf:
+            if member.isfile():
+                yield member.name, lambda member=member: tf.extractfile(member).read()
+    finally:
+        tf.close()
+
+
+def _iterDir(path):
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            def read(full_path=full_path):
+                with open(full_path, "rb") as in_f:
+                    return in_f.read()
+            yield os.path.relpath(full_path, path), read
+
+
+def iterSegResults(path, shard=None, seen=None):
+    """
+    Generates a SubmissionItem for each segmentation result of the
+    submission `path` (directory or archive), in storage order.
+    Only the segmentation results (of `shard`, if set) are read.
+    If `seen` (set) is given, the (method, background, document) of all the
+    segmentation results found, in any shard, are added to it.
+    """
+    if os.path.isdir(path):
+        entries = _iterDir(path)
+    elif zipfile.is_zipfile(path):
+        entries = _iterZip(path)
+    else:
+        entries = _iterTar(path)
+    for (name, read) in entries:
+        parsed = parseMemberName(name)
+        if parsed is None:
+            logger.debug("Skipping '%s'.", name)
+            continue
+        (method, background, document) = parsed
+        if seen is not None:
+            seen.add(parsed)
+        if not inShard(method, background, document, shard):
+            continue
+        yield SubmissionItem(method, background, document, name, read())
+
+
+def readSegResult(root, path):
+    """
+    SubmissionItem of the segmentation result file `path` of the submission
+    directory `root`. None if `path` is not at METHOD/BACKGROUND/DOCUMENT.segresult.xml.
+    """
+    name = os.path.relpath(path, root)
+    parsed = parseMemberName(name)
+    if parsed is None:
+        return None
+    with open(path, "rb") as in_f:
+        data = in_f.read()
+    (method, background, document) = parsed
+    return SubmissionItem(method, background, document, name, data)
+
+
+_worker = None # worker process state (see `mapSegResults`)
+_started = None # queue of the (pid, task id) of the tasks started by workers
+
+def _initWorker(worker_class, worker_args, started):
+    global _worker, _started
+    # Ctrl-C is handled by the main process, which then terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker = worker_class(*worker_args)
+    _started = started
+
+def _callWorker(worker, submission, item):
+    """`worker(submission, item)`, or `worker.failed(submission, item, error)` if it raises."""
+    try:
+        return worker(submission, item)
+    except Exception, e:
+        logger.debug("Processing of '%s:%s' failed.", submission, item.name, exc_info=True)
+        return worker.failed(submission, item, str(e))
+
+def _processItem(task):
+    (task_id, submission, item) = task
+    _started.put((os.getpid(), task_id))
+    return (task_id, _callWorker(_worker, submission, item))
+
+
+def _seenSet(seen, submission):
+    return seen.setdefault(submission, set()) if seen is not None else None
+
+
+def _isAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class _TaskPool(object):
+    """
+    Pool of `jobs` worker processes, which tracks the task run by each worker:
+    the tasks of a worker which died (ex: killed when out of memory) fail,
+    instead of never completing (the pool itself replaces the worker).
+    Results are given to the callback of each task, in completion order.
+    """
+    def __init__(self, worker_class, worker_args, jobs):
+        self._worker_class = worker_class
+        self._started = multiprocessing.queues.SimpleQueue()
+        self._pool = multiprocessing.Pool(jobs, _initWorker, (worker_class, worker_args, self._started))
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._pending = {} # task id -> (submission, item without data, callback)
+        self._running = {} # task id -> worker pid
+        self.lost = 0 # number of tasks lost with their worker
+
+    def submit(self, submission, item, callback):
+        with self._lock:
+            task_id = self._next_id
+            self._next_id += 1
+            self._pending[task_id] = (submission, item._replace(data=None), callback)
+        self._pool.apply_async(_processItem, [(task_id, submission, item)], callback=self._done)
+
+    def _done(self, task_result):
+        (task_id, result) = task_result
+        with self._lock:
+            entry = self._pending.pop(task_id, None)
+            self._running.pop(task_id, None)
+        if entry is not None:
+            entry[2](entry[0], result)
+
+    def _failDeadWorkers(self):
+        while not self._started.empty():
+            (pid, task_id) = self._started.get()
+            with self._lock:
+                if task_id in self._pending:
+                    self._running[task_id] = pid
+        with self._lock:
+            dead = [task_id for (task_id, pid) in self._running.items() if not _isAlive(pid)]
+        for task_id in dead:
+            with self._lock:
+                entry = self._pending.pop(task_id, None)
+                pid = self._running.pop(task_id, None)
+            if entry is None: # completed meanwhile
+                continue
+            (submission, item, callback) = entry
+            logger.error("Worker process %d died while processing '%s:%s'.", pid, submission, item.name)
+            self.lost += 1
+            callback(submission, self._worker_class.failed(submission, item, "Worker process died."))
+
+    def wait(self, count=0):
+        """Wait until at most `count` tasks are pending."""
+        while True:
+            with self._lock:
+                if len(self._pending) <= count:
+                    return
+            time.sleep(0.01) # (polling keeps Ctrl-C working)
+            self._failDeadWorkers()
+
+    def close(self):
+        """Wait for all the tasks, and stop the workers."""
+        self.wait(0)
+        if self.lost:
+            # the pool never completes lost tasks, and would wait for them forever
+            self._pool.terminate()
+        else:
+            self._pool.close()
+            self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+
+
+def mapSegResults(submissions, worker_class, worker_args, jobs, profiler=NULL_PROFILER, shard=None, seen=None):
+    """
+    Call `worker(submission, item)` for each segmentation result (SubmissionItem)
+    of `submissions` (list of paths), `worker` being a `worker_class(*worker_args)`
+    instance created once in each of the `jobs` worker processes (or in the
+    calling process if `jobs` <= 1). If a worker raises an exception (or its
+    process dies), the result of the item is `worker_class.failed(submission,
+    item, error)` (a static method, `item.data` may be None).
+    Only the results of `shard` ((I, N) tuple) are processed, if set.
+    If `seen` (dict) is given, `seen[submission]` is set to the set of
+    (method, background, document) of all the results found in `submission`.
+    Returns the list of (submission, result), in completion order.
+    """
+    results = []
+    if jobs <= 1:
+        worker = worker_class(*worker_args)
+        for submission in submissions:
+            for item in iterSegResults(submission, shard, _seenSet(seen, submission)):
+                with profiler.stage("processing"):
+                    results.append((submission, _callWorker(worker, submission, item)))
+        return results
+
+    pool = _TaskPool(worker_class, worker_args, jobs)
+    def done(submission, result):
+        results.append((submission, result))
+    try:
+        for submission in submissions:
+            with profiler.stage("dispatch"):
+                for item in iterSegResults(submission, shard, _seenSet(seen, submission)):
+                    # bounds the number of members read but not processed yet
+                    pool.wait(jobs * 4 - 1)
+                    pool.submit(submission, item, done)
+        with profiler.stage("processing"):
+            pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    return results
+
+
+class WorkerPool(object):
+    """
+    Persistent pool of `jobs` worker processes (or the calling process if
+    `jobs` <= 1), each one with its own `worker_class(*worker_args)` instance
+    (and its caches), like `mapSegResults` workers.
+    """
+    def __init__(self, worker_class, worker_args, jobs):
+        self._args = (worker_class, worker_args, jobs)
+        self._pool = None
+        self._worker = None
+        if jobs <= 1:
+            self._worker = worker_class(*worker_args)
+        else:
+            self._pool = _TaskPool(*self._args)
+
+    def map(self, tasks):
+        """list of (submission, SubmissionItem) ---> list of worker results, in the same order."""
+        if self._worker is not None:
+            return [_callWorker(self._worker, *task) for task in tasks]
+        results = [None] * len(tasks)
+        def done(pos, result):
+            results[pos] = result
+        for (pos, (submission, item)) in enumerate(tasks):
+            self._pool.submit(submission, item, lambda _submission, result, pos=pos: done(pos, result))
+        self._pool.wait(0)
+        if self._pool.lost: # the pool cannot be closed cleanly anymore
+            self._pool.close()
+            self._pool = _TaskPool(*self._args)
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
@@ -5,20 +5,26 @@
 # Imports
 import os.path
 import argparse
+import logging
 
 # ==============================================================================
-from utils.log import createAndInitLogger
-logger = createAndInitLogger(__name__)
+from utils.log import createLogger, initLogger
+from utils.compression import resolvePath
+logger = createLogger(__name__)
 
 # ==============================================================================
+# File paths are resolved to a compressed version of the file (ex: 'X.xml.gz')
+# when the file itself does not exist (see utils/compression.py).
 class StoreValidFilePath(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
+        values = resolvePath(values)
         if not os.path.isfile(values):
             parser.error("'%s' does not exist or is not a file." % values)
         setattr(namespace, self.dest, values)
 
 class StoreValidFilePaths(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
+        values = [resolvePath(filename) for filename in values]
         for filename in values:
             if not os.path.isfile(filename):
                 parser.error("'%s' does not exist or is not a file." % filename)
@@ -26,8 +32,10 @@ class StoreValidFilePaths(argparse.Action):
 
 class StoreValidFilePathOrStdin(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
-        if not values == '-' and not os.path.isfile(values):
-            parser.error("'%s' does not exist or is not a file." % values)
+        if not values == '-':
+            values = resolvePath(values)
+            if not os.path.isfile(values):
+                parser.error("'%s' does not exist or is not a file." % values)
         setattr(namespace, self.dest, values)
 
 class StoreValidDir(argparse.Action):
@@ -36,6 +44,14 @@ class StoreValidDir(argparse.Action):
             parser.error("'%s' does not exist or is not a directory." % values)
         setattr(namespace, self.dest, values)
 
+class StoreValidGroundTruthRoot(argparse.Action):
+    """Directory of ground truth files, or ground truth index file (see utils/gtindex.py)."""
+    def __call__(self, parser, namespace, values, option_string=None):
+        from utils.gtindex import isIndexFile # (imports numpy)
+        if not os.path.isdir(values) and not isIndexFile(values):
+            parser.error("'%s' is neither a directory nor a ground truth index." % values)
+        setattr(namespace, self.dest, values)
+
 class StoreExistingOrCreatableDir(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
         if type(values) is not str:
@@ -85,6 +101,30 @@ class StoreIntZeroPositive(argparse.Action):
         setattr(namespace, self.dest, intval)
 
 
+class StoreIntPositive(argparse.Action):
+    def __call__(self, parser, namespace, values, option_string=None):
+        intval = None
+        try:
+            intval = int(values)
+        except:
+            parser.error("'%s' cannot be coerced to an int value." % values)
+            
+        if intval < 1:
+            parser.error("'%s' does not represent an int >= 1." % values)
+        setattr(namespace, self.dest, intval)
+
+
+class StoreShard(argparse.Action):
+    """'I/N' ---> (I, N) tuple (see utils/shard.py)."""
+    def __call__(self, parser, namespace, values, option_string=None):
+        from utils.shard import parseShard
+        try:
+            shard = parseShard(values)
+        except ValueError, e:
+            parser.error(str(e))
+        setattr(namespace, self.dest, shard)
+
+
 class Store0to1float(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
         floatval = None
@@ -98,7 +138,53 @@ class Store0to1float(argparse.Action):
         setattr(namespace, self.dest, floatval)
 
 
+def addProfileArgument(parser):
+    """Add the '--profile' and '--memprofile' options shared by all command line tools."""
+    parser.add_argument('--profile', metavar="PROFILE_FILE",
+        help="Record wall and CPU time per processing stage, and event counts, \
+              and append them as a JSON line to PROFILE_FILE ('-' for stderr).")
+    parser.add_argument('--memprofile',
+        action="store_true",
+        help="With '--profile', also record peak RSS per stage, and with tracemalloc \
+              (when available) traced memory and top allocation sites, or else \
+              new objects by type (gc).")
+
+
+def checkProfileArguments(parser, args):
+    """Reject '--memprofile' without '--profile' (call after parsing)."""
+    if args.memprofile and args.profile is None:
+        parser.error("'--memprofile' requires '--profile'.")
+
+
+LOG_LEVELS = ["debug", "info", "warning", "error"]
+
+def addLoggingArguments(parser):
+    """Add the '-d/--debug', '--log-level' and '--log-json' options shared by command line tools."""
+    parser.add_argument('-d', '--debug', 
+        action="store_true", 
+        help="Activate debug output (same as '--log-level debug').")
+    parser.add_argument('--log-level', 
+        choices=LOG_LEVELS, default="info",
+        help="Minimum level of log messages.")
+    parser.add_argument('--log-json', metavar="LOG_FILE",
+        help="Also append log records as JSON lines to LOG_FILE ('-' for stderr). \
+              Records are formatted and written by a background thread.")
+
+
+def addPrettyPrintArgument(parser):
+    """Add the '-p/--pretty-print' option of tools producing XML files."""
+    parser.add_argument('-p', '--pretty-print', 
+        action="store_true", 
+        help="Indent XML output (bigger files, slower export).")
+
+
+def initLoggingFromArgs(logger, args):
+    """Configure `logger` according to the options added by `addLoggingArguments`."""
+    level = getattr(logging, args.log_level.upper())
+    initLogger(logger, debug=args.debug, level=level, json_file=args.log_json)
+
+
 def dumpArgs(args, logger=logger):
     logger.debug("Arguments:")
     for (k, v) in args.__dict__.items():
-        logger.debug("    %-20s = %s" % (k, v))
+        logger.debug("    %-20s = %s", k, v)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Compact evaluation results: the XML file only contains source files, global
+(and temporal) results, and frame results are stored in a binary sidecar
+(numpy ".npz" archive of typed arrays), referenced by the
+"<frame_results_file>" element of the XML file.
+
+    SAMPLE.segeval.xml  (EvalResult without frame elements)
+    SAMPLE.segeval.npz  (index, match_type, precision, recall, JIs, surfaces,
+                         and object names for multi-object results)
+
+Frame values are stored in double precision, so compact and XML results give
+the same numbers to every reader. Readers which only need global results (merge_evalres.py, 
+evalsum_to_csv.py) do not need to load the sidecar.
+'''
+
+# ==============================================================================
+# Imports
+import os
+import os.path
+
+import numpy as np
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.compression import stripCompressionExt
+from models.models import (EvalResult, FrameEvalResult, SegSurfaces,
+                           TRUE_ACCEPTED_STR, TRUE_REJECTED_STR, FALSE_ACCEPTED_STR, FALSE_REJECTED_STR)
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+# Constants
+SIDECAR_EXT = ".npz"
+
+# match type <---> uint8 code (position in this list)
+MATCH_TYPES = [TRUE_ACCEPTED_STR, TRUE_REJECTED_STR, FALSE_ACCEPTED_STR, FALSE_REJECTED_STR]
+
+FLOAT_FIELDS = ["segmentation_precision", "segmentation_recall",
+                "jaccard_index_smartdoc", "jaccard_index_segonly"]
+
+# rows of the "values" array of the sidecar
+VALUE_COLUMNS = FLOAT_FIELDS + ["surface_test", "surface_intersection"]
+
+# object names of multi-object results (eval_multi.py), "" for none;
+# only stored when some frame result has one
+NAME_FIELDS = ["gt_object", "test_object"]
+
+# ==============================================================================
+
+def sidecarPath(eval_file):
+    """Path of the frame results sidecar of `eval_file` (ex: X.segeval.xml[.gz] -> X.segeval.npz)."""
+    return os.path.splitext(stripCompressionExt(eval_file))[0] + SIDECAR_EXT
+
+
+def frameResultsToArrays(frame_results):
+    """
+    list(FrameEvalResult) ---> dict(str -> np.array)
+
+    Surfaces are NaN for frames without surfaces (not true accepted).
+    Object names (NAME_FIELDS) are only set if some frame result has one.
+    """
+    arrays = {}
+    arrays["index"] = np.array([fr.index for fr in frame_results], dtype=np.int32)
+    codes = dict((mt, code) for (code, mt) in enumerate(MATCH_TYPES))
+    arrays["match_type"] = np.array([codes[fr.match_type] for fr in frame_results], dtype=np.uint8)
+    for field in FLOAT_FIELDS:
+        arrays[field] = np.array([getattr(fr, field) for fr in frame_results], dtype=np.float64)
+    for field in ["test", "intersection"]:
+        arrays["surface_" + field] = np.array([getattr(fr.surfaces, field) if fr.surfaces is not None else np.nan
+                                               for fr in frame_results], dtype=np.float64)
+    if any(getattr(fr, field) is not None for fr in frame_results for field in NAME_FIELDS):
+        for field in NAME_FIELDS:
+            arrays[field] = np.array([getattr(fr, field) or u"" for fr in frame_results], dtype=np.unicode_)
+    return arrays
+
+
+def arraysToFrameResults(arrays):
+    """dict(str -> np.array) ---> list(FrameEvalResult) (see `frameResultsToArrays`)"""
+    frame_results = []
+    columns = [arrays[field].tolist() for field in FLOAT_FIELDS]
+    surfaces = zip(arrays["surface_test"].tolist(), arrays["surface_intersection"].tolist())
+    names = [arrays[field].tolist() if field in arrays else None for field in NAME_FIELDS]
+    for (i, (index, code)) in enumerate(zip(arrays["index"].tolist(), arrays["match_type"].tolist())):
+        fr = FrameEvalResult(index=index)
+        fr.match_type = MATCH_TYPES[code]
+        for (field, column) in zip(FLOAT_FIELDS, columns):
+            setattr(fr, field, column[i])
+        (test, intersection) = surfaces[i]
+        if not np.isnan(test):
+            fr.surfaces = SegSurfaces(test=test, intersection=intersection)
+        for (field, column) in zip(NAME_FIELDS, names):
+            if column is not None and column[i]:
+                setattr(fr, field, column[i])
+        frame_results.append(fr)
+    return frame_results
+
+
+def writeFrameResults(path, frame_results):
+    arrays = frameResultsToArrays(frame_results)
+    # a single 2D array of values compresses better than one array per column
+    values = np.vstack([arrays[col] for col in VALUE_COLUMNS])
+    names = dict((field, arrays[field]) for field in NAME_FIELDS if field in arrays)
+    with open(path, "wb") as out_f:
+        np.savez_compressed(out_f, index=arrays["index"], match_type=arrays["match_type"], values=values, **names)
+    logger.debug("Wrote %d frame results to '%s'.", len(frame_results), path)
+
+
+def readFrameArrays(path):
+    """Frame results of a sidecar, as a dict of arrays (see `frameResultsToArrays`)."""
+    with np.load(path) as data:
+        arrays = {"index": data["index"], "match_type": data["match_type"]}
+        for field in NAME_FIELDS:
+            if field in data.files:
+                arrays[field] = data[field]
+        values = data["values"]
+    for (row, col) in enumerate(VALUE_COLUMNS):
+        arrays[col] = values[row]
+    return arrays
+
+
+def exportCompact(evalRes_mdl, eval_file, pretty_print=False):
+    """
+    Write `evalRes_mdl` to `eval_file` without its frame results, which are
+    written to the sidecar file. `evalRes_mdl` is left unchanged.
+    """
+    sidecar = sidecarPath(eval_file)
+    writeFrameResults(sidecar, evalRes_mdl.frame_results)
+    frame_results = evalRes_mdl.frame_results
+    evalRes_mdl.frame_results = []
+    evalRes_mdl.frame_results_file = os.path.basename(sidecar)
+    try:
+        evalRes_mdl.exportToFile(eval_file, pretty_print=pretty_print)
+    finally:
+        evalRes_mdl.frame_results = frame_results
+        evalRes_mdl.frame_results_file = None
+
+
+def loadEvalResult(eval_file):
+    """
+    Load an evaluation result, compact or not. Frame results of compact
+    files are read from their sidecar.
+    """
+    evalRes_mdl = EvalResult.loadFromFile(eval_file)
+    if evalRes_mdl.frame_results_file is not None:
+        sidecar = os.path.join(os.path.dirname(eval_file), evalRes_mdl.frame_results_file)
+        evalRes_mdl.frame_results = arraysToFrameResults(readFrameArrays(sidecar))
+        evalRes_mdl.frame_results_file = None
+    return evalRes_mdl
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Transparent access to compressed files, according to their extension:
+".gz" (gzip), ".bz2" (bzip2) and ".xz" (lzma, from the standard library with
+Python 3, or the "backports.lzma" package with Python 2).
+Files are (de)compressed on the fly, so that parsers can consume them as
+streams.
+'''
+
+# ==============================================================================
+# Imports
+import os.path
+import gzip
+import bz2
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError: # .xz files not supported
+        lzma = None
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+# Constants
+COMPRESSION_EXTS = [".gz", ".bz2", ".xz"]
+
+# ==============================================================================
+
+def compressionExt(path):
+    """Compression extension of `path` (ex: ".gz"), or None for plain files."""
+    ext = os.path.splitext(path)[1].lower()
+    return ext if ext in COMPRESSION_EXTS else None
+
+
+def stripCompressionExt(path):
+    """'X.xml.gz' ---> 'X.xml' ; 'X.xml' ---> 'X.xml'"""
+    if compressionExt(path) is not None:
+        return os.path.splitext(path)[0]
+    return path
+
+
+def resolvePath(path):
+    """
+    Returns `path` if it is a file, else the first compressed version of it
+    which exists (ex: 'X.xml' ---> 'X.xml.gz'), else `path`.
+    """
+    if os.path.isfile(path):
+        return path
+    for ext in COMPRESSION_EXTS:
+        if os.path.isfile(path + ext):
+            logger.debug("Using '%s' for '%s'.", path + ext, path)
+            return path + ext
+    return path
+
+
+def openFile(path, mode="rb"):
+    """Open `path`, compressed or not according to its extension, in binary `mode`."""
+    ext = compressionExt(path)
+    if ext == ".gz":
+        return gzip.open(path, mode)
+    if ext == ".bz2":
+        return bz2.BZ2File(path, mode)
+    if ext == ".xz":
+        if lzma is None:
+            raise IOError("Cannot open '%s': .xz files require the 'backports.lzma' package with Python 2." % path)
+        return lzma.LZMAFile(path, mode)
+    return open(path, mode)
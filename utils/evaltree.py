@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Evaluation trees: "EVAL_DIR/METHOD/BACKGROUND/DOCUMENT.segeval.xml" files
+(possibly compressed), as written by `run_eval.sh` and `batch_eval.py`.
+'''
+
+# ==============================================================================
+# Imports
+import os
+import os.path
+import glob
+
+# ==============================================================================
+from utils.compression import stripCompressionExt, COMPRESSION_EXTS
+
+# ==============================================================================
+# Constants
+EVAL_EXT = ".segeval.xml"
+
+# ==============================================================================
+
+
+def findEvalFiles(eval_dir, methods=None):
+    """
+    Sorted list of ((method, background, document), path) for the evaluation
+    results of `eval_dir` (of `methods` only, if set).
+    """
+    files = {}
+    patterns = [os.path.join(eval_dir, method, "*", "*" + EVAL_EXT + ext)
+                for method in (methods if methods is not None else ["*"])
+                for ext in [""] + COMPRESSION_EXTS]
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            (rest, filename) = os.path.split(stripCompressionExt(path))
+            (rest, background) = os.path.split(rest)
+            key = (os.path.basename(rest), background, filename[:-len(EVAL_EXT)])
+            files.setdefault(key, path)
+    return sorted(files.items())
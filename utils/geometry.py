@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Coordinates of the objects of segmentation result frames, as used by the
+evaluation tools (and the visualization tool) as arrays.
+'''
+
+# ==============================================================================
+# Imports
+import numpy as np
+
+# ==============================================================================
+
+
+def frameCoords(frame):
+    """
+    FrameSegResult ---> np.float32 (1x8)
+
+    Coordinates of the corners of the object detected in `frame`, in TL, BL, 
+    BR, TR order.
+    """
+    return np.float32([[frame.points['tl'].x,
+                        frame.points['tl'].y,
+                        frame.points['bl'].x,
+                        frame.points['bl'].y,
+                        frame.points['br'].x,
+                        frame.points['br'].y,
+                        frame.points['tr'].x,
+                        frame.points['tr'].y]])
+
+
+def outlineCoords(frame):
+    """
+    FrameSegResult ---> np.float32 (1x2N)
+
+    Coordinates of the vertices of the outline of the object detected in 
+    `frame` if it has one, else of its 4 corners (see `frameCoords`).
+    Used for test results only: ground truth homographies need the corners.
+    """
+    if frame.outline:
+        return np.float32([[c for pt in frame.outline for c in (pt.x, pt.y)]])
+    return frameCoords(frame)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Ground truth index: all the ground truth files of a dataset
+("GT_ROOT/BACKGROUND/DOCUMENT.gt.xml") compiled into a single binary file,
+opened read-only with a memory map. Worker processes opening the same index
+share a single copy of it (the page cache) instead of parsing ground truth
+files and holding their own model objects.
+
+File layout:
+    "SDCGTIX1"            magic string
+    uint64 (LE)           length of the JSON header
+    JSON header           samples (background, document, offset and count of
+                          frames, object shape) and array descriptions
+    arrays                at 64 bytes aligned offsets:
+                          - rejected (uint8, one per frame)
+                          - corners (float32 as used by evaluation, 8 per
+                            frame: TL, BL, BR, TR, NaN for frames without
+                            points)
+Frames of a sample are stored contiguously, in file order.
+Multi-object ground truth files are not supported.
+'''
+
+# ==============================================================================
+# Imports
+import os
+import os.path
+import glob
+import json
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+# ==============================================================================
+# SegEval Tools suite imports
+from models.models import GroundTruth, ObjectShape, Pt
+from utils.compression import stripCompressionExt, COMPRESSION_EXTS
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+# Constants
+MAGIC = "SDCGTIX1"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+GT_EXT = ".gt.xml"
+CORNER_NAMES = ["tl", "bl", "br", "tr"]
+
+# ==============================================================================
+
+def isIndexFile(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as in_f:
+        return in_f.read(len(MAGIC)) == MAGIC
+
+
+def findGroundTruthFiles(gt_root):
+    """dict (background, document) -> path of the ground truth files of `gt_root`."""
+    files = {}
+    for ext in [""] + COMPRESSION_EXTS:
+        for path in glob.glob(os.path.join(gt_root, "*", "*" + GT_EXT + ext)):
+            key = (os.path.basename(os.path.dirname(path)),
+                   os.path.basename(stripCompressionExt(path))[:-len(GT_EXT)])
+            files.setdefault(key, path)
+    return files
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def buildIndex(gt_files, index_file):
+    """
+    dict (background, document) -> path x str ---> int
+
+    Compile the ground truth files `gt_files` into `index_file`.
+    Returns the total number of frames.
+    """
+    samples = []
+    rejected = []
+    corners = []
+    for (background, document) in sorted(gt_files):
+        gt_mdl = GroundTruth.loadFromFile(gt_files[(background, document)])
+        offset = len(rejected)
+        for frame in gt_mdl.segmentation_results:
+            if frame.objects:
+                raise ValueError("'%s': multi-object ground truth cannot be indexed."
+                                 % gt_files[(background, document)])
+            rejected.append(frame.rejected)
+            if all(name in frame.points for name in CORNER_NAMES):
+                corners.append([c for name in CORNER_NAMES
+                                  for c in (frame.points[name].x, frame.points[name].y)])
+            else:
+                corners.append([np.nan] * 8)
+        samples.append(OrderedDict([
+            ("background", background),
+            ("document", document),
+            ("offset", offset),
+            ("count", len(rejected) - offset),
+            ("object_shape", [gt_mdl.object_shape.width, gt_mdl.object_shape.height])]))
+
+    arrays = OrderedDict([
+        ("rejected", np.array(rejected, dtype=np.uint8)),
+        ("corners", np.array(corners, dtype=np.float32).reshape(-1, 8))])
+    # array offsets depend on the header length: iterate until stable
+    header = {}
+    data_start = 0
+    while True:
+        offset = data_start
+        descr = OrderedDict()
+        for (name, arr) in arrays.items():
+            descr[name] = OrderedDict([("offset", offset), ("dtype", arr.dtype.str), ("shape", list(arr.shape))])
+            offset = _align(offset + arr.nbytes)
+        header = json.dumps(OrderedDict([
+            ("version", FORMAT_VERSION),
+            ("frames", len(rejected)),
+            ("samples", samples),
+            ("arrays", descr)]))
+        start = _align(len(MAGIC) + 8 + len(header))
+        if start == data_start:
+            break
+        data_start = start
+
+    with open(index_file, "wb") as out_f:
+        out_f.write(MAGIC)
+        out_f.write(struct.pack("<Q", len(header)))
+        out_f.write(header)
+        for (name, arr) in arrays.items():
+            out_f.write("\0" * (descr[name]["offset"] - out_f.tell()))
+            out_f.write(arr.tostring())
+    logger.debug("%d samples (%d frames) written to '%s'.", len(samples), len(rejected), index_file)
+    return len(rejected)
+
+
+class IndexedFrame(object):
+    """Frame of an IndexedGroundTruth, with the attributes of FrameSegResult used by evaluation tools."""
+    __slots__ = ["index", "rejected", "_coords"]
+    objects = ()
+    outline = ()
+
+    def __init__(self, index, rejected, coords):
+        self.index = index
+        self.rejected = rejected
+        self._coords = coords
+
+    @property
+    def points(self):
+        if np.isnan(self._coords).any():
+            return {}
+        return dict((name, Pt(name=name, x=float(self._coords[2*k]), y=float(self._coords[2*k+1])))
+                    for (k, name) in enumerate(CORNER_NAMES))
+
+
+class _IndexedFrames(object):
+    """Sequence of the IndexedFrame of a sample (created on access)."""
+    def __init__(self, rejected, corners):
+        self._rejected = rejected
+        self._corners = corners
+
+    def __len__(self):
+        return len(self._rejected)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return IndexedFrame(idx + 1, bool(self._rejected[idx]), self._corners[idx])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class IndexedGroundTruth(object):
+    """
+    Ground truth of a sample, read from a GroundTruthIndex. Can be used
+    instead of a GroundTruth model by evaluation functions.
+    `rejected` and `corners` are read-only views of the index.
+    """
+    def __init__(self, background, document, object_shape, rejected, corners):
+        self.background = background
+        self.document = document
+        self.object_shape = ObjectShape(width=object_shape[0], height=object_shape[1])
+        self.rejected = rejected
+        self.corners = corners
+        self.segmentation_results = _IndexedFrames(rejected, corners)
+
+    def frameCoords(self, idx):
+        """Same as eval_seg.frameCoords for frame `idx` (0-based), without copy."""
+        return self.corners[idx:idx+1]
+
+
+class GroundTruthIndex(object):
+    """Read-only access to a ground truth index file."""
+    def __init__(self, index_file):
+        self.path = index_file
+        self._mm = np.memmap(index_file, dtype=np.uint8, mode="r")
+        if self._mm[:len(MAGIC)].tostring() != MAGIC:
+            raise ValueError("'%s' is not a ground truth index." % index_file)
+        (header_len,) = struct.unpack("<Q", self._mm[len(MAGIC):len(MAGIC)+8].tostring())
+        header = json.loads(self._mm[len(MAGIC)+8:len(MAGIC)+8+header_len].tostring())
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError("'%s': unsupported index version %s." % (index_file, header["version"]))
+        self._arrays = {}
+        for (name, descr) in header["arrays"].items():
+            self._arrays[name] = np.ndarray(shape=tuple(descr["shape"]), dtype=np.dtype(str(descr["dtype"])),
+                                            buffer=self._mm, offset=descr["offset"])
+        self._samples = OrderedDict(((s["background"], s["document"]), s) for s in header["samples"])
+
+    def keys(self):
+        """List of (background, document)."""
+        return self._samples.keys()
+
+    def __contains__(self, key):
+        return key in self._samples
+
+    def frameCount(self, background, document):
+        return self._samples[(background, document)]["count"]
+
+    def get(self, background, document):
+        """(background, document) ---> IndexedGroundTruth. KeyError if unknown."""
+        sample = self._samples[(background, document)]
+        (start, stop) = (sample["offset"], sample["offset"] + sample["count"])
+        return IndexedGroundTruth(background, document, sample["object_shape"],
+                                  self._arrays["rejected"][start:stop], self._arrays["corners"][start:stop])
@@ -7,6 +7,7 @@ import os
 import os.path
 import sys
 import glob
+import hashlib
 
 import cv2
 import numpy as np
@@ -15,9 +16,9 @@ import numpy as np
 # mobileSeg Tools suite imports
 
 # ==============================================================================
-from utils.log import createAndInitLogger
-logger = createAndInitLogger(__name__)
-# logger = createAndInitLogger(__name__, debug=True)
+from utils.log import createLogger
+logger = createLogger(__name__)
+# logger.setLevel(logging.DEBUG)
 
 # ==============================================================================
 
@@ -84,14 +85,40 @@ class FrameSequenceFromVideo(FrameSequence):
         self._frame_count = int(self._videocap.get(cv2.CAP_PROP_FRAME_COUNT))
         self._frame_size = (int(self._videocap.get(cv2.CAP_PROP_FRAME_WIDTH)), 
                             int(self._videocap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self._fps = self._videocap.get(cv2.CAP_PROP_FPS)
 
         logger.info("Input video informations:")
-        logger.info("\tframe_count = %d" % self._frame_count)
-        logger.info("\tframe_size = %dx%d" % self._frame_size)
+        logger.info("\tframe_count = %d", self._frame_count)
+        logger.info("\tframe_size = %dx%d", *self._frame_size)
+        logger.info("\tfps = %0.2f", self._fps)
 
         self._cfid = 0
         self._prevRes = True
 
+    @property
+    def frame_count(self):
+        return self._frame_count
+
+    @property
+    def frame_size(self):
+        return self._frame_size
+
+    @property
+    def fps(self):
+        return self._fps
+
+
+    def skip(self, count):
+        """
+        Advance by `count` frames without retrieving them (no conversion to
+        images, faster than `next`). Returns the number of frames skipped.
+        """
+        skipped = 0
+        while skipped < count and self._prevRes and self._cfid < self._frame_count:
+            self._prevRes = self._videocap.grab()
+            self._cfid += 1
+            skipped += 1
+        return skipped
 
     def next(self):
         if self._prevRes and self._cfid < self._frame_count:
@@ -118,7 +145,7 @@ class FrameSequenceFromGlob(FrameSequence):
             raise IOError(err)
 
         logger.info("Input video informations:")
-        logger.info("\tframe_count = %d" % self._frame_count)
+        logger.info("\tframe_count = %d", self._frame_count)
 
         self._cfid = 0
 
@@ -176,12 +203,12 @@ class VideoSeeker(object):
         self._maxtime = self._frame_duration * self._frame_count
         # debug output
         logger.debug("Input video informations (from OCV codec):")
-        logger.debug("\tfile: '%s'" % self._filename)
-        logger.debug("\tframe_count = %d" % self._frame_count)
-        logger.debug("\tframe_size = %dx%d" % self._frame_size)
-        logger.debug("\tfps = %0.2f" % self._fps)
-        logger.debug("\tframe_duration = %0.2f" % self._frame_duration)
-        logger.debug("\tmaxtime = %0.2f" % self._maxtime)
+        logger.debug("\tfile: '%s'", self._filename)
+        logger.debug("\tframe_count = %d", self._frame_count)
+        logger.debug("\tframe_size = %dx%d", *self._frame_size)
+        logger.debug("\tfps = %0.2f", self._fps)
+        logger.debug("\tframe_duration = %0.2f", self._frame_duration)
+        logger.debug("\tmaxtime = %0.2f", self._maxtime)
         # Cache init
         cache_len = min(cache_size, self._frame_count)
         self._cache = [self._readCurrentFrameCodecCheck() for _i in range(cache_len)]
@@ -201,6 +228,10 @@ class VideoSeeker(object):
     def frame_count(self):
         return self._frame_count
 
+    @property
+    def fps(self):
+        return self._fps
+
 
     # Seeking property and methods
     def current_pos(self):
@@ -246,7 +277,7 @@ class VideoSeeker(object):
     # Codec read methods
     def _readCurrentFrameCodec(self):
         '''Assumes `self._currentFrame` is valid.'''
-        logger.debug("io.VideoSeeker._readCurrentFrameCodec() %s @ %d" % (os.path.basename(self._filename), self._current_pos))
+        logger.debug("io.VideoSeeker._readCurrentFrameCodec() %s @ %d", os.path.basename(self._filename), self._current_pos)
         res, frame = self._vin.read()
         # cursor auto advance is automatic here
         # self._current_pos -= 1
@@ -289,13 +320,13 @@ class VideoSeeker(object):
     def _updateCache(self, frame_id, mat):
         if not self._isInCache(frame_id):
             raise ValueError("frame id %d is not in cache range (%d -> %d), cannot store its value." % (frame_id, self._cache_first, self._cache_last))
-        logger.debug("io.VideoSeeker._updateCache %s @ %d" % (os.path.basename(self._filename), frame_id))
+        logger.debug("io.VideoSeeker._updateCache %s @ %d", os.path.basename(self._filename), frame_id)
         self._cache[self._cacheIndex(frame_id)] = mat
 
     def _readCache(self, frame_id):
         if not self._isInCache(frame_id):
             raise ValueError("frame id %d is not in cache range (%d -> %d), cannot read its value." % (frame_id, self._cache_first, self._cache_last))
-        logger.debug("io.VideoSeeker._readCache %s @ %d" % (os.path.basename(self._filename), frame_id))
+        logger.debug("io.VideoSeeker._readCache %s @ %d", os.path.basename(self._filename), frame_id)
         return self._cache[self._cacheIndex(frame_id)]
 
 
@@ -315,3 +346,123 @@ class VideoSeeker(object):
             raise StopIteration
 
 
+# ==============================================================================
+# ==============================================================================
+class VideoProxy(object):
+    """
+    Low-resolution copy of a whole video, for fast random access.
+
+    All frames are decoded once, downscaled to `width` pixels and stored in a 
+    memory-mapped array cached under `cache_dir` (in memory only if 
+    `cache_dir` is None). A strip of thumbnails, one every `strip_step` 
+    frames, is produced during the same pass.
+    Frame ids start at 0, like in `VideoSeeker`.
+    """
+
+    def __init__(self, videofile, cache_dir=None, width=480, strip_step=25, thumb_height=60):
+        assert width > 0, "width must be > 0"
+        assert strip_step > 0, "strip_step must be > 0"
+        self._videofile = videofile
+        self._strip_step = strip_step
+        self._thumb_height = thumb_height
+        self._width = width
+        self._frames = None
+        self._strip = None
+
+        proxy_path = strip_path = None
+        if cache_dir is not None:
+            # Many samples share the same base name (one per background)
+            key = "%s-%s" % (hashlib.md5(os.path.abspath(videofile)).hexdigest()[:12],
+                             os.path.basename(videofile))
+            proxy_path = os.path.join(cache_dir, "%s.proxy-%d.npy" % (key, width))
+            strip_path = os.path.join(cache_dir, "%s.strip-%d-%d-%d.png" % (key, width, strip_step, thumb_height))
+            if self._isCacheValid(proxy_path) and self._isCacheValid(strip_path):
+                logger.debug("Loading proxy of '%s' from cache.", videofile)
+                self._frames = np.load(proxy_path, mmap_mode='r')
+                self._strip = cv2.imread(strip_path)
+
+        if self._frames is None or self._strip is None:
+            self._build(proxy_path, strip_path)
+
+        self._thumb_width = self._strip.shape[1] / max(1, self._thumbCount())
+
+    def _isCacheValid(self, path):
+        return (os.path.isfile(path) 
+                and os.path.getmtime(path) >= os.path.getmtime(self._videofile))
+
+    def _thumbCount(self):
+        return (self.frame_count + self._strip_step - 1) / self._strip_step
+
+    def _build(self, proxy_path, strip_path):
+        logger.info("Building low resolution proxy of '%s' (one decoding pass)...", self._videofile)
+        frames = FrameSequenceFromVideo(self._videofile)
+        (full_w, full_h) = frames.frame_size
+        height = max(1, int(round(float(full_h) * self._width / full_w)))
+        shape = (frames.frame_count, height, self._width, 3)
+        tmp_path = None
+        if proxy_path is not None:
+            if not os.path.isdir(os.path.dirname(proxy_path)):
+                os.makedirs(os.path.dirname(proxy_path))
+            tmp_path = proxy_path + ".tmp"
+            proxy = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=shape)
+        else:
+            proxy = np.empty(shape, dtype=np.uint8)
+
+        count = 0
+        try:
+            for frame in frames:
+                if count >= shape[0]:
+                    break
+                proxy[count] = cv2.resize(frame.mat, (self._width, height), interpolation=cv2.INTER_AREA)
+                count += 1
+        finally:
+            frames.release()
+
+        if count < shape[0]:
+            logger.warning("Only %d frames could be decoded out of %d announced.", count, shape[0])
+            proxy = np.array(proxy[:count])
+        if tmp_path is not None:
+            if count < shape[0]:
+                with open(tmp_path, "wb") as tmp_f:
+                    np.save(tmp_f, proxy)
+            else:
+                proxy.flush()
+            del proxy
+            os.rename(tmp_path, proxy_path)
+            proxy = np.load(proxy_path, mmap_mode='r')
+        self._frames = proxy
+
+        thumbs = [cv2.resize(self._frames[fid], 
+                             (max(1, self._width * self._thumb_height / height), self._thumb_height), 
+                             interpolation=cv2.INTER_AREA)
+                  for fid in range(0, count, self._strip_step)]
+        self._strip = np.hstack(thumbs) if thumbs else np.zeros((self._thumb_height, 1, 3), np.uint8)
+        if strip_path is not None:
+            cv2.imwrite(strip_path, self._strip)
+        logger.info("Proxy ready: %d frames at %dx%d.", count, self._width, height)
+
+    @property
+    def frame_count(self):
+        return self._frames.shape[0]
+
+    @property
+    def frame_size(self):
+        return (self._frames.shape[2], self._frames.shape[1])
+
+    @property
+    def strip(self):
+        """Thumbnail strip image (read only)."""
+        return self._strip
+
+    def getFrame(self, frame_id):
+        """Returns a writable copy of the proxy frame `frame_id`."""
+        return np.array(self._frames[frame_id])
+
+    def stripPosition(self, frame_id):
+        """Horizontal position of `frame_id` in the thumbnail strip."""
+        return int(float(frame_id) / self._strip_step * self._thumb_width)
+
+    def frameAtStripPosition(self, x):
+        """Frame id corresponding to the horizontal position `x` in the thumbnail strip."""
+        frame_id = int(float(x) / self._thumb_width * self._strip_step)
+        return max(0, min(frame_id, self.frame_count - 1))
@@ -4,6 +4,11 @@
 # ==============================================================================
 # Imports
 import logging
+import json
+import atexit
+import threading
+import Queue
+from collections import OrderedDict
 
 # ==============================================================================
 # logger = logging.getLogger(__name__)
@@ -19,16 +24,42 @@ def programHeader(logger, prog_name, prog_version):
     dbg_head_pre = " " * (max(0, (DBGLINELEN - len(dbg_head)))/2)
     logger.debug(dbg_head_pre + dbg_head)
 
-def initLogger(logger, debug=False):
-    format="%(name)-12s %(levelname)-7s: %(message)s" #%(module)-10s
-    formatter = logging.Formatter(format)    
-    ch = logging.StreamHandler()  
-    ch.setFormatter(formatter)  
-    logger.addHandler(ch)
-    level = logging.INFO
+_console_handler = None
+
+def initConsoleHandler():
+    """
+    Attach the console handler to the root logger (only once).
+    Module loggers are created without handler at import time (see 
+    `createLogger`), and their messages reach this handler by propagation.
+    """
+    global _console_handler
+    if _console_handler is None:
+        format="%(name)-12s %(levelname)-7s: %(message)s" #%(module)-10s
+        formatter = logging.Formatter(format)    
+        ch = logging.StreamHandler()  
+        ch.setFormatter(formatter)  
+        root = logging.getLogger()
+        root.addHandler(ch)
+        root.setLevel(logging.INFO)
+        _console_handler = ch
+    return _console_handler
+
+def initLogger(logger, debug=False, level=None, json_file=None):
+    """
+    Set the level of `logger` (DEBUG if `debug`, else `level`, else INFO),
+    make sure console output is configured, and optionally also send log 
+    records as JSON lines to `json_file` (see `initJsonHandler`).
+    Levels above INFO also apply to the loggers of the utility modules.
+    """
+    initConsoleHandler()
+    if level is None:
+        level = logging.INFO
     if debug:
         level = logging.DEBUG
+    logging.getLogger().setLevel(max(level, logging.INFO))
     logger.setLevel(level)
+    if json_file is not None:
+        initJsonHandler(json_file)
 
 
 def createLogger(name):
@@ -40,3 +71,96 @@ def createAndInitLogger(name, debug=False):
     initLogger(logger, debug)
     return logger
 
+
+# ==============================================================================
+# JSON lines logging, written by a background thread.
+# logging.handlers.QueueHandler/QueueListener only exist from Python 3.2.
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single JSON line."""
+    def format(self, record):
+        entry = OrderedDict([
+            ("time", record.created),
+            ("level", record.levelname),
+            ("logger", record.name),
+            ("message", record.getMessage()),
+            ("process", record.process),
+            ("thread", record.threadName),
+            ])
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class QueueHandler(logging.Handler):
+    """
+    Puts log records in a queue, without formatting them: the message is 
+    built by the `QueueListener` thread. Arguments of log calls must 
+    therefore not be modified after the call.
+    """
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            if record.exc_info:
+                # do not keep the traceback (and its frames) alive in the queue
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """Consumes records from a queue in a background thread, and passes them to `handler`."""
+    _STOP = None
+
+    def __init__(self, queue, handler):
+        self.queue = queue
+        self.handler = handler
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name="QueueListener")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._STOP:
+                break
+            self.handler.handle(record)
+
+    def stop(self):
+        """Write pending records and stop the thread."""
+        if self._thread is not None:
+            self.queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+            self.handler.flush()
+
+
+_json_listener = None
+
+def initJsonHandler(json_file):
+    """
+    Attach to the root logger (only once) a handler which writes records as
+    JSON lines to `json_file` ('-' for stderr), from a background thread.
+    Pending records are written when the program exits.
+    """
+    global _json_listener
+    if _json_listener is None:
+        if json_file == "-":
+            target = logging.StreamHandler()
+        else:
+            target = logging.FileHandler(json_file, "a")
+        target.setFormatter(JsonFormatter())
+        queue = Queue.Queue()
+        _json_listener = QueueListener(queue, target)
+        _json_listener.start()
+        atexit.register(_json_listener.stop)
+        logging.getLogger().addHandler(QueueHandler(queue))
+    return _json_listener
@@ -3,15 +3,17 @@
 
 # ==============================================================================
 # Imports
+import heapq
+import random
 from collections import namedtuple
 
 import Polygon
 import Polygon.Utils
-import Polygon.IO # dbg
+# import Polygon.IO # dbg (writeSVG), import locally when needed
 
 # ==============================================================================
-from utils.log import createAndInitLogger
-logger = createAndInitLogger(__name__)
+from utils.log import createLogger
+logger = createLogger(__name__)
 
 # ==============================================================================
 
@@ -39,7 +41,7 @@ def _checkPoly1Contour(poly):
     if len(poly) > 1:
         msg = "Error: Current version of eval_seg cannot handle polygons with multiple contours."
         logger.error(msg)
-        logger.error("Poly: %s" % poly)
+        logger.error("Poly: %s", poly)
         raise ValueError(msg)
 
 
@@ -87,10 +89,14 @@ def _intersect(edge1, edge2):
     return True            # => an intersect exists
 
 
+# Below this number of edges, the naive O(n^2) test is faster than the sweep.
+SWEEP_MIN_EDGES = 16
+
 def isSelfIntersecting(poly):
     """
-    Simple detection of self-intersection.
-    Naive O(n^2) implementation for small, 1 contour polygons.
+    Detection of self-intersection for 1 contour polygons.
+    Naive O(n^2) implementation for small polygons (ex: quadrilaterals), 
+    Shamos-Hoey sweep line, O(n log n), for bigger ones.
     """
     # For possible improvements, see:
     # http://en.wikipedia.org/wiki/Bentley%E2%80%93Ottmann_algorithm
@@ -106,6 +112,8 @@ def isSelfIntersecting(poly):
 
     # Get edges
     edges = _polyEdges(polyPruned)
+    if len(edges) >= SWEEP_MIN_EDGES:
+        return _sweepIntersecting(edges)
 
     # Look for intersections
     for i in range(len(edges)):
@@ -119,3 +127,192 @@ def isSelfIntersecting(poly):
     return False
 
 
+def _sweepIntersecting(edges):
+    """
+    Shamos-Hoey algorithm: tells whether any two edges intersect (consecutive
+    edges excepted), sweeping a vertical line from left to right.
+    Edges are kept ordered along the sweep line (by y at the current x); 
+    an intersection, if any, is found between edges which are neighbors 
+    at some point.
+    """
+    # left / right end points of each edge
+    ends = []
+    events = []
+    for (i, e) in enumerate(edges):
+        (p, q) = (e.start, e.end) if (e.start.x, e.start.y) <= (e.end.x, e.end.y) else (e.end, e.start)
+        ends.append((p, q))
+        events.append((p.x, p.y, 0, i)) # 0: insertion before removals at the same point
+        events.append((q.x, q.y, 1, i))
+    events.sort()
+
+    def key(i, x):
+        """Position of edge i along the sweep line at x: (y, slope)."""
+        (p, q) = ends[i]
+        if q.x == p.x:
+            return (p.y, float("inf"))
+        slope = (q.y - p.y) / (q.x - p.x)
+        return (p.y + slope * (x - p.x), slope)
+
+    status = _SweepStatus() # edges ordered along the sweep line
+    nodes = {} # edge index -> status node
+    for (x, y, kind, i) in events:
+        if kind == 0:
+            k = key(i, x)
+            node = status.insert(i, lambda j: key(j, x) < k)
+            nodes[i] = node
+            prev = status.prev(node)
+            if prev is not None and _intersect(edges[prev.edge], edges[i]):
+                return True
+            succ = status.next(node)
+            if succ is not None and _intersect(edges[i], edges[succ.edge]):
+                return True
+        else:
+            node = nodes.pop(i)
+            prev = status.prev(node)
+            succ = status.next(node)
+            if prev is not None and succ is not None and _intersect(edges[prev.edge], edges[succ.edge]):
+                return True
+            status.remove(node)
+    return False
+
+
+class _SweepNode(object):
+    __slots__ = ("edge", "prio", "left", "right", "parent")
+
+    def __init__(self, edge, prio):
+        self.edge = edge
+        self.prio = prio
+        self.left = self.right = self.parent = None
+
+
+class _SweepStatus(object):
+    """
+    Sweep line status for _sweepIntersecting: a treap (randomized binary 
+    search tree) of edges with parent links, so that insertion, removal of 
+    a given node and neighbor lookups are O(log n) expected.
+    The order is only defined at insertion time (by a predicate), which is 
+    sound because the sweep stops at the first intersection: edges never 
+    swap while they are in the status.
+    """
+    def __init__(self):
+        self.root = None
+        self._rand = random.Random(0) # deterministic shapes
+
+    def insert(self, edge, before):
+        """
+        Insert edge after all the nodes n for which before(n.edge) is True.
+        Returns the new node.
+        """
+        node = _SweepNode(edge, self._rand.random())
+        (parent, cur, right) = (None, self.root, False)
+        while cur is not None:
+            parent = cur
+            right = before(cur.edge)
+            cur = cur.right if right else cur.left
+        node.parent = parent
+        if parent is None:
+            self.root = node
+        elif right:
+            parent.right = node
+        else:
+            parent.left = node
+        while node.parent is not None and node.prio < node.parent.prio:
+            self._rotateUp(node)
+        return node
+
+    def remove(self, node):
+        """Remove node (as returned by insert) from the tree."""
+        while node.left is not None or node.right is not None:
+            if node.right is None or (node.left is not None and node.left.prio < node.right.prio):
+                self._rotateUp(node.left)
+            else:
+                self._rotateUp(node.right)
+        parent = node.parent
+        if parent is None:
+            self.root = None
+        elif parent.left is node:
+            parent.left = None
+        else:
+            parent.right = None
+        node.parent = None
+
+    def prev(self, node):
+        """Node just before node, or None."""
+        if node.left is not None:
+            node = node.left
+            while node.right is not None:
+                node = node.right
+            return node
+        while node.parent is not None and node.parent.left is node:
+            node = node.parent
+        return node.parent
+
+    def next(self, node):
+        """Node just after node, or None."""
+        if node.right is not None:
+            node = node.right
+            while node.left is not None:
+                node = node.left
+            return node
+        while node.parent is not None and node.parent.right is node:
+            node = node.parent
+        return node.parent
+
+    def _rotateUp(self, node):
+        """Rotate node above its parent, preserving the in-order sequence."""
+        parent = node.parent
+        grand = parent.parent
+        if parent.left is node:
+            parent.left = node.right
+            if node.right is not None:
+                node.right.parent = parent
+            node.right = parent
+        else:
+            parent.right = node.left
+            if node.left is not None:
+                node.left.parent = parent
+            node.left = parent
+        parent.parent = node
+        node.parent = grand
+        if grand is None:
+            self.root = node
+        elif grand.left is parent:
+            grand.left = node
+        else:
+            grand.right = node
+
+
+# ==============================================================================
+# Bounding boxes
+
+def boundingBox(coords):
+    """Array of points (any shape ending with 2) ---> (xmin, ymin, xmax, ymax)."""
+    pts = coords.reshape(-1, 2)
+    (xmin, ymin) = pts.min(axis=0)
+    (xmax, ymax) = pts.max(axis=0)
+    return (float(xmin), float(ymin), float(xmax), float(ymax))
+
+
+def overlappingBoxPairs(boxes_a, boxes_b):
+    """
+    Returns the list of pairs (i, j) such that boxes_a[i] and boxes_b[j] 
+    overlap (touching boxes overlap). Boxes are (xmin, ymin, xmax, ymax).
+    Sweep along x: O((n+m) log(n+m) + number of pairs x-overlapping).
+    """
+    starts = sorted([(box[0], 0, i) for (i, box) in enumerate(boxes_a)] +
+                    [(box[0], 1, j) for (j, box) in enumerate(boxes_b)])
+    boxes = (boxes_a, boxes_b)
+    active = ([], []) # heaps of (xmax, index), for each set
+    pairs = []
+    for (xmin, side, idx) in starts:
+        box = boxes[side][idx]
+        other = 1 - side
+        # boxes of the other set ending before this one starts are over
+        while active[other] and active[other][0][0] < xmin:
+            heapq.heappop(active[other])
+        for (_xmax, oidx) in active[other]:
+            obox = boxes[other][oidx]
+            if obox[1] <= box[3] and box[1] <= obox[3]:
+                pairs.append((idx, oidx) if side == 0 else (oidx, idx))
+        heapq.heappush(active[side], (box[2], idx))
+    return pairs
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# Imports
+import gc
+import os
+import sys
+import time
+import json
+import datetime
+import platform
+from collections import OrderedDict
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+try:
+    import tracemalloc # Python 3.4+, or the pytracemalloc backport
+except ImportError:
+    tracemalloc = None
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+
+def cpuTime():
+    """User + system CPU time of the current process, in seconds."""
+    # os.times() only has a 10ms resolution, too coarse for per-frame stages
+    if resource is not None:
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        return ru.ru_utime + ru.ru_stime
+    t = os.times()
+    return t[0] + t[1]
+
+
+class _StageContext(object):
+    __slots__ = ["_acc", "_wall0", "_cpu0"]
+
+    def __init__(self, acc):
+        self._acc = acc
+
+    def __enter__(self):
+        self._wall0 = time.time()
+        self._cpu0 = cpuTime()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        acc = self._acc
+        acc[0] += time.time() - self._wall0
+        acc[1] += cpuTime() - self._cpu0
+        acc[2] += 1
+        return False
+
+
+class StageProfiler(object):
+    """
+    Records wall clock and CPU time spent in named stages, and event counters.
+
+    Usage:
+        with profiler.stage("gt_load"):
+            ...
+        profiler.count("true_accepted")
+
+    Stages can be entered many times (ex: once per frame): times are summed
+    and the number of calls is kept. Stages are reported in order of first use.
+    """
+    enabled = True
+
+    def __init__(self, tool, version):
+        self._tool = tool
+        self._version = version
+        self._stages = OrderedDict()
+        self._counters = OrderedDict()
+        self._info = OrderedDict()
+        self._wall0 = time.time()
+        self._cpu0 = cpuTime()
+
+    def stage(self, name):
+        acc = self._stages.get(name)
+        if acc is None:
+            acc = self._stages[name] = [0.0, 0.0, 0]
+        return _StageContext(acc)
+
+    def count(self, name, increment=1):
+        self._counters[name] = self._counters.get(name, 0) + increment
+
+    def info(self, key, value):
+        """Attach some contextual information (input files, etc.) to the record."""
+        self._info[key] = value
+
+    def stages(self):
+        """Returns an ordered dict: stage name -> (wall, cpu, calls)."""
+        return OrderedDict((name, tuple(acc)) for name, acc in self._stages.items())
+
+    def record(self):
+        """Returns the profiling record as an ordered dict (JSON serializable)."""
+        rec = OrderedDict([
+            ("tool", self._tool),
+            ("version", self._version),
+            ("timestamp", datetime.datetime.now().isoformat()),
+            ("host", platform.node()),
+            ("pid", os.getpid()),
+            ("info", self._info),
+            ("stages", OrderedDict(
+                (name, OrderedDict([("wall", wall), ("cpu", cpu), ("calls", calls)]))
+                for name, (wall, cpu, calls) in self._stages.items())),
+            ("counters", self._counters),
+            ("total", OrderedDict([
+                ("wall", time.time() - self._wall0),
+                ("cpu", cpuTime() - self._cpu0)])),
+            ])
+        return rec
+
+    def write(self, path):
+        """
+        Append the record as a single JSON line to `path` ('-' for stderr).
+        Several processes can append to the same file (batch runs).
+        """
+        line = json.dumps(self.record()) + "\n"
+        if path == "-":
+            sys.stderr.write(line)
+        else:
+            with open(path, "ab") as out_f:
+                out_f.write(line)
+        logger.debug("Profiling record written to '%s'.", path)
+
+
+# ==============================================================================
+# Memory profiling
+
+# number of allocation sites reported per stage and for the whole run
+TOP_SITES = 10
+
+def peakRss(who=None):
+    """Peak resident set size of the current process (or of its terminated children), in bytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # kilobytes on Linux
+
+
+def currentRss():
+    """Resident set size of the current process, in bytes (None if unknown)."""
+    try:
+        with open("/proc/self/statm", "rb") as in_f:
+            return int(in_f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, AttributeError, ValueError):
+        return None
+
+
+def takeSnapshot():
+    """tracemalloc snapshot, without the allocations of tracemalloc and of this module."""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, os.path.splitext(__file__)[0] + ".py")])
+
+
+def objectCounts():
+    """Number of gc-tracked objects by type name (allocation tracking without tracemalloc)."""
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def topTypes(counts, counts0=None, limit=TOP_SITES):
+    """
+    Object counts by type (or their increase since `counts0`) ---> list of
+    dicts (JSON serializable), biggest first.
+    """
+    if counts0 is not None:
+        counts = dict((name, count - counts0.get(name, 0)) for (name, count) in counts.items())
+    top = sorted(((count, name) for (name, count) in counts.items() if count > 0), reverse=True)
+    return [OrderedDict([("type", name), ("count", count)]) for (count, name) in top[:limit]]
+
+
+# allocation tracking backend of MemoryProfiler: "tracemalloc", or the 
+# "gc" fallback (object counts by type, Python 2.7 without pytracemalloc)
+MEMORY_BACKEND = "tracemalloc" if tracemalloc is not None else "gc"
+
+
+def topSites(statistics, limit=TOP_SITES, diff=False):
+    """tracemalloc statistics (or differences, `diff`) ---> list of dicts (JSON serializable)."""
+    sites = []
+    for stat in statistics[:limit]:
+        frame = stat.traceback[0]
+        site = OrderedDict([("site", "%s:%d" % (frame.filename, frame.lineno)),
+                            ("size", stat.size_diff if diff else stat.size),
+                            ("count", stat.count_diff if diff else stat.count)])
+        sites.append(site)
+    return sites
+
+
+class _MemoryStageContext(_StageContext):
+    __slots__ = ["_mem", "_peak0", "_snapshot0", "_counts0"]
+
+    def __init__(self, acc, mem):
+        _StageContext.__init__(self, acc)
+        self._mem = mem
+
+    def __enter__(self):
+        first = self._acc[2] == 0
+        self._snapshot0 = takeSnapshot() if first and tracemalloc is not None else None
+        self._counts0 = objectCounts() if first and tracemalloc is None else None
+        self._peak0 = peakRss()
+        return _StageContext.__enter__(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _StageContext.__exit__(self, exc_type, exc_value, traceback)
+        mem = self._mem
+        peak = peakRss()
+        if peak is not None:
+            mem["peak_rss"] = peak
+            mem["peak_rss_growth"] += peak - self._peak0
+        if tracemalloc is not None:
+            (traced, traced_peak) = tracemalloc.get_traced_memory()
+            mem["traced"] = max(mem.get("traced", 0), traced)
+            mem["traced_peak"] = traced_peak
+        if self._snapshot0 is not None:
+            # allocations of the first call still alive at its end
+            diff = takeSnapshot().compare_to(self._snapshot0, "lineno")
+            mem["top_sites"] = topSites(diff, diff=True)
+            self._snapshot0 = None
+        if self._counts0 is not None:
+            # objects created by the first call still alive at its end
+            mem["top_types"] = topTypes(objectCounts(), self._counts0)
+            self._counts0 = None
+        return False
+
+
+class MemoryProfiler(StageProfiler):
+    """
+    StageProfiler also recording memory use at stage boundaries:
+    - the peak resident set size (RSS) at the end of each stage, and how much
+      the stage increased it (summed over its calls);
+    - with tracemalloc (Python 3.4+, or the pytracemalloc backport for 2.7):
+      the traced memory at the end of each stage, and the top allocation
+      sites of its first call (allocations still alive at its end);
+    - otherwise (backend "gc"): the types of which the first call of each 
+      stage left the most new objects alive, from gc.get_objects() counts.
+    The record also gets the peak RSS of the process and of its terminated
+    children (ex: worker processes), the allocation tracking backend, and 
+    the top allocation sites (tracemalloc) or the most common object types 
+    (gc) when the record is made.
+    """
+    def __init__(self, tool, version):
+        StageProfiler.__init__(self, tool, version)
+        self._memory = OrderedDict()
+        if tracemalloc is None:
+            logger.warning("tracemalloc is not available: counting objects by type with gc instead.")
+        elif not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        acc = self._stages.get(name)
+        if acc is None:
+            acc = self._stages[name] = [0.0, 0.0, 0]
+            self._memory[name] = OrderedDict([("peak_rss", None), ("peak_rss_growth", 0)])
+        return _MemoryStageContext(acc, self._memory[name])
+
+    def record(self):
+        rec = StageProfiler.record(self)
+        for (name, stage_rec) in rec["stages"].items():
+            stage_rec["memory"] = self._memory[name]
+        memory = OrderedDict([
+            ("rss", currentRss()),
+            ("peak_rss", peakRss()),
+            ("children_peak_rss", peakRss(resource.RUSAGE_CHILDREN) if resource is not None else None),
+            ("backend", MEMORY_BACKEND)])
+        if tracemalloc is not None:
+            (memory["traced"], memory["traced_peak"]) = tracemalloc.get_traced_memory()
+            memory["top_sites"] = topSites(takeSnapshot().statistics("lineno"))
+        else:
+            memory["top_types"] = topTypes(objectCounts())
+        rec["memory"] = memory
+        return rec
+
+
+class _NullContext(object):
+    __slots__ = []
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_CONTEXT = _NullContext()
+
+
+class NullProfiler(object):
+    """Profiler interface doing nothing, used when profiling is not requested."""
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_CONTEXT
+
+    def count(self, name, increment=1):
+        pass
+
+    def info(self, key, value):
+        pass
+
+    def stages(self):
+        return OrderedDict()
+
+    def write(self, path):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+
+def createProfiler(profile_path, tool, version, memory=False):
+    """
+    Returns a StageProfiler (a MemoryProfiler with `memory`) if `profile_path`
+    is set, NULL_PROFILER otherwise.
+    """
+    if profile_path is None:
+        return NULL_PROFILER
+    if memory:
+        return MemoryProfiler(tool, version)
+    return StageProfiler(tool, version)
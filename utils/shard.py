@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Sharded evaluation: the (method, background, document) tasks of a campaign
+are split into N shards, each one evaluated by a separate process or host
+(`batch_eval.py --shard I/N`), then combined (`combine_shards.py`).
+
+Assignment is deterministic and only depends on the task key:
+    shard = crc32("METHOD/BACKGROUND/DOCUMENT") mod N + 1
+so all hosts agree on it without any coordination.
+
+Each shard writes a partial-state file ("shard-I-of-N.partial.json" in its
+output directory) describing the shard, the submissions it read, and for each
+sample: its evaluation file (relative to the partial-state file), its status
+and its global results, as written to the evaluation file.
+'''
+
+# ==============================================================================
+# Imports
+import os.path
+import json
+import datetime
+import zlib
+from collections import OrderedDict
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+# Constants
+PARTIAL_FORMAT = "smartdoc-eval-shard"
+PARTIAL_VERSION = 1
+PARTIAL_EXT = ".partial.json"
+ASSIGNMENT = "crc32(METHOD/BACKGROUND/DOCUMENT) mod N + 1"
+
+# ==============================================================================
+
+def parseShard(value):
+    """'I/N' ---> (I, N), with 1 <= I <= N. ValueError if invalid."""
+    parts = value.split("/")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        raise ValueError("'%s' is not a shard specification (I/N)." % value)
+    (index, count) = (int(parts[0]), int(parts[1]))
+    if not 1 <= index <= count:
+        raise ValueError("'%s': shard index must be within [1; %d]." % (value, count))
+    return (index, count)
+
+
+def shardOf(method, background, document, count):
+    """Shard (1 to `count`) of the task (method, background, document)."""
+    key = "%s/%s/%s" % (method, background, document)
+    return (zlib.crc32(key) & 0xffffffff) % count + 1
+
+
+def inShard(method, background, document, shard):
+    """True if the task belongs to `shard` ((I, N) tuple, or None for all tasks)."""
+    return shard is None or shardOf(method, background, document, shard[1]) == shard[0]
+
+
+def partialStatePath(out_dir, shard):
+    return os.path.join(out_dir, "shard-%d-of-%d%s" % (shard[0], shard[1], PARTIAL_EXT))
+
+
+def writePartialState(path, shard, software, gt_root, submissions, samples):
+    """
+    Write the partial state of `shard` to `path`.
+    `software` is a (name, version) tuple, `samples` a list of dicts with
+    "method", "background", "document", "submission", "member", "eval_file"
+    (relative to the directory of `path`), "status" ("ok" or "failed"),
+    "error" and "global_results" (dict) keys.
+    """
+    state = OrderedDict([
+        ("format", PARTIAL_FORMAT),
+        ("version", PARTIAL_VERSION),
+        ("generated", datetime.datetime.now().isoformat()),
+        ("software", OrderedDict([("name", software[0]), ("version", software[1])])),
+        ("shard", OrderedDict([("index", shard[0]), ("count", shard[1]), ("assignment", ASSIGNMENT)])),
+        ("gt_root", os.path.abspath(gt_root)),
+        ("submissions", [os.path.abspath(s) for s in submissions]),
+        ("samples", sorted(samples, key=lambda s: (s["method"], s["background"], s["document"])))])
+    with open(path, "wb") as out_f:
+        json.dump(state, out_f, indent=1)
+    logger.debug("Partial state of shard %d/%d written to '%s'.", shard[0], shard[1], path)
+
+
+def loadPartialState(path):
+    """Read and check a partial-state file. ValueError if it is not one."""
+    with open(path, "rb") as in_f:
+        try:
+            state = json.load(in_f, object_pairs_hook=OrderedDict)
+        except ValueError, e:
+            raise ValueError("'%s' is not a partial-state file: %s" % (path, e))
+    if not isinstance(state, dict) or state.get("format") != PARTIAL_FORMAT:
+        raise ValueError("'%s' is not a partial-state file." % path)
+    if state["version"] != PARTIAL_VERSION:
+        raise ValueError("'%s': unsupported partial-state version %s." % (path, state["version"]))
+    if state["shard"]["assignment"] != ASSIGNMENT:
+        raise ValueError("'%s': unknown shard assignment '%s'." % (path, state["shard"]["assignment"]))
+    return state
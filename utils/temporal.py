@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Vectorized kernels over per-frame arrays of a sample, used to measure the
+temporal stability of a segmentation result (see eval_seg.py).
+All of them are O(n) in the number of frames.
+'''
+
+# ==============================================================================
+# Imports
+import numpy as np
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+
+def rollingVariance(values, window):
+    """
+    np.array (n) x int ---> np.array (n - window + 1)
+
+    Variance of `values` over each window of `window` consecutive elements,
+    computed with cumulative sums. The window is shrunk to n if n < window.
+    Empty array if `values` is empty.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    window = min(window, len(values))
+    if window < 1:
+        return np.zeros(0)
+    c1 = np.concatenate(([0.0], np.cumsum(values)))
+    c2 = np.concatenate(([0.0], np.cumsum(values * values)))
+    s1 = c1[window:] - c1[:-window]
+    s2 = c2[window:] - c2[:-window]
+    var = s2 / window - (s1 / window) ** 2
+    # cancellation can give tiny negative values
+    return np.maximum(var, 0.0)
+
+
+def countFlips(states):
+    """Number of changes between consecutive elements of a boolean array."""
+    states = np.asarray(states, dtype=bool)
+    return int(np.count_nonzero(states[1:] != states[:-1]))
+
+
+def longestRun(mask):
+    """Length of the longest run of True values in a boolean array."""
+    mask = np.asarray(mask, dtype=bool)
+    if not mask.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return int((ends - starts).max())
+
+
+def vertexDisplacements(coords):
+    """
+    list(np.array (Nx2) or None) ---> np.array (n-1)
+
+    Mean distance travelled by the vertices of consecutive outlines.
+    NaN for pairs where one of the outlines is missing (None) or where
+    vertex counts differ.
+    """
+    n = len(coords)
+    if n < 2:
+        return np.zeros(0)
+    counts = np.array([0 if c is None else len(c) for c in coords])
+    padded = np.zeros((n, max(counts.max(), 1), 2))
+    for (i, c) in enumerate(coords):
+        if c is not None:
+            padded[i, :len(c)] = c
+    # padded vertices are (0,0) in both outlines of a valid pair: null distance
+    dist = np.sqrt(((padded[1:] - padded[:-1]) ** 2).sum(axis=2)).sum(axis=1)
+    valid = (counts[1:] > 0) & (counts[1:] == counts[:-1])
+    disp = np.empty(n - 1)
+    disp.fill(np.nan)
+    disp[valid] = dist[valid] / counts[1:][valid]
+    return disp
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Results warehouse: evaluation results (global and frame results) loaded into
+a SQLite database, so that ad-hoc analyses are indexed queries instead of
+re-parsing evaluation files (see `ingest_results.py` and `query_results.py`).
+
+    samples  one row per (method, background, document): source evaluation
+             file and its signature (for incremental ingestion), and the
+             global results of the sample
+    frames   one row per frame of a sample: frame index, match type and
+             frame measures
+    frame_results  view joining frames with the names of their sample
+
+Samples are indexed by method, background and document, frames by sample and
+frame index, and by match type.
+'''
+
+# ==============================================================================
+# Imports
+import os.path
+import sqlite3
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.compression import openFile
+from utils.compact import readFrameArrays, MATCH_TYPES
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+# Constants
+SQLITE_MAGIC = "SQLite format 3\0"
+
+GLOBAL_COLUMNS = [
+    ("detection_precision", "REAL"),
+    ("detection_recall", "REAL"),
+    ("mean_segmentation_precision", "REAL"),
+    ("mean_segmentation_recall", "REAL"),
+    ("mean_jaccard_index_smartdoc", "REAL"),
+    ("mean_jaccard_index_segonly", "REAL"),
+    ("count_total_frames", "INTEGER"),
+    ("count_true_accepted_frames", "INTEGER"),
+    ("count_true_rejected_frames", "INTEGER"),
+    ("count_false_accepted_frames", "INTEGER"),
+    ("count_false_rejected_frames", "INTEGER"),
+    ]
+
+FRAME_MEASURES = ["segmentation_precision", "segmentation_recall",
+                  "jaccard_index_smartdoc", "jaccard_index_segonly"]
+
+SAMPLE_KEY = ["method", "background", "document"]
+FRAME_COLUMNS = ["frame", "match_type"] + FRAME_MEASURES
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS samples (
+        id INTEGER PRIMARY KEY,
+        method TEXT NOT NULL,
+        background TEXT NOT NULL,
+        document TEXT NOT NULL,
+        eval_file TEXT NOT NULL,
+        mtime REAL,
+        size INTEGER,
+        %s,
+        UNIQUE (method, background, document))""" % ",\n        ".join("%s %s" % col for col in GLOBAL_COLUMNS),
+    "CREATE INDEX IF NOT EXISTS samples_background ON samples (background)",
+    "CREATE INDEX IF NOT EXISTS samples_document ON samples (document)",
+    """CREATE TABLE IF NOT EXISTS frames (
+        sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+        frame INTEGER NOT NULL,
+        match_type TEXT NOT NULL,
+        %s,
+        PRIMARY KEY (sample_id, frame))""" % ",\n        ".join("%s REAL" % col for col in FRAME_MEASURES),
+    "CREATE INDEX IF NOT EXISTS frames_match_type ON frames (match_type, sample_id)",
+    """CREATE VIEW IF NOT EXISTS frame_results AS
+        SELECT s.method, s.background, s.document, f.%s
+        FROM frames f JOIN samples s ON s.id = f.sample_id""" % ", f.".join(FRAME_COLUMNS),
+    ]
+
+# per-frame Jaccard index, in the layout of the "GLOBAL.ji-all-frames.csv"
+# file read by `smartdoc_ji_overview.py`
+JI_FRAMES_QUERY = """SELECT method, background, document, frame, jaccard_index_smartdoc AS ji
+    FROM frame_results ORDER BY method, background, document, frame"""
+
+# ==============================================================================
+
+def isWarehouse(path):
+    """True if `path` is a SQLite database."""
+    with open(path, "rb") as in_f:
+        return in_f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+def openWarehouse(path):
+    """Connection to the warehouse `path`, created if needed."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+def readEvalFile(eval_file):
+    """
+    Global results (dict) and frame results (list of tuples matching
+    FRAME_COLUMNS) of an evaluation result file, compact or not, read
+    without building models.
+    """
+    import lxml.etree as etree
+    results = None
+    frames = []
+    sidecar = None
+    with openFile(eval_file, "rb") as in_f:
+        for (_event, elem) in etree.iterparse(in_f, tag=("frame", "global_results", "frame_results_file")):
+            if elem.tag == "frame":
+                values = dict((child.tag, child.text) for child in elem)
+                index = elem.get("index")
+                frames.append((int(index) if index is not None else len(frames) + 1, elem.get("match_type"))
+                              + tuple(float(values.get(m, 0.0)) for m in FRAME_MEASURES))
+            elif elem.tag == "global_results":
+                results = dict((child.tag, child.text) for child in elem)
+            else:
+                sidecar = os.path.join(os.path.dirname(eval_file), elem.text)
+            elem.clear()
+    if results is None:
+        raise ValueError("'%s' has no global results." % eval_file)
+    if sidecar is not None:
+        arrays = readFrameArrays(sidecar)
+        frames = zip(arrays["index"].tolist(),
+                     [MATCH_TYPES[code] for code in arrays["match_type"].tolist()],
+                     *[arrays[m].tolist() for m in FRAME_MEASURES])
+    return (results, frames)
+
+
+def sampleSignatures(conn):
+    """dict (method, background, document) -> (eval file, mtime, size) of the samples of the warehouse."""
+    cursor = conn.execute("SELECT method, background, document, eval_file, mtime, size FROM samples")
+    return dict((tuple(row[:3]), tuple(row[3:])) for row in cursor)
+
+
+def upsertSample(conn, key, eval_file, signature, results, frames):
+    """
+    Insert or replace the sample `key` ((method, background, document)),
+    with its global `results` (dict, as read by `readEvalFile`) and `frames`.
+    Changes are not committed.
+    """
+    (mtime, size) = signature if signature is not None else (None, None)
+    values = [eval_file, mtime, size] + [results[col] for (col, _type) in GLOBAL_COLUMNS]
+    columns = ["eval_file", "mtime", "size"] + [col for (col, _type) in GLOBAL_COLUMNS]
+    row = conn.execute("SELECT id FROM samples WHERE method = ? AND background = ? AND document = ?",
+                       key).fetchone()
+    if row is None:
+        sample_id = conn.execute("INSERT INTO samples (%s) VALUES (%s)"
+                                 % (", ".join(SAMPLE_KEY + columns), ", ".join("?" * len(SAMPLE_KEY + columns))),
+                                 list(key) + values).lastrowid
+    else:
+        sample_id = row[0]
+        conn.execute("UPDATE samples SET %s WHERE id = ?" % ", ".join("%s = ?" % col for col in columns),
+                     values + [sample_id])
+        conn.execute("DELETE FROM frames WHERE sample_id = ?", (sample_id,))
+    conn.executemany("INSERT INTO frames (sample_id, %s) VALUES (?, %s)"
+                     % (", ".join(FRAME_COLUMNS), ", ".join("?" * len(FRAME_COLUMNS))),
+                     ((sample_id,) + tuple(frame) for frame in frames))
+    return sample_id
+
+
+def buildQuery(frames=False, methods=None, backgrounds=None, documents=None, match_types=None,
+               max_ji=None, limit=None):
+    """
+    SQL query (and its parameters) listing samples, or frames (`frames`),
+    filtered by names (lists of GLOB patterns, ex: "tax00*"), match types and
+    maximum Jaccard index (of frames, or mean of samples).
+    """
+    conditions = []
+    params = []
+    for (column, patterns) in [("method", methods), ("background", backgrounds), ("document", documents)]:
+        if patterns:
+            conditions.append("(%s)" % " OR ".join(["%s GLOB ?" % column] * len(patterns)))
+            params.extend(patterns)
+    if frames:
+        columns = SAMPLE_KEY + FRAME_COLUMNS
+        table = "frame_results"
+        order = SAMPLE_KEY + ["frame"]
+        if match_types:
+            conditions.append("match_type IN (%s)" % ", ".join("?" * len(match_types)))
+            params.extend(match_types)
+        ji_column = "jaccard_index_smartdoc"
+    else:
+        columns = SAMPLE_KEY + [col for (col, _type) in GLOBAL_COLUMNS]
+        table = "samples"
+        order = SAMPLE_KEY
+        ji_column = "mean_jaccard_index_smartdoc"
+    if max_ji is not None:
+        conditions.append("%s <= ?" % ji_column)
+        params.append(max_ji)
+    query = "SELECT %s FROM %s" % (", ".join(columns), table)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY " + ", ".join(order)
+    if limit is not None:
+        query += " LIMIT %d" % limit
+    return (query, params)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Detection of new or modified segmentation results in submission directories,
+for continuous evaluation (see `batch_eval.py --watch`).
+
+Changes are detected with inotify when the "pyinotify" package is available,
+by polling file modification times otherwise. In both cases, a file is only
+reported once its size and modification time have been stable for a while,
+so that files being uploaded are not evaluated before they are complete.
+'''
+
+# ==============================================================================
+# Imports
+import os
+import os.path
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.archive import SEGRESULT_EXT
+
+# ==============================================================================
+from utils.log import createLogger
+logger = createLogger(__name__)
+
+# ==============================================================================
+
+def fileSignature(path):
+    """(modification time, size) of `path`, None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+class SegResultWatcher(object):
+    """
+    Watches the directories `roots` for new or modified segmentation results.
+    Files existing when the watcher is created are not reported (unless they
+    are modified later). A file is reported by `poll()` once its signature
+    has not changed for `settle` seconds.
+    """
+    def __init__(self, roots, settle=2.0, interval=1.0, use_inotify=True):
+        self._roots = roots
+        self._settle = settle
+        self._interval = interval
+        self._pending = {} # path -> (signature, time of the last change)
+        self._notifier = None
+        if use_inotify and pyinotify is not None:
+            self._initInotify()
+        self._known = self._scan() # path -> signature of reported (or initial) files
+        logger.debug("Watching %d directories (%s), %d files found.",
+                     len(roots), self.backend, len(self._known))
+
+    @property
+    def backend(self):
+        return "inotify" if self._notifier is not None else "polling"
+
+    def _initInotify(self):
+        self._events = set() # paths of the files changed since the last poll
+        events = self._events
+        class Handler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                if event.pathname.endswith(SEGRESULT_EXT):
+                    events.add(event.pathname)
+        manager = pyinotify.WatchManager()
+        self._notifier = pyinotify.Notifier(manager, Handler(), timeout=int(self._interval * 1000))
+        mask = pyinotify.IN_CREATE | pyinotify.IN_MODIFY | pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+        for root in self._roots:
+            manager.add_watch(root, mask, rec=True, auto_add=True)
+
+    def _scan(self):
+        """dict path -> signature of all the segmentation results of `roots`."""
+        signatures = {}
+        for root in self._roots:
+            for (dirpath, _dirnames, filenames) in os.walk(root):
+                for filename in filenames:
+                    if filename.endswith(SEGRESULT_EXT):
+                        path = os.path.join(dirpath, filename)
+                        signature = fileSignature(path)
+                        if signature is not None:
+                            signatures[path] = signature
+        return signatures
+
+    def _changedPaths(self):
+        """Paths possibly changed since the last call, waiting up to `interval` seconds for changes."""
+        if self._notifier is None:
+            time.sleep(self._interval)
+            return [path for (path, signature) in self._scan().items() if self._known.get(path) != signature]
+        if self._notifier.check_events():
+            self._notifier.read_events()
+            self._notifier.process_events()
+        paths = list(self._events)
+        self._events.clear()
+        return paths
+
+    def poll(self):
+        """Sorted list of the new or modified files which are now stable."""
+        now = time.time()
+        for path in self._changedPaths():
+            signature = fileSignature(path)
+            if signature is None or signature == self._known.get(path):
+                continue
+            if self._pending.get(path, (None,))[0] != signature:
+                self._pending[path] = (signature, now)
+        ready = []
+        for (path, (signature, since)) in self._pending.items():
+            if now - since < self._settle:
+                continue
+            current = fileSignature(path)
+            if current != signature: # still being written (or removed)
+                if current is None:
+                    del self._pending[path]
+                else:
+                    self._pending[path] = (current, now)
+                continue
+            del self._pending[path]
+            self._known[path] = signature
+            ready.append(path)
+        return sorted(ready)
+
+    def close(self):
+        if self._notifier is not None:
+            self._notifier.stop()
+            self._notifier = None
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Validate the segmentation results of submissions (directories or tar / zip
+archives, see batch_eval.py) before evaluating them.
+
+For each "METHOD/BACKGROUND/DOCUMENT.segresult.xml" file, checks:
+- XML structure, attribute types and point names, with the RELAX NG schema
+  "models/segresult.rng" (compiled once per worker process);
+- that each accepted frame (or object) has its 4 corners, each one only once,
+  or an outline;
+- frame indices (if present): 1, 2, 3, etc. without gap;
+- frame count, against the ground truth "GT_ROOT/BACKGROUND/DOCUMENT.gt.xml"
+  (or in the ground truth index GT_ROOT, see build_gtindex.py).
+For each method found in submissions, documents of the ground truth without
+segmentation result are reported as missing. With "--shard I/N", only the
+results (and missing ones) of shard I are reported (see utils/shard.py).
+
+The report is made of JSON lines, one per segmentation result (or missing
+one), sorted by submission and file:
+    {"submission": "...", "file": "meth1/background01/paper004.segresult.xml",
+     "method": "meth1", "background": "background01", "document": "paper004",
+     "status": "ok"|"invalid"|"missing", "errors": ["...", ...]}
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import json
+import multiprocessing
+from collections import OrderedDict
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from utils.archive import mapSegResults, isArchive, SEGRESULT_EXT
+from utils.compression import openFile, resolvePath
+from utils.gtindex import GroundTruthIndex, findGroundTruthFiles, isIndexFile
+from utils.shard import inShard
+from utils.profiling import createProfiler
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Segmentation Result Validator"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+ERRCODE_INVALID = 12
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "segresult.rng")
+GT_EXT = ".gt.xml"
+CORNERS = set(["tl", "bl", "br", "tr"])
+MAX_ERRORS = 20 # per file
+
+
+# ==============================================================================
+def countFrames(path):
+    """Number of frames of a ground truth (or segmentation result) file, without building models."""
+    import lxml.etree as etree
+    count = 0
+    with openFile(path, "rb") as in_f:
+        for (_event, elem) in etree.iterparse(in_f, tag="frame"):
+            count += 1
+            elem.clear()
+    return count
+
+
+def checkShape(elem, label, errors):
+    """Check the corners (or outline) of a frame or object element."""
+    names = [pt.get("name") for pt in elem.iterfind("point")]
+    duplicates = sorted(set(n for n in names if names.count(n) > 1))
+    if duplicates:
+        errors.append("%s: duplicate corner(s) %s." % (label, ", ".join(duplicates)))
+    if elem.find("outline") is None and set(names) != CORNERS:
+        errors.append("%s: missing corner(s) %s." % (label, ", ".join(sorted(CORNERS - set(names)))))
+
+
+class SegResultValidator(object):
+    """Validation of submission items, in a worker process (see `mapSegResults`)."""
+    def __init__(self, gt_root):
+        import lxml.etree as etree
+        self._etree = etree
+        self._schema = etree.RelaxNG(etree.parse(SCHEMA_FILE))
+        self._gt_root = gt_root
+        self._index = GroundTruthIndex(gt_root) if isIndexFile(gt_root) else None
+        self._gt_counts = {} # gt path -> frame count (None if missing)
+
+    def gtFrameCount(self, background, document):
+        if self._index is not None:
+            if (background, document) not in self._index:
+                return None
+            return self._index.frameCount(background, document)
+        path = resolvePath(os.path.join(self._gt_root, background, document + GT_EXT))
+        if path not in self._gt_counts:
+            self._gt_counts[path] = countFrames(path) if os.path.isfile(path) else None
+        return self._gt_counts[path]
+
+    def validate(self, item):
+        """SubmissionItem ---> list of error messages (empty if valid)."""
+        etree = self._etree
+        try:
+            root = etree.fromstring(item.data)
+        except etree.XMLSyntaxError, e:
+            return ["Not a well-formed XML file: %s" % e]
+        if not self._schema.validate(root):
+            return ["line %d: %s" % (err.line, err.message) for err in self._schema.error_log]
+
+        errors = []
+        frames = root.find("segmentation_results").findall("frame")
+        for (pos, frame) in enumerate(frames):
+            label = "frame #%d" % (pos + 1)
+            index = frame.get("index")
+            if index is not None and int(index) != pos + 1:
+                errors.append("%s: index is %s, expected %d." % (label, index, pos + 1))
+            if frame.get("rejected") in ("true", "1"):
+                continue
+            objects = frame.findall("object")
+            if not objects:
+                checkShape(frame, label, errors)
+            for (k, obj) in enumerate(objects):
+                checkShape(obj, "%s, object %s" % (label, obj.get("name", k + 1)), errors)
+
+        gt_count = self.gtFrameCount(item.background, item.document)
+        if gt_count is None:
+            errors.append("No ground truth for '%s/%s'." % (item.background, item.document))
+        elif gt_count != len(frames):
+            errors.append("%d frames, but ground truth has %d frames." % (len(frames), gt_count))
+        return errors
+
+    @staticmethod
+    def newReport(submission, item, errors):
+        report = OrderedDict([
+            ("submission", submission),
+            ("file", item.name),
+            ("method", item.method),
+            ("background", item.background),
+            ("document", item.document)])
+        report["status"] = "invalid" if errors else "ok"
+        report["errors"] = errors
+        return report
+
+    @staticmethod
+    def failed(submission, item, error):
+        """Report of a failed validation (see `mapSegResults`)."""
+        return SegResultValidator.newReport(submission, item, ["Validation failed: %s" % error])
+
+    def __call__(self, submission, item):
+        try:
+            errors = self.validate(item)
+        except Exception, e:
+            logger.debug("Validation of '%s:%s' failed.", submission, item.name, exc_info=True)
+            errors = ["Validation failed: %s" % e]
+        if len(errors) > MAX_ERRORS:
+            errors = errors[:MAX_ERRORS] + ["(%d more errors)" % (len(errors) - MAX_ERRORS)]
+        return self.newReport(submission, item, errors)
+
+
+def expectedDocuments(gt_root):
+    """Set of (background, document) of the ground truth files (or index) `gt_root`."""
+    if isIndexFile(gt_root):
+        return set(GroundTruthIndex(gt_root).keys())
+    return set(findGroundTruthFiles(gt_root))
+
+
+def missingReports(seen, gt_root, shard=None):
+    """
+    Reports of the documents of `gt_root` without segmentation result, for each
+    method and submission (restricted to `shard` if set).
+    `seen` is the dict submission -> set of (method, background, document) of
+    all the segmentation results found (see `mapSegResults`).
+    """
+    expected = expectedDocuments(gt_root)
+    found = {} # (submission, method) -> set of (background, document)
+    for (submission, results) in seen.items():
+        for (method, background, document) in results:
+            found.setdefault((submission, method), set()).add((background, document))
+    missing = []
+    for ((submission, method), documents) in found.items():
+        for (background, document) in sorted(expected - documents):
+            if not inShard(method, background, document, shard):
+                continue
+            missing.append(OrderedDict([
+                ("submission", submission),
+                ("file", "%s/%s/%s%s" % (method, background, document, SEGRESULT_EXT)),
+                ("method", method),
+                ("background", background),
+                ("document", document),
+                ("status", "missing"),
+                ("errors", ["No segmentation result."])]))
+    return missing
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Validate the segmentation results of submissions (directories or tar/zip archives).',
+        version=PROG_VERSION)
+
+    parser.add_argument('gt_root',
+        action=StoreValidGroundTruthRoot,
+        help="Directory containing ground truth files (BACKGROUND/DOCUMENT.gt.xml), \
+              or ground truth index built by build_gtindex.py.")
+    parser.add_argument('submissions',
+        nargs='+', metavar='submission',
+        help="Directories or archives (.tar, .tar.gz, .tar.bz2, .zip) containing \
+              METHOD/BACKGROUND/DOCUMENT.segresult.xml files.")
+    addLoggingArguments(parser)
+    parser.add_argument('-o', '--output-file',
+        help="Path to the report (JSON lines). Standard output if not set.")
+    parser.add_argument('-j', '--jobs',
+        type=int, default=multiprocessing.cpu_count(),
+        help="Number of worker processes (1: validate in the main process).")
+    parser.add_argument('--shard', metavar="I/N",
+        action=StoreShard,
+        help="Only validate shard I out of N (1 <= I <= N), see batch_eval.py.")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    for submission in args.submissions:
+        if not os.path.isdir(submission) and not isArchive(submission):
+            parser.error("'%s' is neither a directory nor a tar or zip archive." % submission)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "validate_segresults", PROG_VERSION, args.memprofile)
+    profiler.info("submissions", len(args.submissions))
+
+    seen = {}
+    results = mapSegResults(args.submissions, SegResultValidator, (args.gt_root,), args.jobs, profiler,
+                            args.shard, seen)
+    reports = [report for (_submission, report) in results]
+    reports.extend(missingReports(seen, args.gt_root, args.shard))
+    reports.sort(key=lambda report: (report["submission"], report["file"]))
+    logger.debug("--- Process complete. ---")
+
+    out_f = sys.stdout
+    if args.output_file is not None:
+        out_f = open(args.output_file, "wb")
+    try:
+        for report in reports:
+            out_f.write(json.dumps(report) + "\n")
+    finally:
+        if out_f is not sys.stdout:
+            out_f.close()
+
+    counts = OrderedDict((status, 0) for status in ["ok", "invalid", "missing"])
+    for report in reports:
+        counts[report["status"]] += 1
+        if report["status"] != "ok":
+            logger.warning("%s:%s: %s", report["submission"], report["file"], " ".join(report["errors"][:1]))
+    for (status, count) in counts.items():
+        profiler.count(status, count)
+    logger.info("%d valid, %d invalid and %d missing segmentation results.",
+                counts["ok"], counts["invalid"], counts["missing"])
+    if not results:
+        logger.error("No segmentation result found in submissions.")
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    if not results:
+        return ERRCODE_NOFILE
+    return ERRCODE_INVALID if counts["invalid"] or counts["missing"] else ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())
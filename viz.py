@@ -5,13 +5,14 @@ Visualization tool for segmentation files and videos.
 
 Given a ground-truth file or a segmentation result and a video, allows to 
 navigate threw the video with segmentation overlaid.
+Keys: 'f'/'n' next frame, 'b'/'d' previous frame, 'p'/space play/pause, 'q' quit.
+Clicking on the thumbnail strip seeks to the corresponding frame.
 
 Future work:
 - auto discover sample from 'source_sample_file' (+ datasetroot)
 - (make video an option, and keep minimalist control)
 - allow manual editing
 - allow manual inpainting
-- play/pause
 - better UI
 - application framework (resource management, main loop abstracted, etc.)
 - turn into a command
@@ -24,7 +25,12 @@ import argparse
 import os
 import os.path
 import re
+import shlex
 import sys
+import tempfile
+import threading
+import Queue
+from collections import OrderedDict
 
 import cv2
 import numpy as np
@@ -33,7 +39,10 @@ import numpy as np
 # mobileSeg Tools suite imports
 from utils.args import *
 from utils.log import initLogger
-from utils.io import VideoSeeker
+from utils.io import VideoSeeker, VideoProxy, FrameSequenceFromVideo
+from utils.compression import resolvePath
+from utils.profiling import createProfiler
+from utils.geometry import outlineCoords
 
 from models.models import *
 
@@ -41,6 +50,7 @@ from models.models import *
 logger = logging.getLogger(__name__)
 
 # ==============================================================================
+PROG_VERSION = "0.1"
 
 EXITCODE_OK = 0
 EXITCODE_UNKERR = 254
@@ -70,43 +80,88 @@ def paths_to_labels(files):
         tails = [os.path.join(nt, t) for nt, t in zip(newtails, tails)]
     return tails
 
+def loadSegmentationFiles(videofile, segfiles):
+    """
+    Load ground-truth or segmentation result files to overlay on `videofile`.
+    Returns two ordered dicts indexed by display label: the loaded models, 
+    and their list of frame results.
+    """
+    datamdl = OrderedDict()
+    segres = OrderedDict()
+    labels = paths_to_labels(segfiles)
+    logger.debug("labels: %r" % (labels, ))
+    for k, segfile in zip(labels, segfiles):
+        # Subclass of SegResult with segmentation_results in both cases
+        try:
+            datamdl[k] = GroundTruth.loadFromFile(segfile)
+        except:
+            try:
+                datamdl[k] = SegResult.loadFromFile(segfile)
+            except:
+                err = "Cannot load '%s', format not supported." % segfile
+                logger.error(err)
+                raise Exception(err)
+
+        src = datamdl[k].source_sample_file
+        if os.path.splitext(os.path.basename(src))[0] != os.path.splitext(os.path.basename(videofile))[0]:
+            logger.warning("Video file '%s' does not seem to be the sample file '%s' was created from." 
+                                %(videofile, segfile))
+            logger.warning("\texpected sample file is: '%s'" % src)
+
+        segres[k] = datamdl[k].segmentation_results
+    return datamdl, segres
+
+
+def overlaySegmentation(frame, frame_id, segres, scale=1.0):
+    """
+    Draw, in place, the segmentation results `segres` (dict label -> frame 
+    results) for the frame `frame_id` (starting at 0) over the image `frame`.
+    `scale` is the size ratio between `frame` and the original video frames.
+    """
+    iC = 0
+    for k in segres:
+        fres = segres[k][frame_id]
+        if (fres.index - 1) != frame_id: # fres ids start at 1
+            logger.warning("Video @f%04d out of sync with seg @f%04d" % (fres.index, frame_id))
+
+        cv2.putText(frame,k,(10,50+iC*50), cv2.FONT_HERSHEY_SIMPLEX, 1, colors[iC],2,cv2.LINE_AA)
+        if fres.rejected:
+            # Simply draw circle
+            (frame_height, frame_width, _depth) = frame.shape
+            cv2.circle(frame, (frame_width/2+(iC*20), frame_height/2), 20, colors[iC], 10)
+        else:
+            # Draw polygon (outline with any number of vertices, or corners)
+            object_shape = outlineCoords(fres).reshape(-1, 2)
+            cv2.polylines(frame, [np.int32(object_shape * scale)], True, colors[iC], 2)
+        iC = min(iC + 1, len(colors) - 1)
+
+
 class VizController(object):
+    """
+    Interactive viewer.
+
+    Scrubbing and playback display frames from a low resolution proxy of the 
+    video (see `VideoProxy`), which is also used whenever the displayed size 
+    does not exceed its resolution. Full resolution frames are only decoded 
+    when playback is paused and the seek position is settled.
+    """
     CACHE_STEP_SIZE = 10
+    IDLE_DELAY = 100 # ms between two checks of keyboard events when paused
 
-    def __init__(self, videofile, segfiles):
+    def __init__(self, videofile, segfiles, cache_dir=None, proxy_width=480, strip_step=25):
         self._seektrackbarname = "seek trackbar"
         self._ratiotrackbarname = "ratio trackbar"
         self._videofile = videofile
         self._segfiles = segfiles
         self._winname = "Viz - vid( %s ) seg( %s )" % (os.path.basename(videofile), os.path.basename(segfiles[0]))
+        self._stripwinname = "Viz - thumbnails( %s )" % os.path.basename(videofile)
 
         # Model
         self._seeker = VideoSeeker(videofile)
+        self._proxy = VideoProxy(videofile, cache_dir, proxy_width, strip_step)
+        self._play_delay = max(1, int(round(1000 / self._seeker.fps)))
 
-        self._segres = {}
-        self._datamdl = {} ## added to seeker
-            # Subclass of SegResult with segmentation_results in both cases
-        labels = paths_to_labels(self._segfiles)
-        print("labels: %r" % labels)
-        for i, segfile in enumerate(self._segfiles):
-            k = labels[i]
-            try:
-                self._datamdl[k] = GroundTruth.loadFromFile(segfile)
-            except:
-                try:
-                    self._datamdl[k] = SegResult.loadFromFile(segfile)
-                except:
-                    err = "Cannot load '%s', format not supported." % segfile
-                    logger.error(err)
-                    raise Exception(err)
-
-            src = self._datamdl[k].source_sample_file
-            if os.path.splitext(os.path.basename(src))[0] != os.path.splitext(os.path.basename(videofile))[0]:
-                logger.warning("Video file '%s' does not seem to be the sample file '%s' was created from." 
-                                    %(videofile, segfile))
-                logger.warning("\texpected sample file is: '%s'" % src)
-    
-            self._segres[k] = self._datamdl[k].segmentation_results
+        self._datamdl, self._segres = loadSegmentationFiles(videofile, segfiles) ## added to seeker
 
         # Views
         cv2.namedWindow(self._winname) # auto resize
@@ -114,7 +169,7 @@ class VizController(object):
                            self._winname,
                            0,
                            self._seeker.frame_count - 1,
-                           self._set_current_frameId)
+                           self._onSeekTrackbar)
 
         cv2.createTrackbar(self._ratiotrackbarname,
                            self._winname,
@@ -122,14 +177,21 @@ class VizController(object):
                            300, # = 300%
                            self._trackbar_ratio_to_ratio)
 
+        cv2.namedWindow(self._stripwinname)
+        cv2.setMouseCallback(self._stripwinname, self._onStripMouse)
+
         # Inner state
         self._finished = False
         self._ratio = 1.0
         self._refresh_required = True
         self._current_frameId = 0
+        self._playing = False
+        self._scrubbing = False # seek position not settled yet
+        self._fullres_displayed = False
 
     def release(self):
         # cv2.destroyAllWindows()
+        cv2.destroyWindow(self._stripwinname)
         cv2.destroyWindow(self._winname)
         self._seeker.release()
         self._seeker = None
@@ -169,42 +231,59 @@ class VizController(object):
     current_frameId = property(_get_current_frameId, _set_current_frameId)
 
 
+    def _useProxy(self):
+        display_width = int(self._seeker.frame_size[0] * self._ratio)
+        return (self._playing or self._scrubbing 
+                or display_width <= self._proxy.frame_size[0])
+
     def _displayCurrentFrame(self):
         while self._refresh_required:
             self._refresh_required = False
-            frame = self._getCurrentFrame()
-            self._overlaySegmentation(frame) ## added to seeker
+            display_size = tuple(map(lambda x: int(x * self._ratio), self._seeker.frame_size))
+            use_proxy = self._useProxy()
+            if use_proxy:
+                frame = self._proxy.getFrame(self.current_frameId) # already a copy
+            else:
+                frame = self._getCurrentFrame()
+            self._fullres_displayed = not use_proxy
 
-            ratio = self._ratio
             frame_scaled = None
-            if ratio == 1.0:
+            if (frame.shape[1], frame.shape[0]) != display_size:
+                frame_scaled = cv2.resize(frame, display_size)
+            elif use_proxy:
                 frame_scaled = frame
             else:
-                frame_scaled = cv2.resize(frame, tuple(map(lambda x: int(x * ratio), self._seeker.frame_size)))
+                frame_scaled = frame.copy() # do not draw over frames cached by the seeker
+            # Drawing after resizing keeps lines sharp and is cheaper
+            self._overlaySegmentation(frame_scaled, self._ratio)
 
             cv2.imshow(self._winname, frame_scaled)
+            self._displayStrip()
 
+    def _displayStrip(self):
+        strip = np.array(self._proxy.strip)
+        x = self._proxy.stripPosition(self.current_frameId)
+        cv2.line(strip, (x, 0), (x, strip.shape[0] - 1), colors[0], 2)
+        cv2.imshow(self._stripwinname, strip)
+
+
+    def _overlaySegmentation(self, frame, scale=1.0):
+        overlaySegmentation(frame, self.current_frameId, self._segres, scale)
 
-    def _overlaySegmentation(self, frame):
-        iC = 0
-        for k in self._segres:
-            fres = self._segres[k][self.current_frameId]
-            if (fres.index - 1) != self.current_frameId: # fres ids start at 1
-                logger.warning("Video @f%04d out of sync with seg @f%04d" % (fres.index, self.current_frameId))
-    
-            cv2.putText(frame,k,(10,50+iC*50), cv2.FONT_HERSHEY_SIMPLEX, 1, colors[iC],2,cv2.LINE_AA)
-            if fres.rejected:
-                # Simply draw circle
-                (frame_height, frame_width, _depth) = frame.shape
-                cv2.circle(frame, (frame_width/2+(iC*20), frame_height/2), 20, colors[iC], 10)
-            else:
-                # Draw polygon
-                object_shape = np.float32([[fres.points['tl'].x, fres.points['tl'].y],
-                                           [fres.points['bl'].x, fres.points['bl'].y],
-                                           [fres.points['br'].x, fres.points['br'].y],
-                                           [fres.points['tr'].x, fres.points['tr'].y]])
-                cv2.polylines(frame, [np.int32(object_shape)], True, colors[iC], 2)
-            iC = min(iC + 1, len(colors) - 1)
+
+    def _seekTo(self, frame_id):
+        """Seek requested by the user: display the proxy until the position settles."""
+        if frame_id != self.current_frameId:
+            self._scrubbing = True
+            self.current_frameId = frame_id
+
+    def _onSeekTrackbar(self, value):
+        self._seekTo(value)
+
+    def _onStripMouse(self, event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN or (event == cv2.EVENT_MOUSEMOVE and flags & cv2.EVENT_FLAG_LBUTTON):
+            self._seekTo(self._proxy.frameAtStripPosition(x))
+            cv2.setTrackbarPos(self._seektrackbarname, self._winname, self.current_frameId)
 
 
     def _onForward(self):
@@ -222,6 +301,11 @@ class VizController(object):
             cv2.setTrackbarPos(self._seektrackbarname, self._winname, self.current_frameId)
             self._refresh_required = True
 
+    def _onPlayPause(self):
+        self._playing = not self._playing
+        logger.debug("Play" if self._playing else "Pause")
+        self._refresh_required = True
+
     def _onQuit(self):
         logger.info("Quit requested.")
         self._finished = True
@@ -238,8 +322,17 @@ class VizController(object):
                 iterWithoutRepaintCount = 0
 
             # Keybard event active wait
-            key = cv2.waitKey(100)
+            key = cv2.waitKey(self._play_delay if self._playing else self.IDLE_DELAY)
             if key == -1:
+                if self._playing:
+                    if self.current_frameId < self._seeker.frame_count - 1:
+                        self._onForward()
+                    else:
+                        self._onPlayPause()
+                elif self._scrubbing:
+                    # Seek position settled: decode full resolution if needed
+                    self._scrubbing = False
+                    self._refresh_required = not self._useProxy() and not self._fullres_displayed
                 iterWithoutRepaintCount += 1
                 if iterWithoutRepaintCount >= 50:
                     self._refresh_required = True
@@ -248,6 +341,8 @@ class VizController(object):
                 key &= 0xFF
                 if key == ord('q'):
                     self._onQuit()
+                elif key in [ord('p'), ord(' ')]:
+                    self._onPlayPause()
                 elif key in [ord('f'), ord('n')]:
                     self._onForward()
                 elif key in [ord('b'), ord('d')]:
@@ -259,29 +354,284 @@ class VizController(object):
         return EXITCODE_OK
 
 
+# ==============================================================================
+# ==============================================================================
+# Marks the end of the frame stream between pipeline stages.
+_END_OF_STREAM = object()
+
+class AnnotatedVideoExporter(object):
+    """
+    Headless counterpart of `VizController`: writes a video file with the 
+    segmentation overlaid on each frame of the input video.
+
+    Decoding, drawing and encoding run in separate threads connected by 
+    bounded queues, so OpenCV codec calls (which release the GIL) overlap 
+    with drawing. Queue sizes bound the number of frames in memory.
+    """
+    QUEUE_SIZE = 32
+    POLL_TIMEOUT = 0.1 # seconds, to check for abortion while blocked on a queue
+
+    def __init__(self, videofile, segfiles, outputfile, fourcc="mp4v", queue_size=QUEUE_SIZE):
+        self._videofile = videofile
+        self._segfiles = segfiles
+        self._outputfile = outputfile
+        self._fourcc = fourcc
+        self._decoded = Queue.Queue(maxsize=queue_size)
+        self._drawn = Queue.Queue(maxsize=queue_size)
+        self._abort = threading.Event()
+        self._errors = []
+        self._frames_written = 0
+
+        _datamdl, self._segres = loadSegmentationFiles(videofile, segfiles)
+
+    # Queue helpers: never block forever if another stage failed
+    def _put(self, queue, item):
+        while not self._abort.is_set():
+            try:
+                queue.put(item, timeout=self.POLL_TIMEOUT)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _get(self, queue):
+        while not self._abort.is_set():
+            try:
+                return queue.get(timeout=self.POLL_TIMEOUT)
+            except Queue.Empty:
+                pass
+        return _END_OF_STREAM
+
+    # Pipeline stages
+    def _decode(self, frames):
+        try:
+            for frame in frames:
+                if not self._put(self._decoded, frame):
+                    break
+        finally:
+            self._put(self._decoded, _END_OF_STREAM)
+
+    def _draw(self):
+        try:
+            while True:
+                frame = self._get(self._decoded)
+                if frame is _END_OF_STREAM:
+                    break
+                overlaySegmentation(frame.mat, frame.index - 1, self._segres) # frame ids start at 1
+                if not self._put(self._drawn, frame):
+                    break
+        finally:
+            self._put(self._drawn, _END_OF_STREAM)
+
+    def _encode(self, writer):
+        while True:
+            frame = self._get(self._drawn)
+            if frame is _END_OF_STREAM:
+                break
+            writer.write(frame.mat)
+            self._frames_written += 1
+
+    def _runStage(self, stage, *args):
+        try:
+            stage(*args)
+        except:
+            self._errors.append(sys.exc_info())
+            self._abort.set()
+
+    def run(self):
+        """Export the whole video. Returns the number of frames written."""
+        frames = FrameSequenceFromVideo(self._videofile)
+        writer = cv2.VideoWriter(self._outputfile, 
+                                 cv2.VideoWriter_fourcc(*self._fourcc), 
+                                 frames.fps, 
+                                 frames.frame_size)
+        if not writer.isOpened():
+            frames.release()
+            err = "Cannot open '%s' for writing with codec '%s'." % (self._outputfile, self._fourcc)
+            logger.error(err)
+            raise IOError(err)
+
+        logger.info("Exporting '%s' to '%s'.", self._videofile, self._outputfile)
+        stages = [threading.Thread(target=self._runStage, args=(self._decode, frames)),
+                  threading.Thread(target=self._runStage, args=(self._draw, )),
+                  threading.Thread(target=self._runStage, args=(self._encode, writer))]
+        try:
+            for t in stages:
+                t.daemon = True
+                t.start()
+            for t in stages:
+                t.join()
+        finally:
+            writer.release()
+            frames.release()
+
+        if self._errors:
+            exc_type, exc_value, exc_tb = self._errors[0]
+            logger.error("Export of '%s' failed: %s", self._videofile, exc_value)
+            raise exc_type, exc_value, exc_tb
+
+        logger.info("%d frames written to '%s'.", self._frames_written, self._outputfile)
+        return self._frames_written
+
+
+def read_export_tasks(task_file):
+    """
+    Parse a batch export file. Each non-empty line describes a task as:
+        INPUT_VIDEO OUTPUT_VIDEO SEG_FILE [SEG_FILE ...]
+    Paths containing spaces must be quoted. Lines starting with '#' are ignored.
+    SEG_FILE paths are resolved like on the command line (see `resolvePath`).
+    Raises ValueError for malformed lines and missing input files.
+    """
+    tasks = []
+    with open(task_file) as tf:
+        for lineno, line in enumerate(tf, 1):
+            try:
+                parts = shlex.split(line, comments=True)
+            except ValueError, e: # ex: unbalanced quotes
+                raise ValueError("%s:%d: %s." % (task_file, lineno, e))
+            if not parts:
+                continue
+            if len(parts) < 3:
+                raise ValueError("%s:%d: expected 'INPUT_VIDEO OUTPUT_VIDEO SEG_FILE...', got '%s'." 
+                                 % (task_file, lineno, line.rstrip("\n")))
+            segfiles = [resolvePath(path) for path in parts[2:]]
+            for path in [parts[0]] + segfiles:
+                if not os.path.isfile(path):
+                    raise ValueError("%s:%d: '%s' does not exist or is not a file." % (task_file, lineno, path))
+            tasks.append((parts[0], parts[1], segfiles))
+    return tasks
+
+
+def export_batch(tasks, fourcc, queue_size, jobs=1):
+    """
+    Run several exports, `jobs` of them at a time (each export uses its own 
+    3-thread pipeline). Returns the number of failed tasks.
+    """
+    pending = Queue.Queue()
+    for task in tasks:
+        pending.put(task)
+    failures = []
+
+    def worker():
+        while True:
+            try:
+                videofile, outputfile, segfiles = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                AnnotatedVideoExporter(videofile, segfiles, outputfile, fourcc, queue_size).run()
+            except Exception, e:
+                logger.error("Cannot export '%s': %s", videofile, e)
+                failures.append(videofile)
+
+    workers = [threading.Thread(target=worker) for _i in range(max(1, min(jobs, len(tasks))))]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return len(failures)
+
+
 # ==============================================================================
 # ==============================================================================
 def main(argv=None):
     # Option parsing
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-        description='Visualizer for segmentation result or ground-truth files.')
-
-    parser.add_argument('input_video', action=StoreValidFilePath)
-    parser.add_argument('seg_files', nargs='+', action=StoreValidFilePaths)
-
-
-    args = parser.parse_args()
+        description='Visualizer for segmentation result or ground-truth files.',
+        epilog="""With -e or -b, no window is opened and annotated videos are written instead.""")
+
+    parser.add_argument('input_video', nargs='?')
+    parser.add_argument('seg_files', nargs='*')
+    parser.add_argument('-e', '--export', metavar="OUTPUT_VIDEO",
+        help="Headless mode: write the annotated video to OUTPUT_VIDEO instead of displaying it.")
+    parser.add_argument('-b', '--export-batch', metavar="TASK_FILE",
+        action=StoreValidFilePath,
+        help="Headless mode: export every task listed in TASK_FILE, one per line: \
+              'INPUT_VIDEO OUTPUT_VIDEO SEG_FILE [SEG_FILE ...]'.")
+    parser.add_argument('-j', '--jobs', 
+        action=StoreIntZeroPositive, default=1,
+        help="Number of videos exported concurrently in batch mode (>= 1).")
+    parser.add_argument('--fourcc', default="mp4v",
+        help="FourCC code of the codec used for exported videos.")
+    parser.add_argument('--cache-dir', 
+        default=os.path.join(tempfile.gettempdir(), "smartdoc_viz_cache"),
+        help="Directory where low resolution proxies and thumbnail strips are cached.")
+    parser.add_argument('--proxy-width', 
+        action=StoreIntZeroPositive, default=480,
+        help="Width, in pixels, of the low resolution proxy used while scrubbing and playing.")
+    parser.add_argument('--strip-step', 
+        action=StoreIntZeroPositive, default=25,
+        help="Number of frames between two thumbnails of the strip.")
+    parser.add_argument('--queue-size', 
+        action=StoreIntZeroPositive, default=AnnotatedVideoExporter.QUEUE_SIZE,
+        help="Maximum number of frames (>= 1) waiting between two stages of the export pipeline.")
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    if args.proxy_width < 1:
+        parser.error("--proxy-width must be >= 1.")
+    if args.strip_step < 1:
+        parser.error("--strip-step must be >= 1.")
+    if args.queue_size < 1:
+        parser.error("--queue-size must be >= 1 (queues between export stages are bounded).")
+    if args.jobs < 1:
+        parser.error("--jobs must be >= 1.")
+
+    if args.export_batch is None:
+        if args.input_video is None or not args.seg_files:
+            parser.error("input_video and at least one seg_file are required.")
+        args.seg_files = [resolvePath(path) for path in args.seg_files]
+        for path in [args.input_video] + args.seg_files:
+            if not os.path.isfile(path):
+                parser.error("'%s' does not exist or is not a file." % path)
+    elif args.input_video is not None:
+        parser.error("input_video and seg_files cannot be used with --export-batch.")
+    else:
+        try:
+            args.export_tasks = read_export_tasks(args.export_batch)
+        except ValueError, e:
+            parser.error(str(e))
 
     # -----------------------------------------------------------------------------
     initLogger(logger, debug=False)
     dumpArgs(args, logger)
+    profiler = createProfiler(args.profile, "viz", PROG_VERSION, args.memprofile)
+    try:
+        return run(args, profiler)
+    finally:
+        if args.profile is not None:
+            profiler.write(args.profile)
+
+
+def run(args, profiler):
+    # --------------------------------------------------------------------------
+    # Headless export
+    if args.export_batch is not None:
+        tasks = args.export_tasks
+        with profiler.stage("export"):
+            failures = export_batch(tasks, args.fourcc, args.queue_size, args.jobs)
+        profiler.count("videos", len(tasks))
+        profiler.count("failed", failures)
+        logger.info("%d/%d videos exported.", len(tasks) - failures, len(tasks))
+        return EXITCODE_OK if failures == 0 else EXITCODE_UNKERR
+
+    if args.export is not None:
+        with profiler.stage("load"):
+            exporter = AnnotatedVideoExporter(args.input_video, args.seg_files, args.export, 
+                                              args.fourcc, args.queue_size)
+        with profiler.stage("export"):
+            profiler.count("frames", exporter.run())
+        return EXITCODE_OK
 
     # --------------------------------------------------------------------------
     # Prepare process
     logger.debug("Starting up")
 
-    app = VizController(args.input_video, args.seg_files)
+    with profiler.stage("load"):
+        app = VizController(args.input_video, args.seg_files, 
+                            args.cache_dir, args.proxy_width, args.strip_step)
 
     # Let's test video processing
     # --------------------------------------------------------------------------
@@ -289,7 +639,8 @@ def main(argv=None):
     # --------------------------------------------------------------------------
     ret = EXITCODE_UNKERR
     try:
-        ret = app.main_loop()
+        with profiler.stage("main_loop"):
+            ret = app.main_loop()
     finally:
         app.release()
 
@@ -302,6 +653,6 @@ def main(argv=None):
 # ==============================================================================
 # ==============================================================================
 if __name__ == "__main__":
-    ret = main(sys.argv)
+    ret = main()
     if ret is not None:
         sys.exit(ret)
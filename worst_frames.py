@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Report of the K frames with the lowest Jaccard index over a whole evaluation
+(all methods, backgrounds and documents), with thumbnails.
+
+Frames are read from evaluation trees ("EVAL_DIR/METHOD/BACKGROUND/
+DOCUMENT.segeval.xml", compact or not), one file at a time, and only the K
+worst ones are kept (bounded heap), or queried from a results warehouse (see
+`ingest_results.py`). Ties are broken by method, background, document and
+frame, so the selection does not depend on the order of files.
+
+With "--video-root" (videos at "VIDEO_ROOT/BACKGROUND/DOCUMENT.mp4"), a
+thumbnail is extracted for each selected frame, with the ground truth
+("--gt-root") and test ("--submissions") quadrilaterals overlaid. Selected
+frames are grouped by video and sorted by frame index, so that each video is
+decoded once, sequentially, up to its last selected frame (frames in between
+are skipped without being converted, no seek); videos are processed
+concurrently ("-j").
+
+Outputs, in OUTPUT_DIR: "worst_frames.csv" (tab-separated) and "index.html",
+and thumbnails in "thumbs/METHOD/BACKGROUND/DOCUMENT-FRAME.jpg".
+'''
+
+# ==============================================================================
+# Imports
+import logging
+import argparse
+import os
+import os.path
+import sys
+import cgi
+import heapq
+import threading
+import Queue
+from collections import namedtuple, OrderedDict
+
+# ==============================================================================
+# SegEval Tools suite imports
+from utils.args import *
+from utils.log import *
+from models.models import *
+from utils.compact import MATCH_TYPES
+from utils.warehouse import isWarehouse, openWarehouse
+from utils.archive import iterSegResults
+from utils.profiling import createProfiler
+from utils.evaltree import findEvalFiles
+
+# ==============================================================================
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Constants
+PROG_VERSION = "0.1"
+PROG_NAME = "Worst Frames Report"
+
+ERRCODE_OK = 0
+ERRCODE_NOFILE = 10
+ERRCODE_EVALFAILED = 11
+
+CSV_FILE = "worst_frames.csv"
+HTML_FILE = "index.html"
+THUMBS_DIR = "thumbs"
+
+""" A selected frame (frame indices start at 1). """
+WorstFrame = namedtuple("WorstFrame", ["ji", "method", "background", "document", "frame", "match_type"])
+
+
+# ==============================================================================
+def iterEvalTreeFrames(eval_dir, match_types=None):
+    """Generates a WorstFrame for each frame (of `match_types`, if set) of the evaluation results of `eval_dir`."""
+    from utils.warehouse import readEvalFile
+    for ((method, background, document), eval_file) in findEvalFiles(eval_dir):
+        (_results, frames) = readEvalFile(eval_file)
+        for frame in frames:
+            (index, match_type, ji) = (frame[0], frame[1], frame[4])
+            if match_types is None or match_type in match_types:
+                yield WorstFrame(ji, method, background, document, index, match_type)
+
+
+def queryWorstFrames(database, count, match_types=None):
+    """The `count` worst frames (of `match_types`, if set) of a results warehouse."""
+    query = """SELECT jaccard_index_smartdoc, method, background, document, frame, match_type
+        FROM frame_results"""
+    params = []
+    if match_types:
+        query += " WHERE match_type IN (%s)" % ", ".join("?" * len(match_types))
+        params.extend(match_types)
+    query += " ORDER BY jaccard_index_smartdoc, method, background, document, frame LIMIT %d" % count
+    conn = openWarehouse(database)
+    try:
+        return [WorstFrame(*row) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+
+def selectWorstFrames(sources, count, match_types=None):
+    """Sorted list of the `count` worst frames of `sources` (evaluation directories or warehouses)."""
+    candidates = []
+    for source in sources:
+        if os.path.isdir(source):
+            # bounded heap: only `count` frames of each source are kept
+            candidates.extend(heapq.nsmallest(count, iterEvalTreeFrames(source, match_types)))
+        else:
+            candidates.extend(queryWorstFrames(source, count, match_types))
+    return heapq.nsmallest(count, candidates)
+
+
+def thumbnailPath(frame):
+    return "/".join([THUMBS_DIR, frame.method, frame.background, "%s-%05d.jpg" % (frame.document, frame.frame)])
+
+
+# ==============================================================================
+# Thumbnails
+
+def loadOverlays(frames, gt_root, submissions):
+    """
+    dict (method, background, document) -> OrderedDict label -> frame results
+    (see `viz.overlaySegmentation`), with the ground truth (from `gt_root`, if
+    set) and the segmentation results (from `submissions`) of the samples of
+    `frames`.
+    """
+    samples = set((f.method, f.background, f.document) for f in frames)
+    gt_frames = {}
+    if gt_root is not None:
+        from eval_server import GroundTruthCache
+        cache = GroundTruthCache(gt_root, len(samples))
+        for (background, document) in sorted(set(key[1:] for key in samples)):
+            try:
+                gt_frames[(background, document)] = cache.get("%s/%s" % (background, document))[0].mdl.segmentation_results
+            except Exception, e:
+                logger.warning("No ground truth overlay for %s/%s: %s", background, document, e)
+    test_frames = {}
+    for submission in submissions:
+        for item in iterSegResults(submission):
+            key = (item.method, item.background, item.document)
+            if key in samples and key not in test_frames:
+                test_frames[key] = SegResult.loadFromString(item.data).segmentation_results
+    overlays = {}
+    for key in sorted(samples):
+        overlay = overlays[key] = OrderedDict()
+        if key[1:] in gt_frames:
+            overlay["GT"] = gt_frames[key[1:]]
+        if key in test_frames:
+            overlay[key[0]] = test_frames[key]
+        elif submissions:
+            logger.warning("No segmentation result overlay for %s.", "/".join(key))
+    return overlays
+
+
+def videoTasks(frames, video_root, video_ext):
+    """
+    dict video file -> sorted list of (frame index, [WorstFrame, ...]): the
+    selected frames grouped by video (all methods), in decoding order.
+    """
+    by_video = {}
+    for frame in frames:
+        video = os.path.join(video_root, frame.background, frame.document + video_ext)
+        by_video.setdefault(video, {}).setdefault(frame.frame, []).append(frame)
+    return OrderedDict((video, sorted(by_index.items())) for (video, by_index) in sorted(by_video.items()))
+
+
+def extractThumbnails(video, selected, overlays, out_dir, width):
+    """
+    Decode `video` sequentially up to its last selected frame, and write the
+    thumbnails of the `selected` frames (see `videoTasks`), with `overlays`.
+    Returns the list of (WorstFrame, thumbnail path relative to `out_dir`)
+    of the thumbnails written.
+    """
+    import cv2
+    from utils.io import FrameSequenceFromVideo
+    from viz import overlaySegmentation
+    frames = FrameSequenceFromVideo(video)
+    written = []
+    try:
+        position = 0 # index of the last decoded frame (starting at 1)
+        for (index, worst_frames) in selected:
+            frames.skip(index - position - 1)
+            try:
+                data = frames.next()
+            except StopIteration:
+                logger.warning("'%s' has no frame %d.", video, index)
+                break
+            position = data.index
+            scale = min(1.0, float(width) / data.mat.shape[1])
+            for frame in worst_frames:
+                mat = data.mat.copy()
+                overlay = overlays.get((frame.method, frame.background, frame.document))
+                if overlay:
+                    overlaySegmentation(mat, index - 1, overlay)
+                if scale < 1.0:
+                    mat = cv2.resize(mat, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                thumbnail = thumbnailPath(frame)
+                path = os.path.join(out_dir, thumbnail)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                if cv2.imwrite(path, mat):
+                    written.append((frame, thumbnail))
+                else:
+                    logger.warning("Cannot write thumbnail '%s'.", path)
+    finally:
+        frames.release()
+    return written
+
+
+def extractAllThumbnails(tasks, overlays, out_dir, width, jobs=1):
+    """
+    Run `extractThumbnails` for each video of `tasks`, `jobs` videos at a time
+    (decoding releases the GIL). Returns (dict WorstFrame -> thumbnail path,
+    relative to `out_dir`, of the thumbnails written, failed videos).
+    Thumbnails of failed videos are not returned.
+    """
+    pending = Queue.Queue()
+    for task in tasks.items():
+        pending.put(task)
+    results = []
+    failures = []
+
+    def worker():
+        while True:
+            try:
+                (video, selected) = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results.append(extractThumbnails(video, selected, overlays, out_dir, width))
+            except Exception, e:
+                logger.error("Cannot extract thumbnails from '%s': %s", video, e)
+                failures.append(video)
+
+    workers = [threading.Thread(target=worker) for _i in range(max(1, min(jobs, len(tasks))))]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return dict(item for written in results for item in written), failures
+
+
+# ==============================================================================
+# Reports
+
+def writeCsv(path, frames, thumbnails):
+    from evalsum_to_csv import createCsvWriter
+    with open(path, "wb") as ofile:
+        csv_writer = createCsvWriter(ofile)
+        csv_writer.writerow(["rank", "method", "background", "document", "frame", "match_type", "ji", "thumbnail"])
+        for (rank, frame) in enumerate(frames, 1):
+            csv_writer.writerow([rank, frame.method, frame.background, frame.document, frame.frame,
+                                 frame.match_type, frame.ji, thumbnails.get(frame, "")])
+
+
+def writeHtml(path, frames, thumbnails):
+    rows = []
+    for (rank, frame) in enumerate(frames, 1):
+        thumb = thumbnails.get(frame)
+        cells = [str(rank)] + [cgi.escape(str(v)) for v in
+                               (frame.method, frame.background, frame.document, frame.frame, frame.match_type)]
+        cells.append("%.6f" % frame.ji)
+        cells.append('<a href="%s"><img src="%s"/></a>' % (cgi.escape(thumb, True), cgi.escape(thumb, True))
+                     if thumb is not None else "")
+        rows.append("<tr>%s</tr>" % "".join("<td>%s</td>" % c for c in cells))
+    with open(path, "wb") as ofile:
+        ofile.write("""<!DOCTYPE html>
+<html><head><meta charset="utf-8"/><title>%(title)s</title>
+<style>table { border-collapse: collapse; } td, th { border: 1px solid #ccc; padding: 2px 6px; }</style>
+</head><body>
+<h1>%(title)s</h1>
+<table>
+<tr><th>rank</th><th>method</th><th>background</th><th>document</th><th>frame</th><th>match type</th><th>ji</th><th>thumbnail</th></tr>
+%(rows)s
+</table>
+</body></html>
+""" % {"title": "%d worst frames" % len(frames), "rows": "\n".join(rows)})
+
+
+# ==============================================================================
+def main(argv=None):
+    # -----------------------------------------------------------------------------
+    # Parser definition
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description='Report the frames with the lowest Jaccard index, with thumbnails.',
+        version=PROG_VERSION)
+
+    parser.add_argument('sources',
+        nargs='+', metavar='source',
+        help="Evaluation directories (METHOD/BACKGROUND/DOCUMENT.segeval.xml) \
+              or results warehouses (see ingest_results.py).")
+    parser.add_argument('-o', '--output-dir',
+        action=StoreExistingOrCreatableDir, required=True,
+        help="Directory where the report (CSV, HTML and thumbnails) is written.")
+    parser.add_argument('-k', '--count',
+        action=StoreIntPositive, default=100,
+        help="Number of frames (>= 1) to report.")
+    parser.add_argument('--match-type',
+        nargs='+', choices=MATCH_TYPES,
+        help="Only consider frames of these match types.")
+    parser.add_argument('--video-root',
+        action=StoreValidDir,
+        help="Directory containing the videos (BACKGROUND/DOCUMENT.mp4); no thumbnail without it.")
+    parser.add_argument('--video-ext',
+        default=".mp4",
+        help="Extension of video files.")
+    parser.add_argument('-g', '--gt-root',
+        action=StoreValidGroundTruthRoot,
+        help="Ground truth directory (BACKGROUND/DOCUMENT.gt.xml) or index, to overlay ground truth.")
+    parser.add_argument('-s', '--submissions',
+        nargs='+', default=[],
+        help="Submissions (directories or archives), to overlay segmentation results.")
+    parser.add_argument('--thumb-width',
+        action=StoreIntPositive, default=480,
+        help="Maximum width of thumbnails, in pixels (>= 1).")
+    parser.add_argument('-j', '--jobs',
+        action=StoreIntPositive, default=4,
+        help="Number of videos decoded concurrently (>= 1).")
+    addLoggingArguments(parser)
+    addProfileArgument(parser)
+
+    args = parser.parse_args(argv)
+    checkProfileArguments(parser, args)
+    for source in args.sources:
+        if not os.path.isdir(source) and not (os.path.isfile(source) and isWarehouse(source)):
+            parser.error("'%s' is neither a directory nor a results warehouse." % source)
+    for submission in args.submissions:
+        if not os.path.exists(submission):
+            parser.error("'%s' does not exist." % submission)
+
+    # -----------------------------------------------------------------------------
+    # Logger activation
+    initLoggingFromArgs(logger, args)
+
+    # -----------------------------------------------------------------------------
+    # Output log header
+    programHeader(logger, PROG_NAME, PROG_VERSION)
+    logger.debug(DBGSEP)
+    dumpArgs(args, logger)
+    logger.debug(DBGSEP)
+
+    # --------------------------------------------------------------------------
+    logger.debug("--- Process started. ---")
+    profiler = createProfiler(args.profile, "worst_frames", PROG_VERSION, args.memprofile)
+
+    with profiler.stage("select"):
+        frames = selectWorstFrames(args.sources, args.count, args.match_type)
+    profiler.count("selected", len(frames))
+    if not frames:
+        logger.error("No frame found.")
+        return ERRCODE_NOFILE
+
+    thumbnails = {} # WorstFrame -> thumbnail path, relative to the output directory
+    failures = []
+    if args.video_root is not None:
+        with profiler.stage("overlays"):
+            overlays = loadOverlays(frames, args.gt_root, args.submissions)
+        tasks = videoTasks(frames, args.video_root, args.video_ext)
+        missing = [video for video in tasks if not os.path.isfile(video)]
+        for video in missing:
+            logger.warning("Video '%s' not found: no thumbnail for its frames.", video)
+            del tasks[video]
+        with profiler.stage("thumbnails"):
+            (thumbnails, failures) = extractAllThumbnails(tasks, overlays, args.output_dir,
+                                                          args.thumb_width, args.jobs)
+        profiler.count("videos", len(tasks))
+        profiler.count("thumbnails", len(thumbnails))
+
+    with profiler.stage("export"):
+        writeCsv(os.path.join(args.output_dir, CSV_FILE), frames, thumbnails)
+        writeHtml(os.path.join(args.output_dir, HTML_FILE), frames, thumbnails)
+    logger.debug("--- Process complete. ---")
+    logger.info("%d worst frames (ji from %f to %f), %d thumbnails, report written to '%s'.",
+                len(frames), frames[0].ji, frames[-1].ji, len(thumbnails),
+                os.path.join(args.output_dir, HTML_FILE))
+
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+    logger.debug("Clean exit.")
+    logger.debug(DBGSEP)
+    return ERRCODE_EVALFAILED if failures else ERRCODE_OK
+    # --------------------------------------------------------------------------
+
+
+if __name__ == "__main__":
+    sys.exit(main())